@@ -1,8 +1,18 @@
+import copy
+import hashlib
+import json
+import logging
 import os
+import stat
+import threading
+from typing import Any
 
 import yaml
 from bioblend import galaxy
 
+# The libyaml based loader is much faster, but only available if PyYAML was built with libyaml
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 __version__ = "0.10.12.dev0"
 
 PROJECT_NAME = "ephemeris"
@@ -12,6 +22,8 @@ PROJECT_AUTHOR = "Galaxy Project and Community"
 PROJECT_EMAIL = "jmchilton@gmail.com"
 RAW_CONTENT_URL = f"https://raw.github.com/{PROJECT_USERAME}/{PROJECT_NAME}/master/"
 
+log = logging.getLogger(__name__)
+
 
 def get_or_create_history(history_name: str, gi: galaxy.GalaxyInstance):
     histories = gi.histories.get_histories(name=history_name)
@@ -41,11 +53,20 @@ def get_galaxy_connection(args, file=None, log=None, login_required=True):
         file_content = dict()
 
     url = args.galaxy or file_content.get("galaxy_instance")
-    galaxy_url = check_url(url, log)
     api_key = args.api_key or file_content.get("api_key") or os.environ.get("EPHEMERIS_API_KEY")
+    return galaxy_connection(
+        url, api_key=api_key, user=args.user, password=args.password, log=log, login_required=login_required
+    )
+
 
-    if args.user and args.password:
-        return galaxy.GalaxyInstance(url=galaxy_url, email=args.user, password=args.password)
+def galaxy_connection(url, api_key=None, user=None, password=None, log=None, login_required=True):
+    """
+    Return a Galaxy connection to ``url``, given a user or an API key.
+    If both are missing raise ValueError, unless ``login_required`` is False.
+    """
+    galaxy_url = check_url(url, log)
+    if user and password:
+        return galaxy.GalaxyInstance(url=galaxy_url, email=user, password=password)
     elif api_key:
         return galaxy.GalaxyInstance(url=galaxy_url, key=api_key)
     elif not login_required:
@@ -54,13 +75,81 @@ def get_galaxy_connection(args, file=None, log=None, login_required=True):
         raise ValueError("Missing api key or user & password combination, in order to make a galaxy connection.")
 
 
-def load_yaml_file(filename):
+# Directory for an on-disk cache of parsed YAML files, disabled if not set
+YAML_CACHE_DIR_ENV = "EPHEMERIS_YAML_CACHE_DIR"
+
+# Parsed YAML files by absolute path, with the (mtime, size) of the file they were parsed from
+_yaml_files: dict[str, tuple[tuple[int, int], Any]] = {}
+_yaml_files_lock = threading.Lock()
+
+
+def load_yaml_file(filename, cache_dir=None):
     """
     Load YAML from the `tool_list_file` and return a dict with the content.
+
+    Files are parsed with the libyaml based loader if available, and only once per process
+    as long as they do not change. Each call returns a new copy of the content.
+    If ``cache_dir`` (or the directory in the ``EPHEMERIS_YAML_CACHE_DIR`` environment variable)
+    is given, the parsed content is also kept there as JSON, keyed by the modification time and
+    the hash of the file, and reused by later processes. Content that JSON can not represent
+    (e.g. dates) is not cached. The cache directory is trusted to contain the content of the files,
+    so it is not used if other users can write to it.
     """
-    with open(filename) as f:
-        dictionary = yaml.safe_load(f)
-    return dictionary
+    path = os.path.abspath(filename)
+    path_stat = os.stat(path)
+    file_stat = (path_stat.st_mtime_ns, path_stat.st_size)
+    with _yaml_files_lock:
+        cached = _yaml_files.get(path)
+    if cached is None or cached[0] != file_stat:
+        cache_dir = cache_dir or os.environ.get(YAML_CACHE_DIR_ENV)
+        content = _load_cached_yaml_file(path, file_stat, cache_dir) if cache_dir else _parse_yaml_file(path)
+        cached = (file_stat, content)
+        with _yaml_files_lock:
+            _yaml_files[path] = cached
+    return copy.deepcopy(cached[1])
+
+
+def _parse_yaml_file(path):
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def _load_cached_yaml_file(path, file_stat, cache_dir):
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    if os.stat(cache_dir).st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        log.warning("Not using YAML cache directory %s, it is writable by other users", cache_dir)
+        return _parse_yaml_file(path)
+    cache_path = os.path.join(cache_dir, hashlib.sha256(path.encode()).hexdigest() + ".json")
+    entry = None
+    try:
+        with open(cache_path) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if not isinstance(entry, dict) or "content" not in entry:
+        entry = None
+    if entry and tuple(entry["file_stat"]) == file_stat:
+        return entry["content"]
+    # The file was touched or replaced, it only needs to be parsed again if its content changed
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if not entry or entry["sha256"] != digest:
+        content = _parse_yaml_file(path)
+        try:
+            cacheable = json.loads(json.dumps(content)) == content
+        except (TypeError, ValueError):
+            cacheable = False
+        if not cacheable:
+            # e.g. dates or non-string keys, that would not be read back as parsed from YAML
+            return content
+        entry = {"sha256": digest, "content": content}
+    entry["file_stat"] = file_stat
+    # Write atomically, other processes may read the cache at the same time
+    temporary_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}"
+    with open(temporary_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(temporary_path, cache_path)
+    return entry["content"]
 
 
 def dump_to_yaml_file(content, file_name):
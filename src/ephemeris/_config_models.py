@@ -1,12 +1,13 @@
 from pathlib import Path
 
-import yaml
 from pydantic import (
     BaseModel,
     Extra,
     RootModel,
 )
 
+from . import load_yaml_file
+
 StrOrPath = Path | str
 
 
@@ -68,8 +69,7 @@ class Genomes(BaseModel):
 
 
 def _read_yaml(path: StrOrPath):
-    with open(path) as f:
-        return yaml.safe_load(f)
+    return load_yaml_file(path)
 
 
 def read_data_managers(path: StrOrPath) -> DataManagers:
@@ -1,8 +1,7 @@
 import os
 from pathlib import Path
 
-import yaml
-
+from . import load_yaml_file
 from ._config_models import (
     read_data_managers,
     read_genomes,
@@ -10,8 +9,7 @@ from ._config_models import (
 
 
 def read_yaml(path: Path):
-    with open(path) as f:
-        return yaml.safe_load(f)
+    return load_yaml_file(path)
 
 
 def lint_idc_directory(directory: Path):
@@ -24,7 +24,10 @@ from pydantic import (
     BaseModel,
 )
 
-from . import get_galaxy_connection
+from . import (
+    get_galaxy_connection,
+    load_yaml_file,
+)
 from ._idc_data_managers_to_tools import (
     DataManager,
     read_data_managers_configuration,
@@ -142,8 +145,7 @@ def write_run_data_manager_to_file(run_data_manager: RunDataManager, path: str):
 
 def walk_over_incomplete_runs(split_options: SplitOptions):
     data_managers = read_data_managers_configuration(split_options.data_managers_path)
-    with open(split_options.merged_genomes_path) as f:
-        genomes_all = yaml.safe_load(f)
+    genomes_all = load_yaml_file(split_options.merged_genomes_path)
     genomes = genomes_all["genomes"]
     for genome in genomes:
         build_id = genome["id"]
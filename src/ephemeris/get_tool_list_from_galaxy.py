@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Tool to extract a tool list from galaxy."""
 
+import threading
 from argparse import ArgumentParser
 
 import yaml
@@ -13,7 +14,7 @@ from .common_parser import (
     ArgumentDefaultsHideUnderscoresHelpFormatter,
     get_common_args,
 )
-from .shed_tools_methods import format_tool_shed_url
+from .shed_tools_methods import tool_shed_key
 
 
 def get_tool_panel(gi):
@@ -27,32 +28,64 @@ def get_tools(gi):
 
 
 def tools_for_repository(gi, repository, all_tools=False):
-    tool_shed_url = repository.get("tool_shed_url")
-    name = repository["name"]
-    owner = repository["owner"]
-    changeset_revision = repository.get("changeset_revision")
+    return ToolIndex(gi).tools_for_repository(repository, all_tools=all_tools)
 
-    tools = []
 
-    def handle_tool(tool_elem):
-        if not tool_elem.get("tool_shed_repository", None):
-            return
-        tsr = tool_elem["tool_shed_repository"]
-        if tsr["name"] != name or tsr["owner"] != owner:
-            return
-
-        if tool_shed_url and format_tool_shed_url(tsr["tool_shed"]) != format_tool_shed_url(tool_shed_url):
-            return
-
-        if changeset_revision and changeset_revision != tsr["changeset_revision"]:
-            return
-
-        tools.append(tool_elem)
-
-    elems = get_tools(gi) if changeset_revision or all_tools else get_tool_panel(gi)
-    walk_tools(elems, handle_tool)
+class ToolIndex:
+    """
+    Look up the tools of installed repositories.
+    The tools (or the tool panel) are fetched from Galaxy once, on first use, and indexed by
+    (tool shed, owner, name, changeset revision) for all later lookups.
+    """
 
-    return tools
+    def __init__(self, gi):
+        self.gi = gi
+        self._lock = threading.Lock()
+        self._indices: dict[bool, tuple[dict, dict]] = {}
+
+    def _index(self, panel: bool) -> tuple[dict, dict]:
+        with self._lock:
+            if panel not in self._indices:
+                by_revision: dict[tuple[str, str, str, str], list] = {}
+                by_repository: dict[tuple[str, str], list] = {}
+
+                def handle_tool(tool_elem):
+                    tsr = tool_elem.get("tool_shed_repository", None)
+                    if not tsr:
+                        return
+                    key = (tool_shed_key(tsr["tool_shed"]), tsr["owner"], tsr["name"], tsr["changeset_revision"])
+                    by_revision.setdefault(key, []).append(tool_elem)
+                    by_repository.setdefault((tsr["owner"], tsr["name"]), []).append(tool_elem)
+
+                walk_tools(get_tool_panel(self.gi) if panel else get_tools(self.gi), handle_tool)
+                self._indices[panel] = (by_revision, by_repository)
+            return self._indices[panel]
+
+    def tools_for_repository(self, repository, all_tools=False):
+        """
+        Return the tools of the ``changeset_revision`` of ``repository``, or of all its installed
+        revisions if it has none. For repositories without ``changeset_revision`` only the tools
+        in the tool panel are returned, unless ``all_tools`` is set.
+        """
+        tool_shed_url = repository.get("tool_shed_url")
+        name = repository["name"]
+        owner = repository["owner"]
+        changeset_revision = repository.get("changeset_revision")
+
+        by_revision, by_repository = self._index(panel=not (changeset_revision or all_tools))
+        if tool_shed_url and changeset_revision:
+            return list(by_revision.get((tool_shed_key(tool_shed_url), owner, name, changeset_revision), []))
+        return [
+            tool_elem
+            for tool_elem in by_repository.get((owner, name), [])
+            if (
+                not tool_shed_url
+                or tool_shed_key(tool_elem["tool_shed_repository"]["tool_shed"]) == tool_shed_key(tool_shed_url)
+            )
+            and (
+                not changeset_revision or tool_elem["tool_shed_repository"]["changeset_revision"] == changeset_revision
+            )
+        ]
 
 
 def walk_tools(tool_panel, f):
@@ -6,11 +6,13 @@ import logging as log
 import os
 import xml.etree.ElementTree as ET
 
-import yaml
 from bioblend import ConnectionError as ConnErr
 from bioblend.galaxy.tools import ToolClient
 
-from ephemeris import get_galaxy_connection
+from ephemeris import (
+    get_galaxy_connection,
+    load_yaml_file,
+)
 from ephemeris.common_parser import (
     get_common_args,
     HideUnderscoresHelpFormatter,
@@ -33,12 +35,34 @@ def _parser():
     return parser
 
 
-def _install(tool_client, tool_id):
+def unresolved_requirements(dependency_statuses):
+    """
+    Return the requirements that are not resolved in the dependency statuses returned by Galaxy
+    for ``install_dependencies``, as ``name`` or ``name/version``.
+    Galaxy reports requirements it could not install (e.g. failed conda installs) as resolved to
+    a ``NullDependency`` without ``dependency_type``.
+    """
+    if not isinstance(dependency_statuses, list):
+        return []
+    return [
+        "/".join(str(part) for part in (status.get("name"), status.get("version")) if part)
+        for status in dependency_statuses
+        if isinstance(status, dict)
+        and (status.get("model_class") == "NullDependency" or status.get("dependency_type") is None)
+    ]
+
+
+def install_tool_dependencies(tool_client, tool_id, log=log):
+    """
+    Install the resolver dependencies of ``tool_id``, and return the requirements Galaxy could not resolve.
+    A proxy timeout is only logged, Galaxy continues installing the dependencies in the background.
+    """
     try:
-        tool_client.install_dependencies(tool_id)
+        return unresolved_requirements(tool_client.install_dependencies(tool_id))
     except ConnErr as e:
         if e.status_code in timeout_codes:
             log.warning(e.body)
+            return []
         else:
             raise
 
@@ -83,24 +107,23 @@ def main(argv=None):
                                 tool_id,
                                 tool.get("file"),
                             )
-                            _install(tool_client, tool_id)
+                            install_tool_dependencies(tool_client, tool_id)
                 elif root.tag == "tool" and root.get("id"):
                     # Install from single tool file
                     log.info("Tool xml found. Installing %s dependencies", root.get("id"))
-                    _install(tool_client, root.get("id"))
+                    install_tool_dependencies(tool_client, root.get("id"))
             else:
                 log.info("YAML tool list found, parsing..")
-                with open(tool_conf_path) as fh:
-                    tool_ids = yaml.safe_load(fh)
+                tool_ids = load_yaml_file(tool_conf_path)
                 for tool_id in tool_ids:
                     # Install from yaml file
                     log.info("Installing %s dependencies..", tool_id)
-                    _install(tool_client, tool_id)
+                    install_tool_dependencies(tool_client, tool_id)
 
     if args.id:
         for tool_id in args.id:  # type: str
             log.info("Installing %s dependencies..", tool_id)
-            _install(tool_client, tool_id.strip())
+            install_tool_dependencies(tool_client, tool_id.strip())
 
 
 if __name__ == "__main__":
@@ -2,12 +2,23 @@
 A tool to automate installation of tool repositories from a Galaxy Tool Shed
 into an instance of Galaxy.
 
-Shed-tools has three commands: update, test and install.
+Shed-tools has seven commands: update, test, install, reconcile, lock, catalog and merge-test-reports.
 
 Update simply updates all the tools in a Galaxy given connection details on the command line.
 
+Reconcile keeps a Galaxy converged to a directory of tool lists, installing the
+repositories of changed tool lists at a regular interval.
+
 Test tests the specified tools in the Galaxy Instance.
 
+Merge-test-reports merges the test reports of ``shed-tools test --shard`` runs into one report.
+
+Lock pins all repositories of a tool list to exact revisions in a lockfile, which can be
+installed later without resolving revisions on the Tool Shed.
+
+Catalog maintains a local catalog of installable repository revisions, that install,
+update and lock can use instead of querying the Tool Shed.
+
 Install allows installation of tools in multiple ways.
 Galaxy instance details and the installed tools can be provided in one of three
 ways:
@@ -35,29 +46,47 @@ Galaxy's configuration directory and set Galaxy configuration option
 """
 
 import datetime as dt
+import functools
+import heapq
 import json
 import logging
 import os
 import re
 import sys
+import threading
 import time
+import zlib
 from collections import namedtuple
-from collections.abc import Iterable
+from collections.abc import (
+    Callable,
+    Iterable,
+    Iterator,
+    Sequence,
+)
 from concurrent.futures import (
+    as_completed,
+    FIRST_COMPLETED,
+    Future,
     thread,
     ThreadPoolExecutor,
+    wait,
 )
+from typing import Any
 
 import requests
 import yaml
 from bioblend.galaxy.client import ConnectionError
+from bioblend.galaxy.tools import ToolClient
 from bioblend.galaxy.toolshed import ToolShedClient
 from galaxy.tool_util.verify.interactor import (
     DictClientTestConfig,
     GalaxyInteractorApi,
     verify_tool,
 )
-from galaxy.util import unicodify
+from galaxy.util import (
+    asbool,
+    unicodify,
+)
 from typing_extensions import (
     NamedTuple,
     NotRequired,
@@ -65,8 +94,9 @@ from typing_extensions import (
 )
 
 from . import (
+    dump_to_yaml_file,
+    galaxy_connection,
     get_galaxy_connection,
-    load_yaml_file,
 )
 from .ephemeris_log import (
     disable_external_library_logging,
@@ -74,15 +104,62 @@ from .ephemeris_log import (
 )
 from .get_tool_list_from_galaxy import (
     GiToToolYaml,
-    the_same_repository,
-    tools_for_repository,
+    ToolIndex,
 )
+from .install_tool_deps import install_tool_dependencies
 from .shed_tools_args import parser
+from .shed_tools_catalog import (
+    sync_catalog,
+    ToolShedCatalog,
+)
+from .shed_tools_history import InstallHistory
+from .shed_tools_journal import (
+    InstallJournal,
+    journal_key,
+    RESOLVER_DEPENDENCIES_PENDING,
+)
+from .shed_tools_lock import (
+    INSTALL_DEFAULT_KEYS,
+    lock_repositories,
+    read_lock,
+)
 from .shed_tools_methods import (
-    complete_repo_information,
+    added_repositories,
+    complete_repository_revision,
+    configure_tool_shed_limits,
+    DEFAULT_TOOL_SHED_URL,
     flatten_repo_info,
+    flatten_repository_revisions,
+    get_repository_dependencies,
+    get_tool_shed_limiter,
+    RepositoryRevision,
+    tool_shed_key,
     VALID_KEYS,
 )
+from .shed_tools_plan import (
+    count_api_calls,
+    estimate_duration,
+    InstallPlan,
+    read_plan,
+    write_plan,
+)
+from .shed_tools_reconcile import ToolListReconciler
+from .shed_tools_targets import (
+    InstallTarget,
+    read_targets,
+    RevisionCache,
+)
+from .shed_tools_test_shards import (
+    assign_shards,
+    LongestTestsFirst,
+    merge_test_reports,
+    ReportedTestDurations,
+)
+from .shed_tools_test_store import (
+    definition_hash,
+    ToolTestStore,
+)
+from .shed_tools_tool_lists import load_tool_lists
 
 NON_TERMINAL_REPOSITORY_STATES = {
     "New",
@@ -93,6 +170,10 @@ NON_TERMINAL_REPOSITORY_STATES = {
     "Loading proprietary datatypes",
 }
 
+DEFAULT_RESOLUTION_WORKERS = 8
+DEFAULT_RESOLVER_DEPENDENCY_WORKERS = 4
+DEFAULT_TEST_DEFINITION_WORKERS = 8
+
 log = logging.getLogger(__name__)
 
 
@@ -118,12 +199,248 @@ class FilterResults(NamedTuple):
     not_installed_repos: list[InstallRepoDict]
 
 
+class ScheduledInstall(NamedTuple):
+    repository: InstallRepoDict
+    journal_key: str | None
+    expected_duration: float | None
+
+
 class InstallResults(NamedTuple):
     installed_repositories: list[InstallRepoDict]
     skipped_repositories: list[InstallRepoDict]
     errored_repositories: list[InstallRepoDict]
 
 
+class InstalledRepositories:
+    """
+    A snapshot of the repositories installed on a Galaxy instance.
+
+    The snapshot is fetched once per run and updated in place as installs finish, possibly from
+    several install threads. ``repositories`` is in tool list format, i.e. one entry per repository
+    and tool panel section with a list of ``revisions``. Lookups are indexed by
+    (tool shed, owner, name, revision).
+    """
+
+    def __init__(self, repositories: list[InstallRepoDict]):
+        self.repositories = repositories
+        self._lock = threading.Lock()
+        self._revisions: set[tuple[str | None, str, str, str | None]] = set()
+        for repository in repositories:
+            revisions = repository.get("revisions")
+            if not revisions:
+                self._index(repository, None)
+            for revision in revisions or []:
+                self._index(repository, revision)
+
+    def _index(self, repository: InstallRepoDict, revision: str | None):
+        # Also index with wildcards (None) for the tool shed and the revision, so that repositories
+        # without tool shed and lookups with check_revision=False are single set lookups.
+        tool_shed_url = repository.get("tool_shed_url")
+        owner = sys.intern(repository["owner"])
+        name = sys.intern(repository["name"])
+        for tool_shed in {sys.intern(tool_shed_key(tool_shed_url)) if tool_shed_url else None, None}:
+            for indexed_revision in {revision, None}:
+                self._revisions.add((tool_shed, owner, name, indexed_revision))
+
+    def is_installed(self, repository: InstallRepoDict, check_revision: bool = True) -> bool:
+        """Return True if any revision of ``repository``, or exactly its ``changeset_revision``, is installed."""
+        return self.contains(
+            repository.get("tool_shed_url"),
+            repository["owner"],
+            repository["name"],
+            repository.get("changeset_revision") if check_revision else None,
+        )
+
+    def contains(self, tool_shed_url: str | None, owner: str, name: str, revision: str | None) -> bool:
+        """Return True if ``revision`` (or any revision, if None) of the repository is installed."""
+        key = (tool_shed_key(tool_shed_url) if tool_shed_url else None, owner, name, revision)
+        with self._lock:
+            return key in self._revisions
+
+    def add(self, repository: InstallRepoDict):
+        """Record the installation of ``repository`` at its ``changeset_revision``."""
+        installed_repository: InstallRepoDict = dict(
+            name=repository["name"],
+            owner=repository["owner"],
+            tool_panel_section_id=repository.get("tool_panel_section_id"),
+            tool_panel_section_label=repository.get("tool_panel_section_label"),
+        )
+        if repository.get("tool_shed_url"):
+            installed_repository["tool_shed_url"] = repository["tool_shed_url"]
+        changeset_revision = repository.get("changeset_revision")
+        if changeset_revision:
+            installed_repository["revisions"] = [changeset_revision]
+        with self._lock:
+            self._index(repository, changeset_revision)
+            self.repositories.append(installed_repository)
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of concurrent installs with additive-increase/multiplicative-decrease.
+
+    The limit starts at ``minimum`` and grows by one per ``limit`` installs the server completes
+    without trouble, up to ``maximum``. It is multiplied by ``decrease`` when Galaxy (or a proxy in
+    front of it) fails with a 502 or 504 or drops the connection. Install times vary too much between
+    repositories to tell overload from large repositories, so latency is only taken into account for
+    installs with a known expected duration (see ``InstallHistory``): the limit is decreased as well when
+    the smoothed ratio of actual to expected install time rises above ``latency_tolerance`` times its
+    baseline. The baseline follows the lowest smoothed ratio, and rises again by ``baseline_decay``
+    of the difference per install, so that a single fast install can not pin it.
+    After a decrease, further decreases wait until ``limit`` more installs completed.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        decrease: float = 0.5,
+        latency_tolerance: float = 3.0,
+        smoothing: float = 0.3,
+        baseline_decay: float = 0.05,
+        log=log,
+    ) -> None:
+        self.maximum = max(maximum, 1)
+        self.minimum = min(max(minimum, 1), self.maximum)
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_decay = baseline_decay
+        self.log = log
+        self._limit = float(self.minimum)
+        self._latency: float | None = None
+        self._baseline_latency: float | None = None
+        self._cooldown = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def record_success(self, seconds: float, expected_seconds: float | None = None):
+        """
+        Record an install request that completed in ``seconds``, where ``expected_seconds`` is
+        the expected install time of the repository if it is known.
+        """
+        with self._lock:
+            rise = self._latency_rise(max(seconds / expected_seconds, 1e-3)) if expected_seconds else 1.0
+            if rise > self.latency_tolerance:
+                self._decrease(f"install latency rose to {rise:.1f} times its usual value")
+            else:
+                self._cooldown = max(self._cooldown - 1, 0)
+                self._limit = min(self._limit + 1 / self._limit, self.maximum)
+
+    def _latency_rise(self, latency: float) -> float:
+        """Smooth ``latency`` into the latency and its baseline, and return their ratio."""
+        smoothed = latency if self._latency is None else self._latency + self.smoothing * (latency - self._latency)
+        baseline = self._baseline_latency
+        if baseline is None or smoothed < baseline:
+            baseline = smoothed
+        else:
+            baseline += self.baseline_decay * (smoothed - baseline)
+        self._latency, self._baseline_latency = smoothed, baseline
+        return smoothed / baseline
+
+    def record_overload(self, reason: str):
+        """Record an install request that failed because Galaxy is overloaded."""
+        with self._lock:
+            self._decrease(reason)
+
+    def _decrease(self, reason: str):
+        if self._cooldown:
+            self._cooldown -= 1
+            return
+        self._limit = max(self._limit * self.decrease, self.minimum)
+        self._cooldown = self.limit
+        if self.log:
+            self.log.debug("Reducing concurrent installs to %d: %s", self.limit, reason)
+
+
+class RepositoryStatusPoller:
+    """
+    Tracks the installation status of repositories that are installing in the background.
+
+    A single thread fetches the status of all installed repositories once per tick and wakes
+    every waiting install whose repository reached a terminal state. The poll interval starts
+    at ``min_interval`` and grows by ``backoff`` up to ``max_interval`` while no tracked repository
+    changes state, and drops back to ``min_interval`` as soon as one does.
+    """
+
+    def __init__(self, tool_shed_client, min_interval=2.0, max_interval=60.0, backoff=1.5, log=log) -> None:
+        self.tool_shed_client = tool_shed_client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.log = log
+        self._lock = threading.Lock()
+        self._waiters: dict[str, list[threading.Event]] = {}
+        self._status: dict[str, str] = {}
+        self._thread: threading.Thread | None = None
+
+    def wait(self, repository_id, timeout) -> str | None:
+        """
+        Block until the repository with ``repository_id`` leaves the non-terminal states.
+        Return the status it reached, or None if ``timeout`` seconds passed before.
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(repository_id, []).append(event)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll, daemon=True)
+                self._thread.start()
+        event.wait(timeout)
+        with self._lock:
+            events = self._waiters.get(repository_id, [])
+            if event in events:
+                events.remove(event)
+                if not events:
+                    del self._waiters[repository_id]
+            status = self._status.get(repository_id)
+        if event.is_set():
+            return status
+        return None
+
+    def _poll(self):
+        try:
+            self._poll_until_done()
+        finally:
+            # Let the next wait() start a new thread, also if this one died
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def _poll_until_done(self):
+        interval = self.min_interval
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+            try:
+                repositories = self.tool_shed_client.get_repositories()
+            except Exception as e:
+                # e.g. dropped connections while Galaxy is overloaded, keep polling
+                if self.log:
+                    self.log.warning("Failed to get repositories list: %s", unicodify(e))
+                interval = min(interval * self.backoff, self.max_interval)
+                continue
+            changed = False
+            with self._lock:
+                for repository in repositories:
+                    repository_id = repository["id"]
+                    if repository_id not in self._waiters:
+                        continue
+                    status = repository["status"]
+                    if self._status.get(repository_id) != status:
+                        changed = True
+                        self._status[repository_id] = status
+                    if status not in NON_TERMINAL_REPOSITORY_STATES:
+                        for event in self._waiters.pop(repository_id):
+                            event.set()
+            interval = self.min_interval if changed else min(interval * self.backoff, self.max_interval)
+
+
 class InstallRepositoryManager:
     """Manages the installation of new repositories on a galaxy instance"""
 
@@ -131,65 +448,166 @@ class InstallRepositoryManager:
         """Initialize a new tool manager"""
         self.gi = galaxy_instance
         self.tool_shed_client = ToolShedClient(self.gi)
+        self.status_poller = RepositoryStatusPoller(self.tool_shed_client)
+        self._installed_snapshot: InstalledRepositories | None = None
+
+    def installed_snapshot(self, refresh: bool = False) -> InstalledRepositories:
+        """
+        Get the snapshot of installed repositories.
+        It is fetched from Galaxy on first use (or if ``refresh`` is set) and then reused for the whole run.
+        """
+        if self._installed_snapshot is None or refresh:
+            self._installed_snapshot = InstalledRepositories(
+                GiToToolYaml(
+                    gi=self.gi,
+                    skip_tool_panel_section_name=False,
+                    get_data_managers=True,
+                    get_all_tools=True,
+                ).tool_list.get("tools")
+            )
+        return self._installed_snapshot
+
+    def _update_installed_snapshot(self, repositories: Iterable[InstallRepoDict]):
+        """Add ``repositories`` to the snapshot of installed repositories, unless it has not been fetched yet."""
+        if self._installed_snapshot is not None:
+            for repository in repositories:
+                self._installed_snapshot.add(repository)
 
     def installed_repositories(self) -> list[InstallRepoDict]:
         """Get currently installed tools"""
-        return GiToToolYaml(
-            gi=self.gi,
-            skip_tool_panel_section_name=False,
-            get_data_managers=True,
-            get_all_tools=True,
-        ).tool_list.get("tools")
+        return list(self.installed_snapshot().repositories)
 
     def filter_installed_repos(self, repos: Iterable[InstallRepoDict], check_revision: bool = True) -> FilterResults:
         """This filters a list of repositories"""
         not_installed_repos: list[InstallRepoDict] = []
         already_installed_repos: list[InstallRepoDict] = []
-        if check_revision:
-            # If we want to check if revisions are equal, flatten the list,
-            # so each repository - revision combination has its own entry
-            installed_repos = flatten_repo_info(self.installed_repositories())
-        else:
-            # If we do not care about revision equality, do not do the flatten
-            # action to limit the number of comparisons.
-            installed_repos = self.installed_repositories()
-
-        installed_lookup: dict[tuple[str, str, str | None], list[InstallRepoDict]] = {}
-        for installed_repo in installed_repos:
-            name = installed_repo["name"]
-            owner = installed_repo["owner"]
-            revision = installed_repo.get("changeset_revision") if check_revision else None
-            key = (name, owner, revision)
-            installed_lookup.setdefault(key, []).append(installed_repo)
-
+        installed = self.installed_snapshot()
         for repo in repos:
-            name = repo["name"]
-            owner = repo["owner"]
-            revision = repo.get("changeset_revision") if check_revision else None
-            key = (name, owner, revision)
-
-            for installed_repo in installed_lookup.get(key, []):
-                if the_same_repository(repo, installed_repo):
-                    already_installed_repos.append(repo)
-                    break
-            else:  # This executes when the for loop completes and no match has been found.
+            if installed.is_installed(repo, check_revision=check_revision):
+                already_installed_repos.append(repo)
+            else:
                 not_installed_repos.append(repo)
         return FilterResults(
             already_installed_repos=already_installed_repos,
             not_installed_repos=not_installed_repos,
         )
 
+    @staticmethod
+    def _split_journaled(
+        repositories: list[RepositoryRevision],
+        journal: InstallJournal,
+        default_toolshed: str,
+        force_latest_revision: bool,
+        log=log,
+    ) -> tuple[list[InstallRepoDict], list[tuple[RepositoryRevision, str]], list[tuple[RepositoryRevision, str]]]:
+        """
+        Split ``repositories`` into the ones completed by an earlier run with the same ``journal``,
+        the ones resolved by an earlier run (at their journaled revision) and the unresolved ones.
+        Resolved and unresolved records are returned with their journal key.
+        """
+        completed_repos: list[InstallRepoDict] = []
+        resolved_repos: list[tuple[RepositoryRevision, str]] = []
+        unresolved_repos: list[tuple[RepositoryRevision, str]] = []
+        for repository in repositories:
+            key = journal_key(repository.to_dict(), default_toolshed, force_latest_revision)
+            if journal.is_completed(key):
+                if log:
+                    log.debug(
+                        "(%s/%s) repository %s completed in an earlier run. Skipping.",
+                        len(completed_repos) + 1,
+                        len(repositories),
+                        repository.name,
+                    )
+                completed_repos.append(journal.resolved.get(key) or repository.to_dict())
+            elif key in journal.resolved:
+                resolved_repos.append((RepositoryRevision.from_dict(journal.resolved[key]), key))
+            else:
+                unresolved_repos.append((repository, key))
+        return completed_repos, resolved_repos, unresolved_repos
+
+    def _installed_flags(self, repositories: list[RepositoryRevision]) -> list[bool]:
+        """``filter_installed_repos`` for ``RepositoryRevision`` records, return whether each record is installed."""
+        installed = self.installed_snapshot()
+        return [
+            installed.contains(
+                repository.tool_shed_url, repository.owner, repository.name, repository.changeset_revision
+            )
+            for repository in repositories
+        ]
+
+    @staticmethod
+    def _resolve_repository_revisions(
+        repositories: list[RepositoryRevision],
+        resolution_workers: int = DEFAULT_RESOLUTION_WORKERS,
+        log=log,
+        **complete_kwargs,
+    ) -> Iterator[tuple[RepositoryRevision, RepositoryRevision | None]]:
+        """
+        Complete ``repositories`` with ``complete_repository_revision`` by up to ``resolution_workers``
+        concurrent requests. Yield each repository in order with its completed record, or None if
+        its revision could not be resolved.
+        """
+        start = dt.datetime.now()
+        with ThreadPoolExecutor(max_workers=max(resolution_workers, 1)) as executor:
+            futures = [
+                executor.submit(complete_repository_revision, repository, **complete_kwargs)
+                for repository in repositories
+            ]
+            for repository, future in zip(repositories, futures):
+                try:
+                    complete_repo = future.result()
+                except Exception as e:
+                    if log:
+                        log_repository_install_error(repository.to_dict(), start, unicodify(e), log)
+                    yield repository, None
+                    continue
+                yield repository, complete_repo
+
     def install_repositories(
         self,
         repositories: list[InstallRepoDict],
         log=log,
         force_latest_revision: bool = False,
-        default_toolshed: str = "https://toolshed.g2.bx.psu.edu/",
+        default_toolshed: str = DEFAULT_TOOL_SHED_URL,
         default_install_tool_dependencies: bool = False,
         default_install_resolver_dependencies: bool = True,
         default_install_repository_dependencies: bool = True,
+        install_workers: int = 1,
+        resolution_workers: int = DEFAULT_RESOLUTION_WORKERS,
+        catalog: ToolShedCatalog | None = None,
+        journal: InstallJournal | None = None,
+        dependency_order: bool = False,
+        defer_resolver_dependencies: bool = False,
+        resolver_dependency_workers: int = DEFAULT_RESOLVER_DEPENDENCY_WORKERS,
+        install_history: InstallHistory | None = None,
+        filter_installed: bool = True,
+        adaptive_install_workers: bool = False,
     ):
-        """Install a list of tools on the current galaxy"""
+        """
+        Install a list of tools on the current galaxy.
+
+        Changeset revisions are resolved by up to ``resolution_workers`` concurrent requests,
+        and up to ``install_workers`` repositories are installed concurrently.
+        If ``adaptive_install_workers`` is set, the number of concurrent installs starts at one and
+        adapts to how well Galaxy keeps up, up to ``install_workers`` (see ``AdaptiveConcurrency``).
+        If a ``catalog`` is given, revisions of the Tool Sheds it contains are resolved from the catalog.
+        If a ``journal`` is given, progress is recorded in it and repositories completed by an earlier
+        run with the same journal are skipped.
+        If ``dependency_order`` is set, the repository dependencies of all repositories are fetched
+        from the Tool Shed first. Missing dependencies are then installed once, before the repositories
+        that need them, and repositories that do not depend on each other are installed in parallel.
+        If ``defer_resolver_dependencies`` is set, repositories are installed without their resolver
+        dependencies, which are installed for all new tools afterwards by up to
+        ``resolver_dependency_workers`` concurrent requests. Repositories with tools whose resolver
+        dependencies fail to install are errored.
+        If an ``install_history`` is given, the duration of each install is recorded in it, and the
+        repositories expected to take longest are installed first.
+        If ``filter_installed`` is False, the installed repositories are not fetched from Galaxy
+        and all repositories are sent to Galaxy, which skips the ones that are already installed.
+        The ``InstallResults`` lists do not follow the order of ``repositories``: repositories completed
+        or resolved by an earlier run with the same journal come first, and missing dependencies added by
+        ``dependency_order`` come last.
+        """
         installation_start = dt.datetime.now()
         installed_repositories: list[InstallRepoDict] = []
         skipped_repositories: list[InstallRepoDict] = []
@@ -203,57 +621,144 @@ class InstallRepositoryManager:
                     if log:
                         log.warning(f"'{key}' not a valid key. Will be skipped during parsing")
 
-        # Start by flattening the repo list per revision
-        flattened_repos = flatten_repo_info(repositories)
+        # Start by flattening the repo list per revision. Large tool lists are processed as compact
+        # RepositoryRevision records, that are converted to dicts only for the repositories to install.
+        flattened_repos = flatten_repository_revisions(repositories)
         total_num_repositories = len(flattened_repos)
 
-        # Complete the repo information, and make sure each repository has a revision
-        repository_list: list[InstallRepoDict] = []
-        for repository in flattened_repos:
-            start = dt.datetime.now()
-            try:
-                complete_repo = complete_repo_information(
-                    repository,
-                    default_toolshed_url=default_toolshed,
-                    default_install_tool_dependencies=default_install_tool_dependencies,
-                    default_install_resolver_dependencies=default_install_resolver_dependencies,
-                    default_install_repository_dependencies=default_install_repository_dependencies,
-                    force_latest_revision=force_latest_revision,
-                )
-                repository_list.append(complete_repo)
-            except Exception as e:
+        # Repositories resolved or completed by an earlier run with the same journal are not resolved again.
+        # Records are kept together with their journal key (None without journal).
+        repository_list: list[tuple[RepositoryRevision, str | None]] = []
+        unresolved_repos: list[tuple[RepositoryRevision, str | None]] = [(r, None) for r in flattened_repos]
+        if journal:
+            completed_repos, resolved_repos, journaled_unresolved_repos = self._split_journaled(
+                flattened_repos, journal, default_toolshed, force_latest_revision, log=log
+            )
+            repository_list.extend(resolved_repos)
+            unresolved_repos = list(journaled_unresolved_repos)
+            counter += len(completed_repos)
+            skipped_repositories.extend(completed_repos)
+
+        # Complete the repo information, and make sure each repository has a revision.
+        # Revisions are resolved concurrently, connections to each Tool Shed are pooled.
+        start = dt.datetime.now()
+        resolved = self._resolve_repository_revisions(
+            [repository for repository, _ in unresolved_repos],
+            resolution_workers=resolution_workers,
+            log=log,
+            default_toolshed_url=default_toolshed,
+            default_install_tool_dependencies=default_install_tool_dependencies,
+            default_install_resolver_dependencies=default_install_resolver_dependencies,
+            default_install_repository_dependencies=default_install_repository_dependencies,
+            force_latest_revision=force_latest_revision,
+            catalog=catalog,
+        )
+        for (_, repository_key), (repository, complete_repo) in zip(unresolved_repos, resolved):
+            if complete_repo is None:
                 # We'll run through the loop come whatever may, we log the errored repositories at the end anyway.
-                if log:
-                    log_repository_install_error(repository, start, unicodify(e), log)
-                errored_repositories.append(repository)
+                errored_repositories.append(repository.to_dict())
+                continue
+            repository_list.append((complete_repo, repository_key))
+            if journal and repository_key:
+                journal.record_resolved(repository_key, complete_repo.to_install_dict())
+        if journal:
+            journal.record_phase("resolve", start, len(unresolved_repos))
 
         # Filter out already installed repos
-        filtered_repos = self.filter_installed_repos(repository_list)
-
-        for skipped_repo in filtered_repos.already_installed_repos:
+        start = dt.datetime.now()
+        if repository_list and filter_installed:
+            installed_flags = self._installed_flags([repository for repository, _ in repository_list])
+        else:
+            installed_flags = [False] * len(repository_list)
+        if journal:
+            journal.record_phase("filter", start, len(repository_list))
+
+        not_installed_repos: list[tuple[RepositoryRevision, str | None]] = []
+        # Repositories installed by an earlier run, whose deferred resolver dependencies are not installed yet
+        pending_repos: list[tuple[InstallRepoDict, str | None]] = []
+        for (repository, repository_key), installed in zip(repository_list, installed_flags):
+            if not installed:
+                not_installed_repos.append((repository, repository_key))
+                continue
             counter += 1
+            skipped_repo = repository.to_install_dict()
             if log:
                 log_repository_install_skip(skipped_repo, counter, total_num_repositories, log)
+            if journal and repository_key and journal.resolver_dependencies_pending(repository_key):
+                pending_repos.append((skipped_repo, repository_key))
+                continue
             skipped_repositories.append(skipped_repo)
+            if journal and repository_key:
+                journal.record_outcome(repository_key, skipped_repo, "skipped")
 
-        # Install repos
-        for repository in filtered_repos.not_installed_repos:
-            counter += 1
-            if log:
-                log_repository_install_start(
-                    repository,
-                    counter=counter,
-                    installation_start=installation_start,
-                    log=log,
-                    total_num_repositories=total_num_repositories,
-                )
-            result = self.install_repository_revision(repository, log)
+        # Install repos. The journal keys are index-aligned with install_repos.
+        start = dt.datetime.now()
+        install_repos = [repository.to_install_dict() for repository, _ in not_installed_repos]
+        install_keys = [repository_key for _, repository_key in not_installed_repos]
+        dependencies: dict[int, set[int]] = {}
+        if dependency_order:
+            install_repos, dependencies = self.repository_dependency_graph(
+                install_repos, workers=resolution_workers, log=log, filter_installed=filter_installed
+            )
+            # Added dependencies are not in the journal
+            install_keys.extend([None] * (len(install_repos) - len(install_keys)))
+            total_num_repositories += len(install_repos) - len(not_installed_repos)
+        expected_durations = install_history.expected_durations(install_repos) if install_history else None
+        concurrency = AdaptiveConcurrency(install_workers, log=log) if adaptive_install_workers else None
+        install_repository = functools.partial(
+            self._install_repository,
+            concurrency=concurrency,
+            total_num_repositories=total_num_repositories,
+            installation_start=installation_start,
+            log=log,
+            journal=journal,
+            defer_resolver_dependencies=defer_resolver_dependencies,
+            install_history=install_history,
+        )
+        installs = [
+            ScheduledInstall(
+                repository=repository,
+                journal_key=repository_key,
+                expected_duration=expected_durations[index] if expected_durations else None,
+            )
+            for index, (repository, repository_key) in enumerate(zip(install_repos, install_keys))
+        ]
+        results = self._install_scheduled(
+            installs,
+            lambda install, counter, eta: install_repository(
+                install.repository,
+                counter=counter,
+                eta=eta,
+                journal_key=install.journal_key,
+                expected_duration=install.expected_duration,
+            ),
+            dependencies=dependencies,
+            install_workers=install_workers,
+            counter=counter,
+            expected_durations=expected_durations,
+            concurrency=concurrency,
+        )
+        if journal:
+            journal.record_phase("install", start, len(install_repos))
+
+        outcomes = [(repository, repository_key, "skipped") for repository, repository_key in pending_repos]
+        outcomes.extend((install.repository, install.journal_key, result) for install, result in zip(installs, results))
+        if defer_resolver_dependencies or pending_repos:
+            outcomes = self._install_deferred_resolver_dependencies(
+                outcomes,
+                defer_resolver_dependencies=defer_resolver_dependencies,
+                journal=journal,
+                workers=resolver_dependency_workers,
+                log=log,
+            )
+
+        for install_repo, _, result in outcomes:
             if result == "error":
-                errored_repositories.append(repository)
+                errored_repositories.append(install_repo)
             elif result == "skipped":
-                skipped_repositories.append(repository)
+                skipped_repositories.append(install_repo)
             elif result == "installed":
-                installed_repositories.append(repository)
+                installed_repositories.append(install_repo)
 
         # Log results
         if log:
@@ -282,7 +787,119 @@ class InstallRepositoryManager:
             errored_repositories=errored_repositories,
         )
 
-    def update_repositories(self, repositories=None, log=log, **kwargs):
+    def plan_repositories(
+        self,
+        repositories: list[InstallRepoDict],
+        log=log,
+        force_latest_revision: bool = False,
+        default_toolshed: str = DEFAULT_TOOL_SHED_URL,
+        default_install_tool_dependencies: bool = False,
+        default_install_resolver_dependencies: bool = True,
+        default_install_repository_dependencies: bool = True,
+        install_workers: int = 1,
+        resolution_workers: int = DEFAULT_RESOLUTION_WORKERS,
+        catalog: ToolShedCatalog | None = None,
+        dependency_order: bool = False,
+        defer_resolver_dependencies: bool = False,
+        install_history: InstallHistory | None = None,
+        filter_installed: bool = True,
+        **install_kwargs,
+    ) -> InstallPlan:
+        """
+        Resolve and filter ``repositories`` like ``install_repositories``, but return the ``InstallPlan``
+        of the installs instead of performing them. Galaxy is not modified.
+        Options of ``install_repositories`` that do not change which repositories are installed are ignored.
+        """
+        skipped_repositories: list[InstallRepoDict] = []
+        errored_repositories: list[InstallRepoDict] = []
+        repository_list: list[RepositoryRevision] = []
+        for repository, complete_repo in self._resolve_repository_revisions(
+            flatten_repository_revisions(repositories),
+            resolution_workers=resolution_workers,
+            log=log,
+            default_toolshed_url=default_toolshed,
+            default_install_tool_dependencies=default_install_tool_dependencies,
+            default_install_resolver_dependencies=default_install_resolver_dependencies,
+            default_install_repository_dependencies=default_install_repository_dependencies,
+            force_latest_revision=force_latest_revision,
+            catalog=catalog,
+        ):
+            if complete_repo is None:
+                errored_repositories.append(repository.to_dict())
+            else:
+                repository_list.append(complete_repo)
+        if repository_list and filter_installed:
+            installed_flags = self._installed_flags(repository_list)
+            skipped_repositories.extend(
+                repository.to_install_dict()
+                for repository, installed in zip(repository_list, installed_flags)
+                if installed
+            )
+            repository_list = [
+                repository for repository, installed in zip(repository_list, installed_flags) if not installed
+            ]
+        install_repos = [repository.to_install_dict() for repository in repository_list]
+        if dependency_order:
+            install_repos, _ = self.repository_dependency_graph(
+                install_repos, workers=resolution_workers, log=log, filter_installed=filter_installed
+            )
+        expected_durations = install_history.expected_durations(install_repos) if install_history else None
+        plan = InstallPlan(
+            galaxy_url=self.gi.base_url,
+            install_workers=install_workers,
+            repositories=install_repos,
+            skipped_repositories=skipped_repositories,
+            errored_repositories=errored_repositories,
+            api_calls=count_api_calls(
+                install_repos,
+                dependency_order=dependency_order,
+                defer_resolver_dependencies=defer_resolver_dependencies,
+            ),
+            estimated_seconds=(
+                round(estimate_duration(expected_durations, install_workers), 1)
+                if expected_durations is not None
+                else None
+            ),
+        )
+        if log:
+            log.info(
+                "Plan: install %d repositories (%d already installed, %d errored) with %d API requests%s",
+                len(plan.repositories),
+                len(plan.skipped_repositories),
+                len(plan.errored_repositories),
+                plan.api_calls["total"],
+                (
+                    f", estimated duration {dt.timedelta(seconds=round(plan.estimated_seconds))}"
+                    if plan.estimated_seconds is not None
+                    else ", unknown duration (no install history)"
+                ),
+            )
+        return plan
+
+    def repositories_with_updates(self) -> set[tuple[str, str, str]]:
+        """
+        Ask Galaxy to check all installed repositories for updates in a single request and return
+        the (tool shed, owner, name) of the repositories that do not have their latest installable
+        revision installed. Repositories whose update status is unknown are included.
+        """
+        self.gi.make_get_request(f"{self.gi.url}/tool_shed_repositories/check_for_updates").raise_for_status()
+        up_to_date = set()
+        outdated = set()
+        for repository in self.tool_shed_client.get_repositories():
+            if repository.get("deleted") or repository.get("status") != "Installed":
+                continue
+            key = (tool_shed_key(repository["tool_shed"]), repository["owner"], repository["name"])
+            tool_shed_status = repository.get("tool_shed_status") or {}
+            if asbool(tool_shed_status.get("latest_installable_revision")) and not asbool(
+                tool_shed_status.get("revision_upgrade")
+            ):
+                up_to_date.add(key)
+            else:
+                outdated.add(key)
+        # Several revisions of a repository may be installed, it is up to date if one of them is the latest.
+        return outdated - up_to_date
+
+    def update_repositories(self, repositories=None, log=log, galaxy_update_check=False, **kwargs):
         if not repositories:  # Repositories None or empty list
             repositories = self.installed_repositories()
         else:
@@ -293,6 +910,27 @@ class InstallRepositoryManager:
                         f"The following tools are not installed and will not be upgraded: {filtered_repos.not_installed_repos}"
                     )
             repositories = filtered_repos.already_installed_repos
+        if galaxy_update_check:
+            outdated = self.repositories_with_updates()
+            default_toolshed = kwargs.get("default_toolshed", DEFAULT_TOOL_SHED_URL)
+            num_repositories = len(repositories)
+            repositories = [
+                repository
+                for repository in repositories
+                if (
+                    tool_shed_key(repository.get("tool_shed_url") or default_toolshed),
+                    repository["owner"],
+                    repository["name"],
+                )
+                in outdated
+            ]
+            if log:
+                log.info(
+                    "Galaxy reports updates for %d of %d repositories: %s",
+                    len(repositories),
+                    num_repositories,
+                    [(r["name"], r["owner"]) for r in repositories],
+                )
         return self.install_repositories(repositories, force_latest_revision=True, log=log, **kwargs)
 
     def test_tools(
@@ -306,11 +944,31 @@ class InstallRepositoryManager:
         parallel_tests=1,
         test_all_versions=False,
         client_test_config_path=None,
+        definition_workers=DEFAULT_TEST_DEFINITION_WORKERS,
+        test_store=None,
+        skip_passed_window=None,
+        shard=None,
+        test_durations=None,
     ):
-        """Run tool tests for all tools in each repository in supplied tool list or ``self.installed_repositories()``."""
+        """
+        Run tool tests for all tools in each repository in supplied tool list or ``self.installed_repositories()``.
+
+        The test definitions of the tools are fetched by up to ``definition_workers`` concurrent requests,
+        and the tests of a tool are started as soon as its definitions arrive.
+        If a ``test_store`` is given, test results are recorded in it. If ``skip_passed_window`` is given
+        as well, tests whose last run on this Galaxy within the window passed with the same test definition
+        are skipped.
+        If a ``shard`` (index, count) is given, only the tests assigned to that shard by ``_scheduled_tests`` are run,
+        which needs the test definitions of all tools first.
+        Tests are expected to take as long as in ``test_durations`` (e.g. ``ReportedTestDurations``) or as recorded
+        in ``test_store``. If either is given, each test worker that becomes free runs the longest test whose
+        definitions arrived so far (see ``LongestTestsFirst``), and shards are balanced by the expected durations.
+        """
         tool_test_start = dt.datetime.now()
         tests_passed = []
         test_exceptions = []
+        tests_skipped = []
+        skip_passed_since = tool_test_start - skip_passed_window if test_store and skip_passed_window else None
 
         if not repositories:  # If repositories is None or empty list
             # Consider a variant of this that doesn't even consume a tool list YAML? target
@@ -320,8 +978,9 @@ class InstallRepositoryManager:
         target_repositories = flatten_repo_info(repositories)
 
         installed_tools = []
+        tool_index = ToolIndex(self.gi)
         for target_repository in target_repositories:
-            repo_tools = tools_for_repository(self.gi, target_repository, all_tools=test_all_versions)
+            repo_tools = tool_index.tools_for_repository(target_repository, all_tools=test_all_versions)
             installed_tools.extend(repo_tools)
 
         all_test_results = []
@@ -347,20 +1006,41 @@ class InstallRepositoryManager:
         else:
             test_history = galaxy_interactor.new_history()
 
+        test_durations = test_durations or test_store
         with ThreadPoolExecutor(max_workers=parallel_tests) as executor:
             try:
-                for tool in installed_tools:
-                    self._test_tool(
-                        executor=executor,
-                        tool=tool,
-                        galaxy_interactor=galaxy_interactor,
-                        test_history=test_history,
-                        log=log,
-                        tool_test_results=all_test_results,
-                        tests_passed=tests_passed,
-                        test_exceptions=test_exceptions,
-                        client_test_config=client_test_config,
-                    )
+                test_tool = functools.partial(
+                    self._test_tool,
+                    executor=executor,
+                    galaxy_interactor=galaxy_interactor,
+                    test_history=test_history,
+                    log=log,
+                    tool_test_results=all_test_results,
+                    tests_passed=tests_passed,
+                    test_exceptions=test_exceptions,
+                    client_test_config=client_test_config,
+                    test_store=test_store,
+                    skip_passed_since=skip_passed_since,
+                    tests_skipped=tests_skipped,
+                    galaxy_url=self.gi.base_url,
+                    test_queue=LongestTestsFirst(executor, test_durations) if test_durations else None,
+                )
+                # Fetch the test definitions concurrently, and submit the tests of each tool as soon as they arrive
+                with ThreadPoolExecutor(max_workers=max(definition_workers, 1)) as definition_executor:
+                    tool_tests = {
+                        definition_executor.submit(
+                            galaxy_interactor.get_tool_tests, *self._tool_id_and_version(tool)
+                        ): tool
+                        for tool in installed_tools
+                    }
+                    if shard:
+                        for tool, future, test_indices in self._scheduled_tests(
+                            tool_tests, shard=shard, test_durations=test_durations
+                        ):
+                            test_tool(tool=tool, tool_tests=future, test_indices=test_indices)
+                    else:
+                        for future in as_completed(tool_tests):
+                            test_tool(tool=tool_tests[future], tool_tests=future)
             finally:
                 # Always write report, even if test was cancelled.
                 try:
@@ -374,10 +1054,10 @@ class InstallRepositoryManager:
                     "version": "0.1",
                     "suitename": f"Ephemeris tool tests targeting {self.gi.base_url}",
                     "results": {
-                        "total": n_passed + n_failed,
+                        "total": n_passed + n_failed + len(tests_skipped),
                         "errors": n_failed,
                         "failures": 0,
-                        "skips": 0,
+                        "skips": len(tests_skipped),
                     },
                     "tests": sorted(all_test_results, key=lambda el: el["id"]),
                 }
@@ -387,6 +1067,8 @@ class InstallRepositoryManager:
                     log.info("Report written to '%s'", os.path.abspath(test_json))
                     log.info(f"Passed tool tests ({n_passed}): {[t for t in tests_passed]}")
                     log.info(f"Failed tool tests ({n_failed}): {[t[0] for t in test_exceptions]}")
+                    if tests_skipped:
+                        log.info(f"Skipped tool tests that passed before ({len(tests_skipped)})")
                     log.info(f"Total tool test time: {dt.datetime.now() - tool_test_start}")
 
     def _get_interactor(self, test_user, test_user_api_key):
@@ -405,6 +1087,52 @@ class InstallRepositoryManager:
         galaxy_interactor = GalaxyInteractorApi(**galaxy_interactor_kwds)
         return galaxy_interactor
 
+    @staticmethod
+    def _tool_id_and_version(tool) -> tuple[str, str | None]:
+        tool_id = tool["id"]
+        tool_version = tool["version"]
+        # If given a tool_id with a version suffix, strip it off so we can treat tool_version
+        # correctly at least in client_test_config.
+        if tool_version and tool_id.endswith("/" + tool_version):
+            tool_id = tool_id[: -len("/" + tool_version)]
+        return tool_id, tool_version
+
+    @staticmethod
+    def _scheduled_tests(
+        tool_tests: dict[Future, dict],
+        shard: tuple[int, int] | None = None,
+        test_durations: ToolTestStore | ReportedTestDurations | None = None,
+    ) -> list[tuple[dict, Future, list[int] | None]]:
+        """
+        Wait for the test definitions fetched by the ``tool_tests`` futures, and return the tests to run,
+        as the tool, its test definition future and the indices of its tests. If a ``shard`` (index, count)
+        is given, all tests are split over the shards, balanced by the expected ``test_durations``, and only
+        the tests of the shard are returned. Tools whose test definitions could not be fetched are returned
+        with None by a single shard.
+        """
+        index, count = shard or (1, 1)
+        wait(tool_tests)
+        scheduled: list[tuple[dict, Future, list[int] | None]] = []
+        tests: list[tuple[Future, int]] = []
+        test_ids: list[str] = []
+        test_keys: list[tuple[str, str | None, int]] = []
+        for future, tool in tool_tests.items():
+            tool_id, tool_version = InstallRepositoryManager._tool_id_and_version(tool)
+            label_base = f"{tool_id}/{tool_version}" if tool_version else tool_id
+            if future.exception() is not None:
+                if zlib.crc32(label_base.encode()) % count + 1 == index:
+                    scheduled.append((tool, future, None))
+                continue
+            for test_index in range(len(future.result())):
+                tests.append((future, test_index))
+                test_ids.append(f"{label_base}-{test_index}")
+                test_keys.append((tool_id, tool_version, test_index))
+        durations = test_durations.expected_durations(test_keys) if test_durations else [1.0] * len(test_keys)
+        for (future, test_index), assigned in zip(tests, assign_shards(test_ids, durations, count)):
+            if assigned == index:
+                scheduled.append((tool_tests[future], future, [test_index]))
+        return scheduled
+
     @staticmethod
     def _test_tool(
         executor,
@@ -416,21 +1144,34 @@ class InstallRepositoryManager:
         log,
         test_history=None,
         client_test_config=None,
+        tool_tests: Future | None = None,
+        test_store: ToolTestStore | None = None,
+        skip_passed_since: dt.datetime | None = None,
+        tests_skipped=None,
+        galaxy_url: str = "",
+        test_indices: list[int] | None = None,
+        test_queue: LongestTestsFirst | None = None,
     ):
+        """
+        Submit the tests of ``tool`` to ``executor`` (through ``test_queue`` if given), or only the tests
+        in ``test_indices`` if given.
+        The test definitions are taken from the ``tool_tests`` future if given, and fetched from Galaxy otherwise.
+        If a ``test_store`` is given, the result of each test is recorded in it for ``galaxy_url``, and if
+        ``skip_passed_since`` is given as well, tests that passed since then are not submitted but added to
+        ``tests_skipped``, and reported with status "skip".
+        """
         if test_history is None:
             test_history = galaxy_interactor.new_history()
-        tool_id = tool["id"]
-        tool_version = tool["version"]
-        # If given a tool_id with a version suffix, strip it off so we can treat tool_version
-        # correctly at least in client_test_config.
-        if tool_version and tool_id.endswith("/" + tool_version):
-            tool_id = tool_id[: -len("/" + tool_version)]
+        tool_id, tool_version = InstallRepositoryManager._tool_id_and_version(tool)
 
         label_base = tool_id
         if tool_version:
             label_base += "/" + str(tool_version)
         try:
-            tool_test_dicts = galaxy_interactor.get_tool_tests(tool_id, tool_version=tool_version)
+            if tool_tests is not None:
+                tool_test_dicts = tool_tests.result()
+            else:
+                tool_test_dicts = galaxy_interactor.get_tool_tests(tool_id, tool_version=tool_version)
         except Exception as e:
             if log:
                 log.warning(
@@ -445,12 +1186,39 @@ class InstallRepositoryManager:
                 tests_passed=tests_passed,
                 test_exceptions=test_exceptions,
             )
-        test_indices = list(range(len(tool_test_dicts)))
+        if test_indices is None:
+            test_indices = list(range(len(tool_test_dicts)))
+        queued_tests = []
 
         for test_index in test_indices:
             test_id = label_base + "-" + str(test_index)
+            test_definition_hash = definition_hash(tool_test_dicts[test_index])
+            if (
+                test_store
+                and skip_passed_since
+                and test_store.passed_since(
+                    galaxy_url, tool_id, tool_version, test_index, test_definition_hash, since=skip_passed_since
+                )
+            ):
+                if log:
+                    log.debug("Skipping test '%s', it passed since %s", test_id, skip_passed_since)
+                if tests_skipped is not None:
+                    tests_skipped.append(test_id)
+                tool_test_results.append(
+                    {
+                        "id": test_id,
+                        "has_data": True,
+                        "data": {
+                            "status": "skip",
+                            "tool_id": tool_id,
+                            "tool_version": tool_version,
+                            "test_index": test_index,
+                        },
+                    }
+                )
+                continue
 
-            def run_test(index, test_id):
+            def run_test(index, test_id, test_definition_hash):
                 def register(job_data):
                     tool_test_results.append(
                         {
@@ -460,6 +1228,8 @@ class InstallRepositoryManager:
                         }
                     )
 
+                start = time.time()
+                passed = False
                 try:
                     if log:
                         log.info("Executing test '%s'", test_id)
@@ -472,7 +1242,9 @@ class InstallRepositoryManager:
                         quiet=True,
                         test_history=test_history,
                         client_test_config=client_test_config,
+                        _tool_test_dicts=tool_test_dicts,
                     )
+                    passed = True
                     tests_passed.append(test_id)
                     if log:
                         log.info("Test '%s' passed", test_id)
@@ -480,13 +1252,317 @@ class InstallRepositoryManager:
                     if log:
                         log.warning("Test '%s' failed", test_id, exc_info=True)
                     test_exceptions.append((test_id, e))
+                if test_store:
+                    test_store.record(
+                        galaxy_url, tool_id, tool_version, index, test_definition_hash, passed, time.time() - start
+                    )
+
+            if test_queue is not None:
+                queued_tests.append(
+                    (
+                        tool_id,
+                        tool_version,
+                        test_index,
+                        test_id,
+                        functools.partial(run_test, test_index, test_id, test_definition_hash),
+                    )
+                )
+            else:
+                executor.submit(run_test, test_index, test_id, test_definition_hash)
+        if test_queue is not None:
+            test_queue.submit(queued_tests)
+
+    def repository_dependency_graph(
+        self,
+        repositories: list[InstallRepoDict],
+        workers: int = DEFAULT_RESOLUTION_WORKERS,
+        log=log,
+        filter_installed: bool = True,
+    ) -> tuple[list[InstallRepoDict], dict[int, set[int]]]:
+        """
+        Fetch the repository dependencies of ``repositories`` from the Tool Shed.
+        Return ``repositories`` extended with the dependencies that are not installed yet,
+        and for each of them the indices of the repositories it depends on.
+        If ``filter_installed`` is False and the installed repositories have not been fetched,
+        all missing dependencies are added, and Galaxy skips the ones that are already installed.
+        """
+
+        def node_key(repository):
+            return (
+                tool_shed_key(repository["tool_shed_url"]),
+                repository["owner"],
+                repository["name"],
+                repository["changeset_revision"],
+            )
+
+        nodes = list(repositories)
+        indices = {node_key(repository): index for index, repository in enumerate(nodes)}
+        dependencies: dict[int, set[int]] = {}
+        installed = self.installed_snapshot() if filter_installed else self._installed_snapshot
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [
+                executor.submit(get_repository_dependencies, repository)
+                for repository in repositories
+                if repository.get("install_repository_dependencies")
+            ]
+            with_dependencies = [r for r in repositories if r.get("install_repository_dependencies")]
+
+        def node_index(node, parent):
+            # Add repositories that are neither in the list nor installed, with the settings of the repository needing them
+            key = node_key(node)
+            if key not in indices:
+                if installed is not None and installed.is_installed(node):
+                    return None
+                node = dict(parent, **node)
+                indices[key] = len(nodes)
+                nodes.append(node)
+            return indices[key]
+
+        for repository, future in zip(with_dependencies, futures):
+            try:
+                edges = future.result()
+            except Exception as e:
+                if log:
+                    log.warning(
+                        "Could not get repository dependencies of %s, it will be installed without ordering: %s",
+                        repository["name"],
+                        unicodify(e),
+                    )
+                continue
+            for dependent, dependency in edges:
+                dependency_index = node_index(dependency, repository)
+                dependent_index = node_index(dependent, repository)
+                if dependency_index is not None and dependent_index is not None and dependency_index != dependent_index:
+                    dependencies.setdefault(dependent_index, set()).add(dependency_index)
+        num_repositories = len(repositories)
+        missing_dependencies = nodes[num_repositories:]
+        if log and missing_dependencies:
+            log.info(
+                "Installing %d missing repository dependencies: %s",
+                len(missing_dependencies),
+                [(t["name"], t["changeset_revision"]) for t in missing_dependencies],
+            )
+        return nodes, dependencies
 
-            executor.submit(run_test, test_index, test_id)
+    def install_resolver_dependencies(
+        self,
+        repositories: list[InstallRepoDict],
+        workers: int = DEFAULT_RESOLVER_DEPENDENCY_WORKERS,
+        log=log,
+    ) -> list[int]:
+        """
+        Install the resolver dependencies (e.g. conda packages) of all tools of the installed
+        ``repositories`` with up to ``workers`` concurrent requests.
+        Return the indices of the ``repositories`` with tools for which the installation failed,
+        or whose requirements Galaxy could not resolve afterwards.
+        """
+        if not repositories:
+            return []
+        tool_index = ToolIndex(self.gi)
+        # The indices of the repositories containing each tool
+        tool_repositories: dict[str, list[int]] = {}
+        for index, repository in enumerate(repositories):
+            for tool in tool_index.tools_for_repository(repository, all_tools=True):
+                tool_repositories.setdefault(tool["id"], []).append(index)
+        tool_ids = list(tool_repositories)
+        if log:
+            log.info(
+                "Installing resolver dependencies of %d tools from %d repositories", len(tool_ids), len(repositories)
+            )
+        tool_client = ToolClient(self.gi)
+        dependency_log = log or logging.getLogger(__name__)
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [
+                executor.submit(install_tool_dependencies, tool_client, tool_id, log=dependency_log)
+                for tool_id in tool_ids
+            ]
+        failed_repositories: set[int] = set()
+        for tool_id, future in zip(tool_ids, futures):
+            try:
+                unresolved = future.result()
+            except Exception as e:
+                if log:
+                    log.error("Installing resolver dependencies of tool %s failed: %s", tool_id, unicodify(e))
+                failed_repositories.update(tool_repositories[tool_id])
+                continue
+            if unresolved:
+                if log:
+                    log.error("Resolver dependencies of tool %s could not be installed: %s", tool_id, unresolved)
+                failed_repositories.update(tool_repositories[tool_id])
+        return sorted(failed_repositories)
 
-    def install_repository_revision(self, repository: InstallRepoDict, log):
+    def _install_deferred_resolver_dependencies(
+        self,
+        outcomes: list[tuple[InstallRepoDict, str | None, str]],
+        defer_resolver_dependencies: bool,
+        journal: InstallJournal | None,
+        workers: int,
+        log,
+    ) -> list[tuple[InstallRepoDict, str | None, str]]:
+        """
+        Install the resolver dependencies deferred by ``_install_repository`` for the (repository,
+        journal key, result) ``outcomes`` of the installs, and for repositories the journal has pending
+        resolver dependencies for. Return the ``outcomes`` with the result of repositories whose resolver
+        dependencies failed to install changed to "error", and journal the final outcomes.
+        """
+        start = dt.datetime.now()
+        deferred = [
+            index
+            for index, (repository, repository_key, result) in enumerate(outcomes)
+            if (
+                defer_resolver_dependencies
+                and result == "installed"
+                and repository.get("install_resolver_dependencies")
+            )
+            or (
+                result != "error"
+                and journal
+                and repository_key
+                and journal.resolver_dependencies_pending(repository_key)
+            )
+        ]
+        failed = set(
+            self.install_resolver_dependencies([outcomes[index][0] for index in deferred], workers=workers, log=log)
+        )
+        outcomes = list(outcomes)
+        for position, index in enumerate(deferred):
+            repository, repository_key, result = outcomes[index]
+            if position in failed:
+                result = "error"
+                outcomes[index] = (repository, repository_key, result)
+            if journal and repository_key:
+                journal.record_outcome(repository_key, repository, result)
+        if journal:
+            journal.record_phase("resolver_dependencies", start, len(deferred))
+        return outcomes
+
+    @staticmethod
+    def _install_scheduled(
+        repositories: Sequence[Any],
+        install_repository: Callable[..., str],
+        dependencies: dict[int, set[int]],
+        install_workers: int,
+        counter: int = 0,
+        expected_durations: list[float] | None = None,
+        concurrency: AdaptiveConcurrency | None = None,
+    ) -> list[str]:
+        """
+        Install ``repositories`` by calling ``install_repository(repository, counter=..., eta=...)``
+        with up to ``install_workers`` concurrent installs, or ``concurrency.limit`` if given.
+        A repository is started only when all repositories it depends on (by index) are done.
+        Otherwise repositories are started in list order, or longest first if ``expected_durations``
+        are given, which are also used to estimate the remaining time (``eta``).
+        Return the results in list order.
+        """
+        workers = max(install_workers, 1)
+        results: list[str] = [""] * len(repositories)
+        waiting_for = {index: set(dependencies.get(index, ())) for index in range(len(repositories))}
+        dependents: dict[int, list[int]] = {}
+        for index, index_dependencies in waiting_for.items():
+            for dependency_index in index_dependencies:
+                dependents.setdefault(dependency_index, []).append(index)
+
+        def priority(index):
+            return (-expected_durations[index] if expected_durations else 0, index)
+
+        ready = [priority(index) for index, index_dependencies in waiting_for.items() if not index_dependencies]
+        heapq.heapify(ready)
+        unscheduled = set(range(len(repositories)))
+        running: dict[Future, int] = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while unscheduled or running:
+                if not ready and not running:
+                    # Only repositories with circular dependencies are left.
+                    # Follow the dependencies until a repository repeats and start that repository.
+                    index = min(unscheduled)
+                    seen = set()
+                    while index not in seen:
+                        seen.add(index)
+                        index = min(waiting_for[index])
+                    heapq.heappush(ready, priority(index))
+                limit = concurrency.limit if concurrency else workers
+                while ready and len(running) < limit:
+                    _, index = heapq.heappop(ready)
+                    eta = None
+                    if expected_durations:
+                        remaining = sum(expected_durations[i] for i in unscheduled) + sum(
+                            expected_durations[i] for i in running.values()
+                        )
+                        eta = dt.timedelta(seconds=round(remaining / limit))
+                    unscheduled.discard(index)
+                    counter += 1
+                    future = executor.submit(install_repository, repositories[index], counter=counter, eta=eta)
+                    running[future] = index
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    results[index] = future.result()
+                    for dependent_index in dependents.get(index, []):
+                        waiting_for[dependent_index].discard(index)
+                        if not waiting_for[dependent_index] and dependent_index in unscheduled:
+                            if priority(dependent_index) not in ready:
+                                heapq.heappush(ready, priority(dependent_index))
+        return results
+
+    def _install_repository(
+        self,
+        repository: InstallRepoDict,
+        counter,
+        total_num_repositories,
+        installation_start,
+        log,
+        eta=None,
+        journal=None,
+        journal_key=None,
+        defer_resolver_dependencies=False,
+        install_history=None,
+        concurrency=None,
+        expected_duration=None,
+    ):
+        deferred = defer_resolver_dependencies and repository.get("install_resolver_dependencies")
+        if deferred:
+            repository = repository.copy()
+            repository["install_resolver_dependencies"] = False
+        if log:
+            log_repository_install_start(
+                repository,
+                counter=counter,
+                installation_start=installation_start,
+                log=log,
+                total_num_repositories=total_num_repositories,
+                eta=eta,
+            )
+        start = time.time()
+        result = self.install_repository_revision(
+            repository, log, concurrency=concurrency, expected_duration=expected_duration
+        )
+        if result != "error":
+            self._update_installed_snapshot([repository])
+        if install_history and result == "installed":
+            install_history.record(repository, time.time() - start, galaxy_url=self.gi.base_url)
+        if journal and journal_key:
+            if (deferred and result == "installed") or (
+                result != "error" and journal.resolver_dependencies_pending(journal_key)
+            ):
+                # Completed by _install_deferred_resolver_dependencies
+                journal.record_outcome(journal_key, repository, RESOLVER_DEPENDENCIES_PENDING)
+            else:
+                journal.record_outcome(journal_key, repository, result)
+        return result
+
+    def install_repository_revision(
+        self,
+        repository: InstallRepoDict,
+        log,
+        concurrency: AdaptiveConcurrency | None = None,
+        expected_duration: float | None = None,
+    ):
         default_err_msg = "All repositories that you are attempting to install have been previously installed."
         start = dt.datetime.now()
         try:
+            # Galaxy downloads the repository from the Tool Shed, which counts against the Tool Shed's rate limit.
+            # The install is not counted as a running Tool Shed request, as it takes minutes in Galaxy.
+            get_tool_shed_limiter(repository["tool_shed_url"]).throttle()
             response = self.tool_shed_client.install_repository_revision(
                 tool_shed_url=repository["tool_shed_url"],
                 name=repository["name"],
@@ -498,6 +1574,8 @@ class InstallRepositoryManager:
                 new_tool_panel_section_label=repository.get("tool_panel_section_label"),
                 tool_panel_section_id=repository.get("tool_panel_section_id"),
             )
+            if concurrency:
+                concurrency.record_success((dt.datetime.now() - start).total_seconds(), expected_duration)
             if isinstance(response, dict) and response.get("status", None) == "ok":
                 # This rare case happens if a repository is already installed but
                 # was not recognised as such in the above check. In such a
@@ -521,7 +1599,9 @@ class InstallRepositoryManager:
                         )
                     )
                 return "skipped"
-            elif "504" in unicodify(e) or "Connection aborted" in unicodify(e):
+            if concurrency and ("502" in unicodify(e) or "504" in unicodify(e) or "Connection aborted" in unicodify(e)):
+                concurrency.record_overload(unicodify(e))
+            if "504" in unicodify(e) or "Connection aborted" in unicodify(e):
                 if log:
                     log.debug(
                         "Timeout during install of %s, extending wait to 1h",
@@ -555,6 +1635,7 @@ class InstallRepositoryManager:
         """
         If nginx times out, we look into the list of installed repositories
         and try to determine if a repository of the same namer/owner is still installing.
+        The repository status is then tracked by the shared ``status_poller``.
         Returns True if install finished successfully,
         returns False when timeout is exceeded or installation has failed.
         """
@@ -586,24 +1667,12 @@ class InstallRepositoryManager:
                 msg = "Could not track repository for name '%s', owner '%s', revision '%s'. "
                 msg += "Please uninstall all non-terminal repositories and ensure revision '%s' is installable."
                 raise AssertionError(msg % (name, owner, changeset_revision, changeset_revision))
-        start = dt.datetime.now()
-        while (dt.datetime.now() - start) < dt.timedelta(seconds=timeout):
-            try:
-                installed_repo = self.tool_shed_client.show_repository(installing_repo_id)
-                status = installed_repo["status"]
-                if status == "Installed":
-                    return True
-                elif status == "Error":
-                    return False
-                elif status in NON_TERMINAL_REPOSITORY_STATES:
-                    time.sleep(10)
-                else:
-                    raise AssertionError(f"Repository name '{name}', owner '{owner}' in unknown status '{status}'")
-            except ConnectionError as e:
-                if log:
-                    log.warning("Failed to get repositories list: %s", unicodify(e))
-                time.sleep(10)
-        return False
+        status = self.status_poller.wait(installing_repo_id, timeout=timeout)
+        if status is None or status == "Error":
+            return False
+        elif status == "Installed":
+            return True
+        raise AssertionError(f"Repository name '{name}', owner '{owner}' in unknown status '{status}'")
 
 
 def log_repository_install_error(repository, start, msg, log):
@@ -651,9 +1720,10 @@ def log_repository_install_start(
     total_num_repositories,
     installation_start,
     log,
+    eta=None,
 ):
     log.debug(
-        '({}/{}) Installing repository {} from {} to section "{}" at revision {} (TRT: {})'.format(
+        '({}/{}) Installing repository {} from {} to section "{}" at revision {} (TRT: {}{})'.format(
             counter,
             total_num_repositories,
             repository["name"],
@@ -661,13 +1731,19 @@ def log_repository_install_start(
             repository.get("tool_panel_section_id") or repository.get("tool_panel_section_label"),
             repository.get("changeset_revision"),
             dt.datetime.now() - installation_start,
+            f", ETA: {eta}" if eta is not None else "",
         )
     )
 
 
-def args_to_repos(args) -> list[InstallRepoDict]:
+def args_to_repos(args, tool_list=None) -> list[InstallRepoDict]:
+    """
+    Return the repositories given on the command line.
+    ``tool_list`` is the content of ``args.tool_list_file``, if the caller loaded it already.
+    """
     if args.tool_list_file:
-        tool_list = load_yaml_file(args.tool_list_file)
+        if tool_list is None:
+            tool_list = load_tool_lists(args.tool_list_file, log=None)
         repos = tool_list["tools"]
     elif args.tool_yaml:
         repos = [yaml.safe_load(args.tool_yaml)]
@@ -687,19 +1763,139 @@ def args_to_repos(args) -> list[InstallRepoDict]:
     return repos
 
 
+def catalog_tool_shed_urls(args, tool_list=None) -> list[str]:
+    """Collect the Tool Sheds to sync into the catalog from the command line and the tools file."""
+    tool_shed_urls = list(args.catalog_tool_shed_urls or [])
+    if args.tool_list_file:
+        if tool_list is None:
+            tool_list = load_tool_lists(args.tool_list_file, log=None)
+        tool_shed_urls.extend(repo.get("tool_shed_url") or DEFAULT_TOOL_SHED_URL for repo in tool_list["tools"])
+    return tool_shed_urls or [DEFAULT_TOOL_SHED_URL]
+
+
+def write_lockfile(args, log=log, tool_list=None):
+    """Resolve the repositories given on the command line and write them to ``args.lockfile``."""
+    if tool_list is None:
+        tool_list = load_tool_lists(args.tool_list_file, log=None) if args.tool_list_file else {}
+    results = lock_repositories(
+        args_to_repos(args, tool_list=tool_list),
+        existing_lock=None if args.refresh_lock else read_lock(args.lockfile),
+        force_latest_revision=args.force_latest_revision,
+        resolution_workers=args.resolution_workers,
+        catalog=ToolShedCatalog(args.catalog) if args.catalog else None,
+        log=log,
+    )
+    if results.errored_repositories:
+        raise ToolInstallationException(
+            f"Lockfile not written, there were errors for some repositories: {results.errored_repositories}"
+        )
+    lock = {key: tool_list[key] for key in INSTALL_DEFAULT_KEYS if key in tool_list}
+    lock.update(results.lock)
+    dump_to_yaml_file(lock, args.lockfile)
+    if log:
+        log.info(
+            "Locked %d repositories in '%s' (%d resolved, %d unchanged)",
+            len(lock["tools"]),
+            args.lockfile,
+            len(results.resolved_repositories),
+            len(results.reused_repositories),
+        )
+
+
+def install_on_targets(
+    targets: list[InstallTarget],
+    repositories: list[InstallRepoDict],
+    update: bool = False,
+    target_workers: int | None = None,
+    log=log,
+    **kwargs,
+) -> dict[str, InstallResults]:
+    """
+    Install (or update, if ``update`` is set) ``repositories`` on all ``targets``, on up to
+    ``target_workers`` targets in parallel. Changeset revisions are resolved once for all targets.
+    The ``install_workers`` of a target override the ``install_workers`` in ``kwargs``.
+    Return the ``InstallResults`` by Galaxy URL.
+    """
+    kwargs["catalog"] = RevisionCache(kwargs.get("catalog"))
+
+    def install(target: InstallTarget) -> InstallResults:
+        manager = InstallRepositoryManager(galaxy_connection(target.galaxy_url, api_key=target.api_key, log=log))
+        target_kwargs = dict(kwargs)
+        if target.install_workers:
+            target_kwargs["install_workers"] = target.install_workers
+        if update:
+            return manager.update_repositories(repositories=repositories, log=log, **target_kwargs)
+        return manager.install_repositories(repositories, log=log, **target_kwargs)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=target_workers or max(len(targets), 1)) as executor:
+        futures = [executor.submit(install, target) for target in targets]
+        for target, future in zip(targets, futures):
+            try:
+                results[target.galaxy_url] = future.result()
+            except Exception as e:
+                if log:
+                    log.error("Could not install on %s: %s", target.galaxy_url, unicodify(e))
+                results[target.galaxy_url] = InstallResults(
+                    installed_repositories=[], skipped_repositories=[], errored_repositories=list(repositories)
+                )
+    if log:
+        for galaxy_url, install_results in results.items():
+            log.info(
+                "%s: %d installed, %d skipped, %d errored",
+                galaxy_url,
+                len(install_results.installed_repositories),
+                len(install_results.skipped_repositories),
+                len(install_results.errored_repositories),
+            )
+    return results
+
+
+def test_install_results(install_repository_manager, install_results, args, log=log):
+    """Run the tool tests of the repositories in ``install_results`` if requested on the command line."""
+    if install_results and args.test or args.test_existing:
+        to_be_tested_repositories = install_results.installed_repositories
+        if args.test_existing:
+            to_be_tested_repositories.extend(install_results.skipped_repositories)
+        if to_be_tested_repositories:
+            install_repository_manager.test_tools(
+                test_json=args.test_json,
+                repositories=to_be_tested_repositories,
+                log=log,
+                test_user_api_key=args.test_user_api_key,
+                test_user=args.test_user,
+                parallel_tests=args.parallel_tests,
+                client_test_config_path=args.client_test_config,
+            )
+
+
 def main(argv=None):
     disable_external_library_logging()
     args = parser().parse_args(argv)
     log = setup_global_logger(name=__name__, log_file=args.log_file, verbose=args.verbose)
-    gi = get_galaxy_connection(args, file=args.tool_list_file, log=log, login_required=True)
-    install_repository_manager = InstallRepositoryManager(gi)
-
-    repos = args_to_repos(args)
-
-    if args.tool_list_file:
-        tool_list = load_yaml_file(args.tool_list_file)
-    else:
-        tool_list = dict()
+    tool_list = load_tool_lists(args.tool_list_file, log=log) if args.tool_list_file else {}
+    configure_tool_shed_limits(tool_list.get("tool_sheds"))
+    if args.action == "catalog":
+        sync_catalog(
+            args.catalog,
+            catalog_tool_shed_urls(args, tool_list=tool_list),
+            workers=args.resolution_workers,
+            full=args.full_sync,
+            log=log,
+        )
+        return
+    elif args.action == "lock":
+        write_lockfile(args, log=log, tool_list=tool_list)
+        return
+    elif args.action == "merge-test-reports":
+        merge_test_reports(args.test_reports, args.merged_test_json)
+        log.info("Merged %d test reports into '%s'", len(args.test_reports), args.merged_test_json)
+        return
+    if args.targets and (args.journal or args.plan_only or args.test or args.test_existing):
+        raise ToolInstallationException(
+            "--journal, --plan-only, --test and --test-existing can not be used with --targets"
+        )
+    repos = args_to_repos(args, tool_list=tool_list)
 
     # Get some of the other installation arguments
     kwargs = dict(
@@ -713,14 +1909,94 @@ def main(argv=None):
 
     # Start installing/updating and store the results in install_results.
     # Or do testing if the action is `test`
+    kwargs["install_workers"] = args.install_workers
+    kwargs["adaptive_install_workers"] = args.adaptive_install_workers
+    kwargs["resolution_workers"] = args.resolution_workers
+    catalog = ToolShedCatalog(args.catalog) if args.catalog else None
+    kwargs["catalog"] = catalog
+    kwargs["journal"] = InstallJournal(args.journal) if args.journal else None
+    kwargs["dependency_order"] = args.dependency_order
+    kwargs["defer_resolver_dependencies"] = args.defer_resolver_dependencies
+    kwargs["resolver_dependency_workers"] = args.resolver_dependency_workers
+    kwargs["install_history"] = InstallHistory(args.install_history) if args.install_history else None
+    if args.action == "install" and args.since:
+        num_repositories = len(flatten_repo_info(repos))
+        repos = added_repositories(repos, load_tool_lists(args.since, log=None).get("tools", []))
+        log.info("%d of %d repositories were added since '%s'", len(repos), num_repositories, args.since)
+        # Only new entries are installed, let Galaxy skip the ones that are installed already
+        kwargs["filter_installed"] = False
+    if args.action == "update":
+        kwargs["galaxy_update_check"] = args.galaxy_update_check
+    else:
+        kwargs["force_latest_revision"] = args.force_latest_revision
+    plan = read_plan(args.plan) if args.action == "install" and args.plan else None
+    if plan:
+        # The revisions of the plan are resolved and its repositories were not installed when it was made
+        repos = plan.repositories
+        kwargs["force_latest_revision"] = False
+        kwargs["filter_installed"] = False
+        for key in ("tool_dependencies", "repository_dependencies", "resolver_dependencies"):
+            kwargs[f"default_install_{key}"] = False
+
+    if args.targets:
+        results = install_on_targets(
+            read_targets(args.targets),
+            repos,
+            update=args.action == "update",
+            target_workers=args.target_workers,
+            log=log,
+            **kwargs,
+        )
+        if args.targets_report:
+            dump_to_yaml_file(
+                {
+                    galaxy_url: {
+                        outcome: [
+                            {"name": r["name"], "owner": r["owner"], "changeset_revision": r.get("changeset_revision")}
+                            for r in repositories
+                        ]
+                        for outcome, repositories in install_results._asdict().items()
+                    }
+                    for galaxy_url, install_results in results.items()
+                },
+                args.targets_report,
+            )
+        errored = {url: r.errored_repositories for url, r in results.items() if r.errored_repositories}
+        if errored:
+            raise ToolInstallationException(f"There were errors for some repositories: {errored}")
+        return
+
+    # Galaxy connection details can only be read from a single tools file
+    tool_list_file = args.tool_list_file if args.tool_list_file and os.path.isfile(args.tool_list_file) else None
+    gi = get_galaxy_connection(args, file=tool_list_file, log=log, login_required=True)
+    install_repository_manager = InstallRepositoryManager(gi)
     install_results = None
     if args.action == "update":
         install_results = install_repository_manager.update_repositories(repositories=repos, log=log, **kwargs)
+    elif args.action == "install" and args.plan_only:
+        plan = install_repository_manager.plan_repositories(repos, log=log, **kwargs)
+        if args.plan_json:
+            write_plan(plan, args.plan_json)
+        return
     elif args.action == "install":
-        install_results = install_repository_manager.install_repositories(
-            repos, log=log, force_latest_revision=args.force_latest_revision, **kwargs
+        if plan and plan.galaxy_url and plan.galaxy_url != gi.base_url:
+            log.warning("Installing on %s a plan made for %s", gi.base_url, plan.galaxy_url)
+        install_results = install_repository_manager.install_repositories(repos, log=log, **kwargs)
+    elif args.action == "reconcile":
+        reconciler = ToolListReconciler(
+            install_repository_manager,
+            args.tool_list_dir,
+            refresh_interval=args.refresh_interval,
+            log=log,
+            **kwargs,
+        )
+        reconciler.run(
+            interval=args.reconcile_interval,
+            callback=functools.partial(test_install_results, install_repository_manager, args=args, log=log),
         )
     elif args.action == "test":
+        if args.skip_passed and not args.test_store:
+            raise ToolInstallationException("--skip-passed requires --test-store")
         install_repository_manager.test_tools(
             test_json=args.test_json,
             repositories=repos,
@@ -731,25 +2007,16 @@ def main(argv=None):
             parallel_tests=args.parallel_tests,
             test_all_versions=args.test_all_versions,
             client_test_config_path=args.client_test_config,
+            test_store=ToolTestStore(args.test_store) if args.test_store else None,
+            skip_passed_window=dt.timedelta(days=args.skip_passed_window) if args.skip_passed else None,
+            shard=args.shard,
+            test_durations=ReportedTestDurations(args.test_durations) if args.test_durations else None,
         )
     else:
         raise NotImplementedError("This point in the code should not be reached. Please contact the developers.")
 
     # Run tests on the install results if required.
-    if install_results and args.test or args.test_existing:
-        to_be_tested_repositories = install_results.installed_repositories
-        if args.test_existing:
-            to_be_tested_repositories.extend(install_results.skipped_repositories)
-        if to_be_tested_repositories:
-            install_repository_manager.test_tools(
-                test_json=args.test_json,
-                repositories=to_be_tested_repositories,
-                log=log,
-                test_user_api_key=args.test_user_api_key,
-                test_user=args.test_user,
-                parallel_tests=args.parallel_tests,
-                client_test_config_path=args.client_test_config,
-            )
+    test_install_results(install_repository_manager, install_results, args, log=log)
 
     if install_results and len(install_results.errored_repositories) > 0:
         raise ToolInstallationException(
@@ -3,9 +3,12 @@
 import argparse
 
 from .common_parser import (
+    add_log_file_argument,
+    add_verbosity_argument,
     get_common_args,
     HideUnderscoresHelpFormatter,
 )
+from .shed_tools_test_shards import parse_shard
 
 
 def parser():
@@ -30,6 +33,17 @@ def parser():
         skip_tool_dependencies=False,
         install_resolver_dependencies=False,
         force_latest_revision=False,
+        galaxy_update_check=False,
+        since=None,
+        plan_only=False,
+        plan_json=None,
+        plan=None,
+        targets=None,
+        target_workers=None,
+        targets_report=None,
+        tool_list_dir=None,
+        reconcile_interval=300,
+        refresh_interval=3600,
         test=False,
         test_user_api_key=None,
         test_user="ephemeris@galaxyproject.org",
@@ -37,6 +51,23 @@ def parser():
         test_existing=False,
         parallel_tests=1,
         client_test_config=None,
+        test_store=None,
+        skip_passed=False,
+        skip_passed_window=7.0,
+        shard=None,
+        test_durations=None,
+        install_workers=1,
+        adaptive_install_workers=False,
+        resolution_workers=8,
+        catalog=None,
+        journal=None,
+        dependency_order=False,
+        defer_resolver_dependencies=False,
+        resolver_dependency_workers=4,
+        install_history=None,
+        catalog_tool_shed_urls=None,
+        full_sync=False,
+        refresh_lock=False,
     )
 
     # SUBPARSERS
@@ -61,8 +92,41 @@ def parser():
         parents=[common_arguments],
     )
 
+    reconcile_command_parser = subparsers.add_parser(
+        "reconcile",
+        help="This keeps Galaxy converged to a directory of tool lists by installing the repositories "
+        "of changed tool lists at a regular interval. Use shed-tools reconcile --help for more information",
+        formatter_class=HideUnderscoresHelpFormatter,
+        parents=[common_arguments],
+    )
+
+    catalog_command_parser = subparsers.add_parser(
+        "catalog",
+        help="This maintains a local catalog of installable repository revisions on Tool Sheds. "
+        "Use shed-tools catalog --help for more information",
+        formatter_class=HideUnderscoresHelpFormatter,
+    )
+
+    lock_command_parser = subparsers.add_parser(
+        "lock",
+        help="This pins all repositories of a tool list to exact revisions in a lockfile. "
+        "Use shed-tools lock --help for more information",
+        formatter_class=HideUnderscoresHelpFormatter,
+    )
+
+    merge_test_reports_command_parser = subparsers.add_parser(
+        "merge-test-reports",
+        help="This merges the test reports of shed-tools test --shard runs into a single report. "
+        "Use shed-tools merge-test-reports --help for more information",
+        formatter_class=HideUnderscoresHelpFormatter,
+    )
+
     # SUBPARSER DEFAULTS
     update_command_parser.set_defaults(action="update")
+    reconcile_command_parser.set_defaults(action="reconcile")
+    catalog_command_parser.set_defaults(action="catalog")
+    lock_command_parser.set_defaults(action="lock")
+    merge_test_reports_command_parser.set_defaults(action="merge-test-reports")
 
     test_command_parser.set_defaults(action="test")
     install_command_parser.set_defaults(action="install")
@@ -72,13 +136,15 @@ def parser():
         update_command_parser,
         install_command_parser,
         test_command_parser,
+        lock_command_parser,
     ]:
         command_parser.add_argument(
             "-t",
             "--tools-file",
             "--toolsfile",
             dest="tool_list_file",
-            help="Tools file to use (see tool_list.yaml.sample)",
+            help="Tools file to use (see tool_list.yaml.sample). May also be a directory or a quoted glob pattern "
+            "of tools files, which are merged into a single tool list.",
         )
         command_parser.add_argument(
             "-y",
@@ -116,7 +182,7 @@ def parser():
 
     # OPTIONS COMMON FOR UPDATE AND INSTALL
 
-    for command_parser in [update_command_parser, install_command_parser]:
+    for command_parser in [update_command_parser, install_command_parser, reconcile_command_parser]:
         command_parser.add_argument(
             "--install-tool-dependencies",
             "--install_tool_dependencies",
@@ -144,6 +210,32 @@ def parser():
             default=False,
             help="Skip installing the repository dependencies.",
         )
+        command_parser.add_argument(
+            "--install-workers",
+            "--install_workers",
+            dest="install_workers",
+            default=1,
+            type=int,
+            help="Specify the maximum number of repositories that will be installed in parallel.",
+        )
+        command_parser.add_argument(
+            "--adaptive-install-workers",
+            "--adaptive_install_workers",
+            action="store_true",
+            dest="adaptive_install_workers",
+            help="Start with a single install and adapt the number of parallel installs to how well Galaxy keeps "
+            "up, up to --install-workers. Fewer installs run in parallel after 502 or 504 responses, dropped "
+            "connections, or when installs take much longer than recorded with --install-history.",
+        )
+        command_parser.add_argument(
+            "--resolution-workers",
+            "--resolution_workers",
+            dest="resolution_workers",
+            default=8,
+            type=int,
+            help="Specify the maximum number of concurrent Tool Shed requests used to resolve "
+            "changeset revisions of repositories without a pinned revision.",
+        )
         command_parser.add_argument(
             "--test",
             action="store_true",
@@ -192,6 +284,90 @@ def parser():
             help="Specify the maximum number of tests that will be run in parallel.",
         )
 
+        command_parser.add_argument(
+            "--catalog",
+            dest="catalog",
+            help="Resolve changeset revisions from this local catalog (see shed-tools catalog sync) "
+            "instead of querying the Tool Shed. Tool Sheds that are not in the catalog are still queried.",
+        )
+
+        command_parser.add_argument(
+            "--dependency-order",
+            "--dependency_order",
+            action="store_true",
+            dest="dependency_order",
+            help="Fetch the repository dependencies of all repositories from the Tool Shed before installing. "
+            "Missing dependencies are installed once and before the repositories that need them, "
+            "independent repositories are installed in parallel (see --install-workers).",
+        )
+        command_parser.add_argument(
+            "--defer-resolver-dependencies",
+            "--defer_resolver_dependencies",
+            action="store_true",
+            dest="defer_resolver_dependencies",
+            help="Install repositories without their resolver dependencies (e.g. conda) first, so their tools "
+            "become available quickly, and install the resolver dependencies of all new tools afterwards.",
+        )
+        command_parser.add_argument(
+            "--resolver-dependency-workers",
+            "--resolver_dependency_workers",
+            dest="resolver_dependency_workers",
+            default=4,
+            type=int,
+            help="Specify the maximum number of tools whose resolver dependencies are installed in parallel "
+            "when using --defer-resolver-dependencies.",
+        )
+        command_parser.add_argument(
+            "--install-history",
+            "--install_history",
+            dest="install_history",
+            help="Record how long each repository installation took in this SQLite file, which can be shared "
+            "between runs and Galaxy instances. Recorded durations are used to install the longest running "
+            "repositories first and to log an estimate of the remaining time.",
+        )
+        command_parser.add_argument(
+            "--journal",
+            dest="journal",
+            help="Record the resolved revision and the outcome of every repository in this append-only file. "
+            "When re-running with the same journal, repositories that were installed or skipped "
+            "in an earlier run are not processed again.",
+        )
+
+    for command_parser in [update_command_parser, install_command_parser]:
+        command_parser.add_argument(
+            "--targets",
+            dest="targets",
+            help="Install on all Galaxy instances listed in this YAML file instead of a single one. "
+            "Each entry of its targets list has a galaxy_instance URL, an api_key and optionally install_workers. "
+            "Changeset revisions are resolved once for all targets. "
+            "Can not be combined with --journal, --plan-only, --test or --test-existing.",
+        )
+        command_parser.add_argument(
+            "--target-workers",
+            "--target_workers",
+            dest="target_workers",
+            default=None,
+            type=int,
+            help="Specify the maximum number of targets installed on in parallel (default: all targets).",
+        )
+        command_parser.add_argument(
+            "--targets-report",
+            "--targets_report",
+            dest="targets_report",
+            help="Write the installed, skipped and errored repositories of every target to this YAML file.",
+        )
+
+    # OPTIONS UNIQUE TO UPDATE
+
+    update_command_parser.add_argument(
+        "--galaxy-update-check",
+        action="store_true",
+        dest="galaxy_update_check",
+        help="Let Galaxy check all installed repositories for updates in a single request and only update "
+        "the repositories for which a newer installable revision is available, "
+        "instead of resolving the latest revision of every repository on the Tool Shed.",
+    )
+
     # OPTIONS UNIQUE TO INSTALL
 
     install_command_parser.add_argument(
@@ -218,6 +394,148 @@ def parser():
         help="Will override the revisions in the tools file and always install the latest revision.",
     )
 
+    install_command_parser.add_argument(
+        "--since",
+        dest="since",
+        help="A previous version of the tools file. Only the repositories and revisions that were added "
+        "since this version are installed, and the installed repositories are not fetched from Galaxy.",
+    )
+
+    install_command_parser.add_argument(
+        "--plan-only",
+        "--plan_only",
+        action="store_true",
+        dest="plan_only",
+        help="Resolve the repositories and filter out the installed ones, but only log what would be "
+        "installed, with the number of API requests and the estimated duration (see --install-history). "
+        "Galaxy is not modified.",
+    )
+    install_command_parser.add_argument(
+        "--plan-json",
+        "--plan_json",
+        dest="plan_json",
+        help="With --plan-only, write the plan to this JSON file, which can be installed with --plan.",
+    )
+    install_command_parser.add_argument(
+        "--plan",
+        dest="plan",
+        help="Install the repositories of a plan written with --plan-only --plan-json as they are, "
+        "without resolving revisions or checking the installed repositories again.",
+    )
+
+    # OPTIONS UNIQUE TO RECONCILE
+
+    reconcile_command_parser.add_argument(
+        "--tools-dir",
+        "--tools_dir",
+        dest="tool_list_dir",
+        required=True,
+        help="Directory of tools files (*.yml or *.yaml) to keep Galaxy converged to.",
+    )
+    reconcile_command_parser.add_argument(
+        "--interval",
+        dest="reconcile_interval",
+        default=300,
+        type=float,
+        help="Seconds between checks of the tools files for changes.",
+    )
+    reconcile_command_parser.add_argument(
+        "--refresh-interval",
+        "--refresh_interval",
+        dest="refresh_interval",
+        default=3600,
+        type=float,
+        help="Seconds after which the installed repositories are fetched from Galaxy again "
+        "and all tools files are reconciled, not only the changed ones.",
+    )
+
+    # OPTIONS UNIQUE TO CATALOG
+    general_group = catalog_command_parser.add_argument_group("General options")
+    add_verbosity_argument(general_group)
+    add_log_file_argument(general_group)
+    catalog_command_parser.add_argument(
+        "catalog_command",
+        choices=["sync"],
+        help="Catalog command to run. sync updates the catalog with the current state of the Tool Sheds.",
+    )
+    catalog_command_parser.add_argument(
+        "--catalog",
+        dest="catalog",
+        required=True,
+        help="Path of the SQLite catalog file. It is created if it does not exist.",
+    )
+    catalog_command_parser.add_argument(
+        "--tool-shed",
+        "--toolshed",
+        action="append",
+        dest="catalog_tool_shed_urls",
+        metavar="TOOL_SHED_URL",
+        help="Tool Shed URL to add to the catalog. Can be given multiple times. "
+        "Defaults to the Tool Sheds used in --tools-file, or the main Tool Shed.",
+    )
+    catalog_command_parser.add_argument(
+        "-t",
+        "--tools-file",
+        "--toolsfile",
+        dest="tool_list_file",
+        help="Sync the Tool Sheds used by the repositories in this tools file.",
+    )
+    catalog_command_parser.add_argument(
+        "--full",
+        action="store_true",
+        dest="full_sync",
+        help="Re-fetch the installable revisions of all repositories, not only the ones that changed.",
+    )
+    catalog_command_parser.add_argument(
+        "--sync-workers",
+        "--sync_workers",
+        dest="resolution_workers",
+        default=8,
+        type=int,
+        metavar="SYNC_WORKERS",
+        help="Specify the maximum number of concurrent Tool Shed requests used during the sync.",
+    )
+
+    # OPTIONS UNIQUE TO LOCK
+    general_group = lock_command_parser.add_argument_group("General options")
+    add_verbosity_argument(general_group)
+    add_log_file_argument(general_group)
+    lock_command_parser.add_argument(
+        "-o",
+        "--lockfile",
+        dest="lockfile",
+        required=True,
+        help="Path of the lockfile. It is a tool list in which every repository is pinned to exact "
+        "revisions and can be installed with shed-tools install -t <lockfile>. "
+        "If the lockfile exists, entries of the tool list that did not change are not resolved again.",
+    )
+    lock_command_parser.add_argument(
+        "--latest",
+        action="store_true",
+        dest="force_latest_revision",
+        help="Lock all repositories to their latest installable revision, ignoring the revisions in the tools file.",
+    )
+    lock_command_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        dest="refresh_lock",
+        help="Resolve all entries again, even if they did not change since the existing lockfile was written.",
+    )
+    lock_command_parser.add_argument(
+        "--resolution-workers",
+        "--resolution_workers",
+        dest="resolution_workers",
+        default=8,
+        type=int,
+        help="Specify the maximum number of concurrent Tool Shed requests used to resolve changeset revisions.",
+    )
+    lock_command_parser.add_argument(
+        "--catalog",
+        dest="catalog",
+        help="Resolve changeset revisions from this local catalog (see shed-tools catalog sync) "
+        "instead of querying the Tool Shed.",
+    )
+
     # OPTIONS UNIQUE TO TEST
     # Same test_json as above but language modified for test instead of install/update.
     test_command_parser.add_argument(
@@ -280,5 +598,64 @@ def parser():
         dest="client_test_config",
         help="Annotate expectations about tools in client testing YAML " "configuration file.",
     )
+    test_command_parser.add_argument(
+        "--test-store",
+        "--test_store",
+        dest="test_store",
+        help="Record the result and duration of every test in this SQLite file, which can be shared between runs. "
+        "Unless --test-durations is given, the longest tests according to the recorded durations are started first.",
+    )
+    test_command_parser.add_argument(
+        "--skip-passed",
+        "--skip_passed",
+        action="store_true",
+        dest="skip_passed",
+        help="Do not run tests that passed on this Galaxy within --skip-passed-window days, "
+        "according to --test-store. Tests whose definition changed are run again.",
+    )
+    test_command_parser.add_argument(
+        "--skip-passed-window",
+        "--skip_passed_window",
+        dest="skip_passed_window",
+        default=7.0,
+        type=float,
+        help="Number of days a passed test is skipped for with --skip-passed.",
+    )
+    test_command_parser.add_argument(
+        "--shard",
+        dest="shard",
+        type=parse_shard,
+        metavar="INDEX/COUNT",
+        help="Only run the tests of shard INDEX (starting at 1) of COUNT, e.g. 2/4. The tests are split the same "
+        "way by all shards, balanced by the durations from --test-durations (or --test-store), which must be "
+        "the same for all shards. Merge the --test-json reports of the shards with shed-tools merge-test-reports.",
+    )
+    test_command_parser.add_argument(
+        "--test-durations",
+        "--test_durations",
+        dest="test_durations",
+        action="append",
+        metavar="TEST_JSON",
+        help="Expect tests to take as long as in this earlier --test-json report, e.g. the merged report "
+        "of the previous sharded run, and start the longest tests first. Can be given multiple times.",
+    )
+
+    # OPTIONS UNIQUE TO MERGE-TEST-REPORTS
+    general_group = merge_test_reports_command_parser.add_argument_group("General options")
+    add_verbosity_argument(general_group)
+    add_log_file_argument(general_group)
+    merge_test_reports_command_parser.add_argument(
+        "test_reports",
+        nargs="+",
+        metavar="TEST_JSON",
+        help="Test reports written by shed-tools test --test-json.",
+    )
+    merge_test_reports_command_parser.add_argument(
+        "-o",
+        "--output",
+        dest="merged_test_json",
+        required=True,
+        help="Path of the merged report, which can be turned into reports with planemo test_reports.",
+    )
 
     return shed_parser
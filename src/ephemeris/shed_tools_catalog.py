@@ -0,0 +1,220 @@
+"""
+A local SQLite catalog of the installable revisions of Tool Shed repositories.
+
+``shed-tools catalog sync`` snapshots the repositories of one or more Tool Sheds
+(name, owner and the ordered list of installable changeset revisions) into a local
+SQLite file. ``shed-tools install --catalog <file>`` and ``shed-tools update --catalog <file>``
+then resolve changeset revisions from this file without contacting the Tool Shed,
+which also allows resolving revisions on machines without access to the Tool Shed.
+
+A sync first downloads two bulk listings per Tool Shed: all repositories and all
+downloadable repository revisions. Only repositories whose set of downloadable revisions
+changed since the last sync are queried for their ordered installable revisions.
+Repositories whose revisions can not be fetched keep their previous entry (if any),
+and are fetched again by the next sync.
+"""
+
+import datetime as dt
+import json
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from galaxy.util import unicodify
+from typing_extensions import NamedTuple
+
+from .shed_tools_methods import (
+    format_tool_shed_url,
+    get_tool_shed_instance,
+)
+
+DEFAULT_CATALOG_SYNC_WORKERS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_sheds (
+    tool_shed_url TEXT PRIMARY KEY,
+    last_sync TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repositories (
+    tool_shed_url TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    repository_id TEXT NOT NULL,
+    installable_revisions TEXT NOT NULL,
+    downloadable_revisions TEXT NOT NULL,
+    PRIMARY KEY (tool_shed_url, owner, name)
+);
+"""
+
+log = logging.getLogger(__name__)
+
+
+class CatalogSyncResults(NamedTuple):
+    tool_shed_url: str
+    total_repositories: int
+    updated_repositories: int
+    removed_repositories: int
+    failed_repositories: int
+
+
+class ToolShedCatalog:
+    """Read and write access to a local catalog of installable repository revisions."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Revision resolution and syncing happen in worker threads, serialize access to the connection.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def has_tool_shed(self, tool_shed_url: str) -> bool:
+        """Return True if ``tool_shed_url`` has been synced into the catalog."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM tool_sheds WHERE tool_shed_url = ?", (format_tool_shed_url(tool_shed_url),)
+            ).fetchone()
+        return row is not None
+
+    def get_ordered_installable_revisions(self, tool_shed_url: str, name: str, owner: str) -> list[str]:
+        """
+        Return the installable revisions of a repository ordered oldest to newest,
+        or an empty list if the repository is not in the catalog.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT installable_revisions FROM repositories WHERE tool_shed_url = ? AND owner = ? AND name = ?",
+                (format_tool_shed_url(tool_shed_url), owner, name),
+            ).fetchone()
+        if row is None:
+            return []
+        return json.loads(row[0])
+
+    def sync(
+        self,
+        tool_shed_url: str,
+        workers: int = DEFAULT_CATALOG_SYNC_WORKERS,
+        full: bool = False,
+        log=log,
+    ) -> CatalogSyncResults:
+        """
+        Update the catalog with the current state of ``tool_shed_url``.
+        Unless ``full`` is set, only repositories whose downloadable revisions changed are re-fetched.
+        Repositories whose installable revisions can not be fetched are logged and keep their previous entry.
+        """
+        tool_shed_url = format_tool_shed_url(tool_shed_url)
+        ts = get_tool_shed_instance(tool_shed_url)
+        repositories = [r for r in ts.repositories.get_repositories() if not r.get("deleted")]
+        downloadable: dict[str, set[str]] = {}
+        for revision in ts.repositories.repository_revisions(downloadable=True):
+            downloadable.setdefault(revision["repository_id"], set()).add(revision["changeset_revision"])
+
+        with self._lock:
+            known = {
+                (owner, name): json.loads(revisions)
+                for owner, name, revisions in self._connection.execute(
+                    "SELECT owner, name, downloadable_revisions FROM repositories WHERE tool_shed_url = ?",
+                    (tool_shed_url,),
+                )
+            }
+        changed = []
+        for repository in repositories:
+            revisions = sorted(downloadable.get(repository["id"], ()))
+            key = (repository["owner"], repository["name"])
+            if full or known.get(key) != revisions:
+                changed.append((repository, revisions))
+        if log:
+            log.info(
+                "Tool Shed %s lists %d repositories, fetching installable revisions of %d",
+                tool_shed_url,
+                len(repositories),
+                len(changed),
+            )
+
+        def fetch(repository) -> list[str] | None:
+            try:
+                return ts.repositories.get_ordered_installable_revisions(repository["name"], repository["owner"])
+            except Exception as e:
+                if log:
+                    log.warning(
+                        "Could not fetch the installable revisions of %s/%s from %s: %s",
+                        repository["owner"],
+                        repository["name"],
+                        tool_shed_url,
+                        unicodify(e),
+                    )
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            ordered_revisions = list(executor.map(fetch, (repository for repository, _ in changed)))
+        fetched = [
+            (repository, revisions, installable_revisions)
+            for (repository, revisions), installable_revisions in zip(changed, ordered_revisions)
+            if installable_revisions is not None
+        ]
+
+        current = {(r["owner"], r["name"]) for r in repositories}
+        removed = [key for key in known if key not in current]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO repositories VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        tool_shed_url,
+                        repository["owner"],
+                        repository["name"],
+                        repository["id"],
+                        json.dumps(installable_revisions),
+                        json.dumps(revisions),
+                    )
+                    for repository, revisions, installable_revisions in fetched
+                ),
+            )
+            self._connection.executemany(
+                "DELETE FROM repositories WHERE tool_shed_url = ? AND owner = ? AND name = ?",
+                ((tool_shed_url, owner, name) for owner, name in removed),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO tool_sheds VALUES (?, ?)", (tool_shed_url, dt.datetime.now().isoformat())
+            )
+        return CatalogSyncResults(
+            tool_shed_url=tool_shed_url,
+            total_repositories=len(repositories),
+            updated_repositories=len(fetched),
+            removed_repositories=len(removed),
+            failed_repositories=len(changed) - len(fetched),
+        )
+
+
+def sync_catalog(
+    path: str,
+    tool_shed_urls: Iterable[str],
+    workers: int = DEFAULT_CATALOG_SYNC_WORKERS,
+    full: bool = False,
+    log=log,
+) -> list[CatalogSyncResults]:
+    """Sync all ``tool_shed_urls`` into the catalog at ``path``."""
+    catalog = ToolShedCatalog(path)
+    try:
+        results = []
+        for tool_shed_url in sorted({format_tool_shed_url(url) for url in tool_shed_urls}):
+            result = catalog.sync(tool_shed_url, workers=workers, full=full, log=log)
+            if log:
+                log.info(
+                    "Synced %s: %d repositories, %d updated, %d removed, %d failed",
+                    result.tool_shed_url,
+                    result.total_repositories,
+                    result.updated_repositories,
+                    result.removed_repositories,
+                    result.failed_repositories,
+                )
+            results.append(result)
+        return results
+    finally:
+        catalog.close()
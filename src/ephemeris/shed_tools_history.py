@@ -0,0 +1,89 @@
+"""
+A local SQLite store of how long repository installations took.
+
+Durations are keyed by Tool Shed, owner, name and changeset revision, and do not depend
+on the Galaxy instance, so that one store can be shared between runs and instances.
+``shed-tools install --install-history <file>`` uses it to start the longest installs first
+and to estimate the remaining run time.
+"""
+
+import datetime as dt
+import sqlite3
+import threading
+from typing import TYPE_CHECKING
+
+from .shed_tools_methods import tool_shed_key
+
+if TYPE_CHECKING:
+    from .shed_tools import InstallRepoDict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS install_durations (
+    tool_shed TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    changeset_revision TEXT NOT NULL,
+    galaxy_url TEXT,
+    seconds REAL NOT NULL,
+    recorded TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS install_durations_repository ON install_durations (tool_shed, owner, name);
+"""
+
+
+class InstallHistory:
+    """Record and look up the wall time of repository installations."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def record(self, repository: "InstallRepoDict", seconds: float, galaxy_url: str | None = None):
+        """Record that installing ``repository`` took ``seconds``."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO install_durations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    tool_shed_key(repository["tool_shed_url"]),
+                    repository["owner"],
+                    repository["name"],
+                    repository["changeset_revision"],
+                    galaxy_url,
+                    seconds,
+                    dt.datetime.now().isoformat(),
+                ),
+            )
+
+    def expected_duration(self, repository: "InstallRepoDict") -> float | None:
+        """
+        Return the average install duration of the revision of ``repository``, falling back to the
+        average of all revisions of the repository. Return None for repositories never installed.
+        """
+        key = (tool_shed_key(repository["tool_shed_url"]), repository["owner"], repository["name"])
+        with self._lock:
+            revision_average, repository_average = self._connection.execute(
+                "SELECT AVG(CASE WHEN changeset_revision = ? THEN seconds END), AVG(seconds) FROM install_durations "
+                "WHERE tool_shed = ? AND owner = ? AND name = ?",
+                (repository.get("changeset_revision"), *key),
+            ).fetchone()
+        return revision_average if revision_average is not None else repository_average
+
+    def expected_durations(self, repositories: list["InstallRepoDict"]) -> list[float] | None:
+        """
+        Return the expected install duration of each of ``repositories``.
+        Repositories without history are expected to take the average of the others.
+        Return None if none of the ``repositories`` has a history, as their durations are unknown.
+        """
+        durations = [self.expected_duration(repository) for repository in repositories]
+        known = [duration for duration in durations if duration is not None]
+        if durations and not known:
+            return None
+        default = sum(known) / len(known) if known else 0.0
+        return [default if duration is None else duration for duration in durations]
@@ -0,0 +1,125 @@
+"""
+An append-only journal of the progress of ``shed-tools install`` and ``shed-tools update``.
+
+Every line of the journal is a JSON object recording one of
+
+* the changeset revision a repository was resolved to (``resolved``),
+* the final outcome of a repository installation (``outcome``),
+* the time spent in a phase of the run (``phase``).
+
+When a run is restarted with the same journal, repositories that were installed or skipped
+by an earlier run are not processed again, and repositories that were resolved but not
+installed are installed at their journaled revision without contacting the Tool Shed.
+Repositories installed with deferred resolver dependencies are only completed once their
+resolver dependencies are installed, until then their outcome is ``resolver_dependencies_pending``
+and a restarted run installs the resolver dependencies again.
+"""
+
+import datetime as dt
+import json
+import logging
+import threading
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
+
+from .shed_tools_methods import format_tool_shed_url
+
+if TYPE_CHECKING:
+    from .shed_tools import InstallRepoDict
+
+COMPLETED_OUTCOMES = {"installed", "skipped"}
+RESOLVER_DEPENDENCIES_PENDING = "resolver_dependencies_pending"
+
+log = logging.getLogger(__name__)
+
+
+def journal_key(repository: "InstallRepoDict", default_toolshed: str, force_latest_revision: bool) -> str:
+    """
+    Identify a flattened repository entry of a tool list, before its revision is resolved.
+    """
+    return json.dumps(
+        [
+            format_tool_shed_url(repository.get("tool_shed_url") or default_toolshed),
+            repository["owner"],
+            repository["name"],
+            repository.get("changeset_revision"),
+            repository.get("tool_panel_section_id"),
+            repository.get("tool_panel_section_label"),
+            force_latest_revision,
+        ]
+    )
+
+
+class InstallJournal:
+    """Read the state of an existing journal and append new records to it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.resolved: dict[str, InstallRepoDict] = {}
+        self.outcomes: dict[str, str] = {}
+        self._lock = threading.Lock()
+        terminated = True
+        try:
+            with open(path) as f:
+                for line in f:
+                    terminated = line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A run that was killed while writing may leave a truncated last line
+                        log.warning("Ignoring invalid line in install journal %s", path)
+                        continue
+                    if record["event"] == "resolved":
+                        self.resolved[record["key"]] = record["repository"]
+                    elif record["event"] == "outcome":
+                        self.outcomes[record["key"]] = record["outcome"]
+        except FileNotFoundError:
+            pass
+        self._file = open(path, "a")
+        if not terminated:
+            self._file.write("\n")
+
+    def is_completed(self, key: str) -> bool:
+        return self.outcomes.get(key) in COMPLETED_OUTCOMES
+
+    def resolver_dependencies_pending(self, key: str) -> bool:
+        return self.outcomes.get(key) == RESOLVER_DEPENDENCIES_PENDING
+
+    def record_resolved(self, key: str, repository: "InstallRepoDict"):
+        self.resolved[key] = repository
+        self._write({"event": "resolved", "key": key, "repository": repository})
+
+    def record_outcome(self, key: str, repository: "InstallRepoDict", outcome: str):
+        self.outcomes[key] = outcome
+        self._write(
+            {
+                "event": "outcome",
+                "key": key,
+                "name": repository["name"],
+                "owner": repository["owner"],
+                "changeset_revision": repository.get("changeset_revision"),
+                "outcome": outcome,
+            }
+        )
+
+    def record_phase(self, phase: str, start: dt.datetime, repositories: int):
+        self._write(
+            {
+                "event": "phase",
+                "phase": phase,
+                "seconds": (dt.datetime.now() - start).total_seconds(),
+                "repositories": repositories,
+            }
+        )
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _write(self, record: dict[str, Any]):
+        record["time"] = dt.datetime.now().isoformat()
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
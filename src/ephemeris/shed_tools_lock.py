@@ -0,0 +1,138 @@
+"""
+Produce a lockfile from a tool list, in which every repository is pinned to exact changeset revisions.
+
+The lockfile is a regular tool list, so ``shed-tools install -t <lockfile>`` installs
+exactly the locked revisions without resolving them on the Tool Shed.
+In addition to the ``tools``, the lockfile contains ``input_hashes``, a hash of each
+tool list entry the corresponding locked entry was produced from. When re-locking,
+entries whose hash did not change are taken from the existing lockfile and not resolved again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
+
+from galaxy.util import unicodify
+from typing_extensions import NamedTuple
+
+from . import load_yaml_file
+from .shed_tools_methods import (
+    DEFAULT_TOOL_SHED_URL,
+    flatten_repo_info,
+    format_tool_shed_url,
+    get_changeset_revisions,
+)
+
+if TYPE_CHECKING:
+    from .shed_tools import InstallRepoDict
+    from .shed_tools_catalog import ToolShedCatalog
+
+# Top level keys of a tool list that are copied to the lockfile
+INSTALL_DEFAULT_KEYS = [
+    "install_tool_dependencies",
+    "install_repository_dependencies",
+    "install_resolver_dependencies",
+]
+
+log = logging.getLogger(__name__)
+
+
+class LockResults(NamedTuple):
+    lock: dict[str, Any]
+    resolved_repositories: list["InstallRepoDict"]
+    reused_repositories: list["InstallRepoDict"]
+    errored_repositories: list["InstallRepoDict"]
+
+
+def input_hash(repository: "InstallRepoDict", default_toolshed: str, force_latest_revision: bool) -> str:
+    """Hash a tool list entry together with the settings that influence how it is resolved."""
+    return hashlib.sha256(
+        json.dumps([repository, default_toolshed, force_latest_revision], sort_keys=True).encode()
+    ).hexdigest()
+
+
+def read_lock(path: str) -> dict[str, "InstallRepoDict"]:
+    """Return the locked entries of the lockfile at ``path`` by input hash."""
+    if not os.path.exists(path):
+        return {}
+    lock = load_yaml_file(path) or {}
+    return dict(zip(lock.get("input_hashes", []), lock.get("tools", [])))
+
+
+def lock_repositories(
+    repositories: list["InstallRepoDict"],
+    existing_lock: dict[str, "InstallRepoDict"] | None = None,
+    default_toolshed: str = DEFAULT_TOOL_SHED_URL,
+    force_latest_revision: bool = False,
+    resolution_workers: int = 8,
+    catalog: "ToolShedCatalog | None" = None,
+    log=log,
+) -> LockResults:
+    """
+    Pin every entry of ``repositories`` to exact changeset revisions.
+    Entries found in ``existing_lock`` (see ``read_lock``) are reused without resolving them.
+    """
+    existing_lock = existing_lock or {}
+    default_toolshed = format_tool_shed_url(default_toolshed)
+    hashes = [input_hash(repository, default_toolshed, force_latest_revision) for repository in repositories]
+    to_resolve = [
+        (index, repository)
+        for index, (repository, repository_hash) in enumerate(zip(repositories, hashes))
+        if repository_hash not in existing_lock
+    ]
+
+    def resolve(repository: "InstallRepoDict") -> "InstallRepoDict":
+        locked = repository.copy()
+        locked["tool_shed_url"] = format_tool_shed_url(repository.get("tool_shed_url") or default_toolshed)
+        revisions: list[str] = []
+        for flattened in flatten_repo_info([locked]):
+            revision = get_changeset_revisions(flattened, force_latest_revision=force_latest_revision, catalog=catalog)[
+                "changeset_revision"
+            ]
+            if revision and revision not in revisions:
+                revisions.append(revision)
+        locked.pop("changeset_revision", None)
+        locked["revisions"] = revisions
+        return locked
+
+    with ThreadPoolExecutor(max_workers=max(resolution_workers, 1)) as executor:
+        futures = [executor.submit(resolve, repository) for _, repository in to_resolve]
+
+    locked_tools: dict[int, InstallRepoDict] = {
+        index: existing_lock[repository_hash]
+        for index, repository_hash in enumerate(hashes)
+        if repository_hash in existing_lock
+    }
+    reused_repositories = list(locked_tools.values())
+    resolved_repositories = []
+    errored_repositories = []
+    for (index, repository), future in zip(to_resolve, futures):
+        try:
+            locked_tools[index] = future.result()
+            resolved_repositories.append(locked_tools[index])
+        except Exception as e:
+            if log:
+                log.error(
+                    "Could not lock repository %s from owner %s: %s",
+                    repository.get("name"),
+                    repository.get("owner"),
+                    unicodify(e),
+                )
+            errored_repositories.append(repository)
+    indices = sorted(locked_tools)
+    lock = {
+        "tools": [locked_tools[index] for index in indices],
+        "input_hashes": [hashes[index] for index in indices],
+    }
+    return LockResults(
+        lock=lock,
+        resolved_repositories=resolved_repositories,
+        reused_repositories=reused_repositories,
+        errored_repositories=errored_repositories,
+    )
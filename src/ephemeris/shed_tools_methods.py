@@ -1,10 +1,24 @@
-from collections.abc import Iterable
-from typing import TYPE_CHECKING
+import re
+import sys
+import threading
+import time
+from collections.abc import (
+    Iterable,
+    Iterator,
+)
+from contextlib import contextmanager
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
 
+import requests
 from bioblend.toolshed import ToolShedInstance
+from typing_extensions import NamedTuple
 
 if TYPE_CHECKING:
     from .shed_tools import InstallRepoDict
+    from .shed_tools_catalog import ToolShedCatalog
 
 
 VALID_KEYS = [
@@ -19,36 +33,287 @@ VALID_KEYS = [
     "install_tool_dependencies",
 ]
 
+DEFAULT_TOOL_SHED_URL = "https://toolshed.g2.bx.psu.edu/"
 
-def complete_repo_information(
-    tool: "InstallRepoDict",
+# Maximum number of keep-alive connections kept open per Tool Shed.
+TOOL_SHED_CONNECTION_POOL_SIZE = 10
+
+# Tool Shed responses that are retried, after the delay in their Retry-After header if given
+TOOL_SHED_RETRY_STATUS_CODES = {429, 503}
+TOOL_SHED_MAX_RETRIES = 5
+TOOL_SHED_MAX_RETRY_DELAY = 60.0
+
+_tool_shed_instances: dict[str, ToolShedInstance] = {}
+_tool_shed_instances_lock = threading.Lock()
+_tool_shed_limiters: dict[str, "ToolShedLimiter"] = {}
+_tool_shed_limiters_lock = threading.Lock()
+
+
+class ToolShedLimiter:
+    """
+    Limits the requests sent to one Tool Shed: at most ``requests_per_second`` on average,
+    with bursts of up to ``burst`` requests (a token bucket), and at most ``max_concurrency``
+    requests at the same time. Limits that are None are not enforced.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float | None = None,
+        burst: int | None = None,
+        max_concurrency: int | None = None,
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = burst or max(int(requests_per_second or 1), 1)
+        self.max_concurrency = max_concurrency
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def throttle(self):
+        """
+        Wait until a request may be sent at the configured rate, without counting it as running.
+        Used for requests that only reach the Tool Shed through Galaxy, like installs, which would
+        otherwise hold one of the ``max_concurrency`` slots until Galaxy finished installing.
+        """
+        if not self.requests_per_second:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._tokens + (now - self._updated) * self.requests_per_second, self.burst)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.requests_per_second
+            time.sleep(delay)
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        """Wait until a request may be sent, and count it as running until the block exits."""
+        if self._semaphore:
+            self._semaphore.acquire()
+        try:
+            self.throttle()
+            yield
+        finally:
+            if self._semaphore:
+                self._semaphore.release()
+
+
+def configure_tool_shed_limits(tool_sheds: dict[str, dict[str, Any]] | None):
+    """
+    Set the limits of Tool Sheds from the ``tool_sheds`` section of a tool list, e.g.::
+
+        tool_sheds:
+          https://toolshed.g2.bx.psu.edu:
+            requests_per_second: 5
+            burst: 10
+            max_concurrency: 4
+    """
+    for tool_shed_url, limits in (tool_sheds or {}).items():
+        limiter = ToolShedLimiter(
+            requests_per_second=limits.get("requests_per_second"),
+            burst=limits.get("burst"),
+            max_concurrency=limits.get("max_concurrency"),
+        )
+        with _tool_shed_limiters_lock:
+            _tool_shed_limiters[tool_shed_key(tool_shed_url)] = limiter
+
+
+def get_tool_shed_limiter(tool_shed_url: str) -> ToolShedLimiter:
+    """Return the limiter for ``tool_shed_url``, which does not limit anything unless configured."""
+    key = tool_shed_key(tool_shed_url)
+    with _tool_shed_limiters_lock:
+        if key not in _tool_shed_limiters:
+            _tool_shed_limiters[key] = ToolShedLimiter()
+        return _tool_shed_limiters[key]
+
+
+def retry_delay(response: requests.Response, attempt: int) -> float:
+    """Return how long to wait before retrying a throttled request."""
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), TOOL_SHED_MAX_RETRY_DELAY)
+    return min(2.0**attempt, TOOL_SHED_MAX_RETRY_DELAY)
+
+
+class PooledToolShedInstance(ToolShedInstance):
+    """
+    A ToolShedInstance that sends all GET requests through one ``requests.Session``,
+    so that connections (and TLS sessions) to the Tool Shed are kept alive and reused.
+    The session may be shared between threads.
+    Requests are subject to the ``ToolShedLimiter`` of the Tool Shed, and retried when
+    the Tool Shed responds that it is throttling requests or temporarily unavailable.
+    """
+
+    def __init__(self, url: str, pool_size: int = TOOL_SHED_CONNECTION_POOL_SIZE, **kwargs):
+        super().__init__(url=url, **kwargs)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def make_get_request(self, url: str, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        limiter = get_tool_shed_limiter(self.base_url)
+        attempt = 0
+        while True:
+            with limiter.request():
+                response = self.session.get(url, headers=self.json_headers, **kwargs)
+            if response.status_code not in TOOL_SHED_RETRY_STATUS_CODES or attempt == TOOL_SHED_MAX_RETRIES:
+                return response
+            time.sleep(retry_delay(response, attempt))
+            attempt += 1
+
+
+def get_tool_shed_instance(tool_shed_url: str) -> ToolShedInstance:
+    """
+    Return the pooled ToolShedInstance for ``tool_shed_url``, creating it on first use.
+    """
+    tool_shed_url = format_tool_shed_url(tool_shed_url)
+    with _tool_shed_instances_lock:
+        if tool_shed_url not in _tool_shed_instances:
+            _tool_shed_instances[tool_shed_url] = PooledToolShedInstance(url=tool_shed_url)
+        return _tool_shed_instances[tool_shed_url]
+
+
+def _intern(value: str | None) -> str | None:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class RepositoryRevision(NamedTuple):
+    """
+    A compact, immutable record of one revision of a repository in a tool list.
+
+    Used instead of ``InstallRepoDict`` while processing large tool lists, the Tool Shed,
+    owner and name strings are interned so that they are shared by all records.
+    Convert with ``from_dict`` and ``to_dict`` where repositories are passed in or out.
+    """
+
+    name: str
+    owner: str
+    tool_shed_url: str | None = None
+    changeset_revision: str | None = None
+    tool_panel_section_id: str | None = None
+    tool_panel_section_label: str | None = None
+    install_repository_dependencies: bool | None = None
+    install_resolver_dependencies: bool | None = None
+    install_tool_dependencies: bool | None = None
+
+    @classmethod
+    def from_dict(cls, repository: "InstallRepoDict") -> "RepositoryRevision":
+        return cls(
+            name=sys.intern(repository["name"]),
+            owner=sys.intern(repository["owner"]),
+            tool_shed_url=_intern(repository.get("tool_shed_url")),
+            changeset_revision=repository.get("changeset_revision"),
+            tool_panel_section_id=_intern(repository.get("tool_panel_section_id")),
+            tool_panel_section_label=_intern(repository.get("tool_panel_section_label")),
+            install_repository_dependencies=repository.get("install_repository_dependencies"),
+            install_resolver_dependencies=repository.get("install_resolver_dependencies"),
+            install_tool_dependencies=repository.get("install_tool_dependencies"),
+        )
+
+    def to_dict(self) -> "InstallRepoDict":
+        """Return the repository as ``InstallRepoDict``, without the keys that are not set."""
+        repository: InstallRepoDict = dict(name=self.name, owner=self.owner)
+        if self.tool_shed_url is not None:
+            repository["tool_shed_url"] = self.tool_shed_url
+        if self.changeset_revision is not None:
+            repository["changeset_revision"] = self.changeset_revision
+        if self.tool_panel_section_id is not None:
+            repository["tool_panel_section_id"] = self.tool_panel_section_id
+        if self.tool_panel_section_label is not None:
+            repository["tool_panel_section_label"] = self.tool_panel_section_label
+        if self.install_repository_dependencies is not None:
+            repository["install_repository_dependencies"] = self.install_repository_dependencies
+        if self.install_resolver_dependencies is not None:
+            repository["install_resolver_dependencies"] = self.install_resolver_dependencies
+        if self.install_tool_dependencies is not None:
+            repository["install_tool_dependencies"] = self.install_tool_dependencies
+        return repository
+
+    def to_install_dict(self) -> "InstallRepoDict":
+        """
+        Return a completed repository as ``InstallRepoDict`` with all keys ``complete_repo_information``
+        returns, also if their value is None: the section label if it is set, the section id otherwise.
+        """
+        repository: InstallRepoDict = dict(name=self.name, owner=self.owner)
+        if self.tool_shed_url is not None:
+            repository["tool_shed_url"] = self.tool_shed_url
+        repository["changeset_revision"] = self.changeset_revision
+        repository["install_repository_dependencies"] = bool(self.install_repository_dependencies)
+        repository["install_resolver_dependencies"] = bool(self.install_resolver_dependencies)
+        repository["install_tool_dependencies"] = bool(self.install_tool_dependencies)
+        if self.tool_panel_section_label:
+            repository["tool_panel_section_label"] = self.tool_panel_section_label
+        else:
+            repository["tool_panel_section_id"] = self.tool_panel_section_id
+        return repository
+
+
+def flatten_repository_revisions(repositories: Iterable["InstallRepoDict"]) -> list[RepositoryRevision]:
+    """Like ``flatten_repo_info``, but return one ``RepositoryRevision`` per repository revision."""
+    flattened: list[RepositoryRevision] = []
+    for repository in repositories:
+        record = RepositoryRevision.from_dict(repository)
+        revisions = repository.get("revisions")
+        if revisions:
+            flattened.extend(record._replace(changeset_revision=revision) for revision in revisions)
+        else:
+            flattened.append(record)
+    return flattened
+
+
+def complete_repository_revision(
+    repository: RepositoryRevision,
     default_toolshed_url: str,
     default_install_tool_dependencies: bool,
     default_install_repository_dependencies: bool,
     default_install_resolver_dependencies: bool,
     force_latest_revision,
-) -> "InstallRepoDict":
-    tool["tool_shed_url"] = format_tool_shed_url(tool.get("tool_shed_url") or default_toolshed_url)
-    tool = get_changeset_revisions(tool, force_latest_revision=force_latest_revision)
-    repo: InstallRepoDict = dict(
-        name=tool["name"],
-        owner=tool["owner"],
-        tool_shed_url=tool["tool_shed_url"],
-        changeset_revision=tool.get("changeset_revision"),
-        install_repository_dependencies=tool.get("install_repository_dependencies")
+    catalog: "ToolShedCatalog | None" = None,
+) -> RepositoryRevision:
+    """``complete_repo_information`` for a ``RepositoryRevision``."""
+    tool_shed_url = sys.intern(format_tool_shed_url(repository.tool_shed_url or default_toolshed_url))
+    changeset_revision = repository.changeset_revision
+    if changeset_revision is None or force_latest_revision:
+        changeset_revision = get_latest_installable_revision(
+            tool_shed_url, repository.name, repository.owner, catalog=catalog
+        )
+    return repository._replace(
+        tool_shed_url=tool_shed_url,
+        changeset_revision=changeset_revision,
+        install_repository_dependencies=repository.install_repository_dependencies
         or default_install_repository_dependencies,
-        install_resolver_dependencies=tool.get("install_resolver_dependencies")
-        or default_install_resolver_dependencies,
-        install_tool_dependencies=tool.get("install_tool_dependencies") or default_install_tool_dependencies,
+        install_resolver_dependencies=repository.install_resolver_dependencies or default_install_resolver_dependencies,
+        install_tool_dependencies=repository.install_tool_dependencies or default_install_tool_dependencies,
+        # A section label takes precedence over a section id
+        tool_panel_section_id=None if repository.tool_panel_section_label else repository.tool_panel_section_id,
     )
-    # We need those values. Throw a KeyError when not present
-    tool_panel_section_label = tool.get("tool_panel_section_label")
-    if tool_panel_section_label:
-        repo["tool_panel_section_label"] = tool_panel_section_label
-    else:
-        repo["tool_panel_section_id"] = tool.get("tool_panel_section_id")
 
-    return repo
+
+def complete_repo_information(
+    tool: "InstallRepoDict",
+    default_toolshed_url: str,
+    default_install_tool_dependencies: bool,
+    default_install_repository_dependencies: bool,
+    default_install_resolver_dependencies: bool,
+    force_latest_revision,
+    catalog: "ToolShedCatalog | None" = None,
+) -> "InstallRepoDict":
+    return complete_repository_revision(
+        RepositoryRevision.from_dict(tool),
+        default_toolshed_url=default_toolshed_url,
+        default_install_tool_dependencies=default_install_tool_dependencies,
+        default_install_repository_dependencies=default_install_repository_dependencies,
+        default_install_resolver_dependencies=default_install_resolver_dependencies,
+        force_latest_revision=force_latest_revision,
+        catalog=catalog,
+    ).to_install_dict()
 
 
 def format_tool_shed_url(tool_shed_url: str) -> str:
@@ -60,27 +325,95 @@ def format_tool_shed_url(tool_shed_url: str) -> str:
     return formatted_tool_shed_url
 
 
-def get_changeset_revisions(repository: "InstallRepoDict", force_latest_revision: bool = False):
+def tool_shed_key(tool_shed_url: str) -> str:
+    """
+    Return ``tool_shed_url`` without scheme and trailing slash, which is how Galaxy
+    reports the Tool Shed of installed repositories. Used to compare Tool Shed URLs.
+    """
+    return re.sub(r"^https?://", "", tool_shed_url).rstrip("/")
+
+
+def get_changeset_revisions(
+    repository: "InstallRepoDict",
+    force_latest_revision: bool = False,
+    catalog: "ToolShedCatalog | None" = None,
+):
     """
     Select the correct changeset revision for a repository,
     and make sure the repository exists
     (i.e a request to the tool shed with name and owner returns a list of revisions).
+    If the repository's tool shed has been synced into ``catalog``, the revisions
+    are looked up in the catalog instead of the tool shed.
     Return repository or None, if the repository could not be found on the specified tool shed.
     """
     # Do not connect to the internet when not necessary
     if repository.get("changeset_revision") is None or force_latest_revision:
-        ts = ToolShedInstance(url=repository["tool_shed_url"])
-        # Get the set revision or set it to the latest installable revision
-        installable_revisions = ts.repositories.get_ordered_installable_revisions(
-            repository["name"], repository["owner"]
+        repository["changeset_revision"] = get_latest_installable_revision(
+            repository["tool_shed_url"], repository["name"], repository["owner"], catalog=catalog
         )
-        if not installable_revisions:  #
-            raise LookupError(f"Repo does not exist in tool shed: {repository}")
-        repository["changeset_revision"] = installable_revisions[-1]
 
     return repository
 
 
+def get_latest_installable_revision(
+    tool_shed_url: str, name: str, owner: str, catalog: "ToolShedCatalog | None" = None
+) -> str:
+    """
+    Return the latest installable revision of a repository, from ``catalog`` if it contains the tool shed.
+    Raise LookupError if the repository does not exist.
+    """
+    repository = dict(name=name, owner=owner, tool_shed_url=tool_shed_url)
+    if catalog is not None and catalog.has_tool_shed(tool_shed_url):
+        installable_revisions = catalog.get_ordered_installable_revisions(tool_shed_url, name, owner)
+        if not installable_revisions:
+            raise LookupError(f"Repo does not exist in tool shed catalog {catalog.path}: {repository}")
+    else:
+        ts = get_tool_shed_instance(tool_shed_url)
+        installable_revisions = ts.repositories.get_ordered_installable_revisions(name, owner)
+        if not installable_revisions:
+            raise LookupError(f"Repo does not exist in tool shed: {repository}")
+    return installable_revisions[-1]
+
+
+def get_repository_dependencies(
+    repository: "InstallRepoDict",
+) -> list[tuple["InstallRepoDict", "InstallRepoDict"]]:
+    """
+    Get the repository dependency graph of a repository revision from the tool shed.
+    Return a list of (dependent, dependency) pairs, covering dependencies of dependencies as well.
+    Dependencies that are only needed to compile tool dependencies are left out.
+    """
+    changeset_revision = repository.get("changeset_revision")
+    assert changeset_revision, f"Repository {repository} has no changeset revision"
+    ts = get_tool_shed_instance(repository["tool_shed_url"])
+    install_info = ts.repositories.get_repository_revision_install_info(
+        repository["name"], repository["owner"], changeset_revision
+    )
+    edges = []
+    for repo_info_tuple in install_info[2].values():
+        # (description, clone url, changeset_revision, ctx_rev, owner, repository_dependencies, tool_dependencies)
+        repository_dependencies = repo_info_tuple[5] or {}
+        for dependent_key, dependencies in repository_dependencies.items():
+            if dependent_key in ("root_key", "description"):
+                continue
+            dependent = _repository_from_dependency(dependent_key.split(","))
+            for dependency in dependencies:
+                only_if_compiling_contained_td = str(dependency[5]) if len(dependency) > 5 else "False"
+                if only_if_compiling_contained_td != "True":
+                    edges.append((dependent, _repository_from_dependency(dependency)))
+    return edges
+
+
+def _repository_from_dependency(dependency: list[str]) -> "InstallRepoDict":
+    tool_shed_url, name, owner, changeset_revision = dependency[:4]
+    return {
+        "tool_shed_url": format_tool_shed_url(tool_shed_url),
+        "name": name,
+        "owner": owner,
+        "changeset_revision": changeset_revision,
+    }
+
+
 def flatten_repo_info(
     repositories: Iterable["InstallRepoDict"],
 ) -> list["InstallRepoDict"]:
@@ -116,3 +449,27 @@ def flatten_repo_info(
         else:  # Revision was not defined at all
             flattened_list.append(new_repo_info)
     return flattened_list
+
+
+def added_repositories(
+    repositories: Iterable["InstallRepoDict"],
+    previous_repositories: Iterable["InstallRepoDict"],
+    default_toolshed: str = DEFAULT_TOOL_SHED_URL,
+) -> list["InstallRepoDict"]:
+    """
+    Compare two versions of a tool list and return the flattened entries of ``repositories``
+    whose repository and revision are not in ``previous_repositories``.
+    An entry without revision is only returned if the previous version had no entry without
+    revision for that repository.
+    """
+
+    def key(repository: "InstallRepoDict") -> tuple[str, str, str, str | None]:
+        return (
+            tool_shed_key(repository.get("tool_shed_url") or default_toolshed),
+            repository["owner"],
+            repository["name"],
+            repository.get("changeset_revision"),
+        )
+
+    previous = {key(repository) for repository in flatten_repo_info(previous_repositories)}
+    return [repository for repository in flatten_repo_info(repositories) if key(repository) not in previous]
@@ -0,0 +1,95 @@
+"""
+Review the installs of a tool list before performing them.
+
+``shed-tools install --plan-only --plan-json plan.json`` resolves the changeset revisions of
+all repositories and filters the installed ones out like a normal install, but does not
+install anything. The plan lists the exact repository revisions that would be installed,
+the number of API requests installing them takes, and an estimate of how long that takes,
+based on the durations recorded with ``--install-history``. Without a history of any of the
+repositories, ``estimated_seconds`` is null: the duration is unknown. A plan looks like::
+
+    {
+      "galaxy_url": "https://galaxy.example.org",
+      "created": "2024-05-02T10:15:00",
+      "install_workers": 4,
+      "api_calls": {"galaxy": 2, "tool_shed": 0, "total": 2},
+      "estimated_seconds": 340.0,
+      "repositories": [{"name": "bwa", "owner": "devteam", "changeset_revision": "...", ...}, ...],
+      "skipped_repositories": [...],
+      "errored_repositories": [...]
+    }
+
+``shed-tools install --plan plan.json`` installs the repositories of the plan as they are,
+without resolving revisions or fetching the installed repositories again. Plans can be split
+into smaller plans to install large changes in several maintenance windows.
+"""
+
+import datetime as dt
+import heapq
+import json
+from typing import TYPE_CHECKING
+
+from typing_extensions import NamedTuple
+
+if TYPE_CHECKING:
+    from .shed_tools import InstallRepoDict
+
+
+class InstallPlan(NamedTuple):
+    galaxy_url: str | None
+    install_workers: int
+    repositories: list["InstallRepoDict"]
+    skipped_repositories: list["InstallRepoDict"]
+    errored_repositories: list["InstallRepoDict"]
+    api_calls: dict[str, int]
+    estimated_seconds: float | None
+
+
+def count_api_calls(
+    repositories: list["InstallRepoDict"],
+    dependency_order: bool = False,
+    defer_resolver_dependencies: bool = False,
+) -> dict[str, int]:
+    """
+    Count the requests to Galaxy and to the Tool Shed that installing ``repositories`` takes.
+    Waiting for installs that time out and installing deferred resolver dependencies take
+    additional requests, which depend on the installs and are not counted.
+    """
+    galaxy = len(repositories)
+    if defer_resolver_dependencies and any(r.get("install_resolver_dependencies") for r in repositories):
+        # Listing the tools of the installed repositories
+        galaxy += 1
+    tool_shed = len([r for r in repositories if r.get("install_repository_dependencies")]) if dependency_order else 0
+    return {"galaxy": galaxy, "tool_shed": tool_shed, "total": galaxy + tool_shed}
+
+
+def estimate_duration(durations: list[float], workers: int) -> float:
+    """
+    Estimate the wall time of running tasks of the given ``durations`` longest first on ``workers``
+    parallel workers, the way ``shed-tools install`` schedules installs with an install history.
+    """
+    finish_times = [0.0] * max(min(workers, len(durations)), 1)
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def write_plan(plan: InstallPlan, path: str):
+    """Write ``plan`` as JSON to ``path``."""
+    with open(path, "w") as f:
+        json.dump(dict(plan._asdict(), created=dt.datetime.now().isoformat(timespec="seconds")), f, indent=2)
+
+
+def read_plan(path: str) -> InstallPlan:
+    """Read a plan written by ``write_plan``."""
+    with open(path) as f:
+        plan = json.load(f)
+    return InstallPlan(
+        galaxy_url=plan.get("galaxy_url"),
+        install_workers=plan.get("install_workers") or 1,
+        repositories=plan.get("repositories") or [],
+        skipped_repositories=plan.get("skipped_repositories") or [],
+        errored_repositories=plan.get("errored_repositories") or [],
+        api_calls=plan.get("api_calls") or {},
+        estimated_seconds=plan.get("estimated_seconds"),
+    )
@@ -0,0 +1,142 @@
+"""
+Keep a Galaxy instance converged to a directory of tool lists.
+
+``shed-tools reconcile --tools-dir <directory>`` runs until it is interrupted. Every
+``--interval`` seconds it re-reads the tool lists in the directory that changed since the
+last check and installs the repositories of changed tool lists that are missing. The Galaxy
+connection and the snapshot of installed repositories are kept for the whole run, and the
+snapshot is only fetched again from Galaxy every ``--refresh-interval`` seconds, at which
+point all tool lists are reconciled again.
+"""
+
+import logging
+import os
+import time
+from collections.abc import Callable
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
+
+from galaxy.util import unicodify
+
+from . import load_yaml_file
+from .shed_tools_methods import configure_tool_shed_limits
+from .shed_tools_tool_lists import (
+    TOOL_LIST_EXTENSIONS,
+    tool_list_repositories,
+)
+
+if TYPE_CHECKING:
+    from .shed_tools import (
+        InstallRepoDict,
+        InstallRepositoryManager,
+        InstallResults,
+    )
+
+DEFAULT_RECONCILE_INTERVAL = 300.0
+DEFAULT_REFRESH_INTERVAL = 3600.0
+
+log = logging.getLogger(__name__)
+
+
+class ToolListReconciler:
+    """Install the repositories of changed tool lists in a directory, reusing one ``InstallRepositoryManager``."""
+
+    def __init__(
+        self,
+        install_repository_manager: "InstallRepositoryManager",
+        tool_list_dir: str,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        log=log,
+        **install_kwargs,
+    ):
+        self.install_repository_manager = install_repository_manager
+        self.tool_list_dir = tool_list_dir
+        self.refresh_interval = refresh_interval
+        self.log = log
+        self.install_kwargs = install_kwargs
+        # Repositories of each tool list by path, and the (mtime, size) they were read at
+        self._tool_lists: dict[str, list[InstallRepoDict]] = {}
+        self._file_stats: dict[str, tuple[int, int]] = {}
+        # Repositories that could not be installed, retried on the next tick
+        self._pending: list[InstallRepoDict] = []
+        self._last_refresh: float | None = None
+
+    def changed_tool_lists(self) -> list[str]:
+        """Re-read the tool lists that were added or modified since the last call and return their paths."""
+        changed = []
+        present = set()
+        for entry in sorted(os.scandir(self.tool_list_dir), key=lambda entry: entry.name):
+            if not entry.is_file() or not entry.name.endswith(TOOL_LIST_EXTENSIONS):
+                continue
+            present.add(entry.path)
+            stat = entry.stat()
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+            if self._file_stats.get(entry.path) == file_stat:
+                continue
+            try:
+                tool_list = load_yaml_file(entry.path) or {}
+                configure_tool_shed_limits(tool_list.get("tool_sheds"))
+                self._tool_lists[entry.path] = tool_list_repositories(tool_list)
+            except Exception as e:
+                # The file may be in the middle of being written, try again on the next tick
+                if self.log:
+                    self.log.warning("Could not read tool list '%s': %s", entry.path, unicodify(e))
+                continue
+            self._file_stats[entry.path] = file_stat
+            changed.append(entry.path)
+        for path in set(self._tool_lists) - present:
+            if self.log:
+                self.log.info("Tool list '%s' was removed, its repositories are kept installed", path)
+            del self._tool_lists[path]
+            del self._file_stats[path]
+        return changed
+
+    def tick(self) -> "InstallResults | None":
+        """
+        Install the missing repositories of all changed tool lists.
+        Return the ``InstallResults``, or None if there was nothing to do.
+        """
+        now = time.monotonic()
+        changed = self.changed_tool_lists()
+        refresh = self._last_refresh is None or now - self._last_refresh >= self.refresh_interval
+        if refresh:
+            # Catch repositories that were uninstalled or failed outside of this process
+            self.install_repository_manager.installed_snapshot(refresh=True)
+            self._last_refresh = now
+            changed = sorted(self._tool_lists)
+        repositories = self._pending + [repository for path in changed for repository in self._tool_lists[path]]
+        if not repositories:
+            return None
+        if self.log:
+            self.log.info(
+                "Reconciling %d repositories from %d tool lists%s",
+                len(repositories),
+                len(changed),
+                " after refreshing installed repositories" if refresh else "",
+            )
+        install_results = self.install_repository_manager.install_repositories(
+            repositories, log=self.log, **self.install_kwargs
+        )
+        self._pending = install_results.errored_repositories
+        return install_results
+
+    def run(
+        self,
+        interval: float = DEFAULT_RECONCILE_INTERVAL,
+        callback: "Callable[[InstallResults], Any] | None" = None,
+    ):
+        """Call ``tick`` every ``interval`` seconds, and ``callback`` with the results of ticks that did something."""
+        while True:
+            start = time.monotonic()
+            try:
+                install_results = self.tick()
+                if install_results and callback:
+                    callback(install_results)
+            except Exception as e:
+                # Keep running if Galaxy or the Tool Shed are temporarily unavailable
+                if self.log:
+                    self.log.error("Reconciliation failed, retrying in %s seconds: %s", interval, unicodify(e))
+                self._file_stats.clear()
+            time.sleep(max(interval - (time.monotonic() - start), 0))
@@ -0,0 +1,95 @@
+"""
+Install or update the same repositories on several Galaxy instances at once.
+
+``shed-tools install --targets <targets.yml>`` and ``shed-tools update --targets <targets.yml>``
+read a list of Galaxy instances from a YAML file like::
+
+    targets:
+      - galaxy_instance: https://galaxy.example.org
+        api_key: <admin api key>
+        install_workers: 4
+      - galaxy_instance: https://staging.galaxy.example.org
+        api_key: <admin api key>
+
+All targets share one ``RevisionCache``, so that the changeset revisions of each repository
+are resolved once for all targets.
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+
+from typing_extensions import NamedTuple
+
+from . import load_yaml_file
+from .shed_tools_catalog import ToolShedCatalog
+from .shed_tools_methods import (
+    format_tool_shed_url,
+    get_tool_shed_instance,
+    tool_shed_key,
+)
+
+
+class InstallTarget(NamedTuple):
+    galaxy_url: str
+    api_key: str | None
+    install_workers: int | None
+
+
+def read_targets(path: str) -> list[InstallTarget]:
+    """Read the Galaxy instances to install on from the targets file at ``path``."""
+    targets = []
+    for target in (load_yaml_file(path) or {}).get("targets") or []:
+        if not target.get("galaxy_instance"):
+            raise ValueError(f"Target without galaxy_instance in targets file {path}: {target}")
+        targets.append(
+            InstallTarget(
+                galaxy_url=target["galaxy_instance"],
+                api_key=target.get("api_key") or os.environ.get("EPHEMERIS_API_KEY"),
+                install_workers=target.get("install_workers"),
+            )
+        )
+    return targets
+
+
+class RevisionCache:
+    """
+    Remember the installable revisions of repositories, so that installs on several Galaxy
+    instances resolve each repository only once. Can be passed as ``catalog`` wherever a
+    ``ToolShedCatalog`` is accepted, revisions are looked up in ``catalog`` if it contains
+    the Tool Shed, and on the Tool Shed otherwise.
+    Concurrent lookups of the same repository wait for the first one to finish.
+    """
+
+    path = "in-memory revision cache"
+
+    def __init__(self, catalog: ToolShedCatalog | None = None):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._revisions: dict[tuple[str, str, str], Future] = {}
+
+    def has_tool_shed(self, tool_shed_url: str) -> bool:
+        return True
+
+    def get_ordered_installable_revisions(self, tool_shed_url: str, name: str, owner: str) -> list[str]:
+        key = (tool_shed_key(tool_shed_url), owner, name)
+        with self._lock:
+            future = self._revisions.get(key)
+            first = future is None
+            if future is None:
+                future = self._revisions[key] = Future()
+        if first:
+            try:
+                future.set_result(self._fetch(tool_shed_url, name, owner))
+            except Exception as e:
+                # Waiting lookups fail as well, later lookups try again
+                with self._lock:
+                    del self._revisions[key]
+                future.set_exception(e)
+        return future.result()
+
+    def _fetch(self, tool_shed_url: str, name: str, owner: str) -> list[str]:
+        if self.catalog is not None and self.catalog.has_tool_shed(tool_shed_url):
+            return self.catalog.get_ordered_installable_revisions(tool_shed_url, name, owner)
+        ts = get_tool_shed_instance(format_tool_shed_url(tool_shed_url))
+        return ts.repositories.get_ordered_installable_revisions(name, owner)
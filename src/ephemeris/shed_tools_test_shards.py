@@ -0,0 +1,155 @@
+"""
+Split the tool tests of ``shed-tools test`` over several independent runs.
+
+``shed-tools test --shard 2/4`` runs the second of four shards of the tests. Every shard fetches
+the test definitions of all tools and splits the same list of tests, balanced by the durations
+of an earlier run (tests without known duration count as average tests). All shards must see
+the same durations to agree on the split, so they are best read from the merged report of the
+previous run with ``--test-durations``, rather than from a ``--test-store`` the shards write to.
+
+Whenever durations are known, with or without shards, every test worker that becomes free runs
+the longest test whose definition has arrived so far (see ``LongestTestsFirst``).
+
+The ``--test-json`` reports of the shards can be merged into a single report for
+``planemo test_reports`` with ``shed-tools merge-test-reports -o <report.json> <shard reports>``.
+"""
+
+import argparse
+import heapq
+import json
+import re
+import threading
+from collections.abc import (
+    Callable,
+    Sequence,
+)
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
+
+if TYPE_CHECKING:
+    from .shed_tools_test_store import ToolTestStore
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """Parse ``INDEX/COUNT`` into the 1-based shard index and the number of shards."""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", shard)
+    if not match:
+        raise argparse.ArgumentTypeError(f"Shard '{shard}' is not of the form INDEX/COUNT, e.g. 1/4")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+
+def assign_shards(test_ids: list[str], durations: list[float], count: int) -> list[int]:
+    """
+    Assign each test to one of ``count`` shards (numbered from 1), so that the expected durations
+    of the shards are balanced. Tests are assigned longest first to the shard with the least
+    expected duration so far. The assignment only depends on ``test_ids`` and ``durations``.
+    """
+    shards = [(0.0, shard) for shard in range(1, count + 1)]
+    assignment = [0] * len(test_ids)
+    for index in sorted(range(len(test_ids)), key=lambda index: (-durations[index], test_ids[index])):
+        load, shard = heapq.heappop(shards)
+        assignment[index] = shard
+        heapq.heappush(shards, (load + durations[index], shard))
+    return assignment
+
+
+class ReportedTestDurations:
+    """
+    The test durations of earlier ``--test-json`` reports, with the ``expected_durations`` of a
+    ``ToolTestStore``. Durations of the same test in several reports are averaged.
+    """
+
+    def __init__(self, paths: list[str]):
+        durations: dict[Any, list[float]] = {}
+        for path in paths:
+            with open(path) as f:
+                report = json.load(f)
+            for test in report.get("tests", []):
+                data = test.get("data") or {}
+                if data.get("time_seconds") is not None and data.get("tool_id"):
+                    key = (data["tool_id"], data.get("tool_version") or "", data.get("test_index", 0))
+                    durations.setdefault(key, []).append(data["time_seconds"])
+        self.durations = {key: sum(seconds) / len(seconds) for key, seconds in durations.items()}
+
+    def expected_duration(self, tool_id: str, tool_version: str | None, test_index: int) -> float | None:
+        """Return the reported duration of a test of a tool version, or None for tests not reported."""
+        return self.durations.get((tool_id, tool_version or "", test_index))
+
+    def average_duration(self) -> float | None:
+        """Return the average duration of all reported tests, or None if no test was reported."""
+        return sum(self.durations.values()) / len(self.durations) if self.durations else None
+
+    def expected_durations(self, tests: list[tuple[str, str | None, int]]) -> list[float]:
+        """
+        Return the expected duration of each of the (tool id, tool version, test index) ``tests``.
+        Tests without reported duration are expected to take the average of the others.
+        """
+        durations = [self.expected_duration(*test) for test in tests]
+        known = [duration for duration in durations if duration is not None]
+        default = sum(known) / len(known) if known else 1.0
+        return [default if duration is None else duration for duration in durations]
+
+
+class LongestTestsFirst:
+    """
+    Submits tests to an ``executor`` so that every worker that becomes free runs the longest of the
+    tests queued so far, while more tests are still being queued as their definitions arrive.
+    Tests are expected to take as long as in ``test_durations``, tests without known duration are
+    expected to take the average duration of all known tests.
+    """
+
+    def __init__(self, executor: Executor, test_durations: "ToolTestStore | ReportedTestDurations"):
+        self.executor = executor
+        self.test_durations = test_durations
+        self.default_duration = test_durations.average_duration() or 1.0
+        self._queue: list[tuple[float, str, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+
+    def submit(self, tests: Sequence[tuple[str, str | None, int, str, Callable[[], None]]]):
+        """
+        Queue the (tool id, tool version, test index, test id, run) ``tests``, where ``run`` runs the test.
+        The tests of one tool are queued together, so that the longest of them runs first.
+        """
+        with self._lock:
+            for tool_id, tool_version, test_index, test_id, run in tests:
+                duration = self.test_durations.expected_duration(tool_id, tool_version, test_index)
+                heapq.heappush(self._queue, (-(duration or self.default_duration), test_id, run))
+        # Each submitted task runs one test, the longest one queued when a worker picks the task up
+        for _ in tests:
+            self.executor.submit(self._run_longest)
+
+    def _run_longest(self):
+        with self._lock:
+            _, _, run = heapq.heappop(self._queue)
+        run()
+
+
+def merge_test_reports(paths: list[str], output: str):
+    """Merge the ``--test-json`` reports of several shards into a single report written to ``output``."""
+    tests: dict[str, dict] = {}
+    results = {"total": 0, "errors": 0, "failures": 0, "skips": 0}
+    suitename = None
+    for path in paths:
+        with open(path) as f:
+            report = json.load(f)
+        suitename = suitename or report.get("suitename")
+        for key, value in report.get("results", {}).items():
+            results[key] = results.get(key, 0) + value
+        for test in report.get("tests", []):
+            tests[test["id"]] = test
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "version": "0.1",
+                "suitename": suitename,
+                "results": results,
+                "tests": sorted(tests.values(), key=lambda el: el["id"]),
+            },
+            f,
+        )
@@ -0,0 +1,123 @@
+"""
+A local SQLite store of tool test results.
+
+Results are keyed by Galaxy URL, tool id, tool version, test index and a hash of the test
+definition, so that a changed test is not mistaken for one that passed before.
+``shed-tools test --test-store <file> --skip-passed`` uses it to skip the tests that passed
+on the same Galaxy within ``--skip-passed-window`` days, and the recorded durations to
+balance ``--shard`` runs.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Any
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_test_results (
+    galaxy_url TEXT NOT NULL,
+    tool_id TEXT NOT NULL,
+    tool_version TEXT NOT NULL,
+    test_index INTEGER NOT NULL,
+    definition_hash TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    recorded TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tool_test_results_test ON tool_test_results (tool_id, tool_version, test_index);
+"""
+
+
+def definition_hash(test_definition: dict[str, Any]) -> str:
+    """Return a hash of a test definition as returned by ``GalaxyInteractorApi.get_tool_tests``."""
+    return hashlib.sha256(json.dumps(test_definition, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ToolTestStore:
+    """Record and look up the results of tool tests."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def record(
+        self,
+        galaxy_url: str,
+        tool_id: str,
+        tool_version: str | None,
+        test_index: int,
+        test_definition_hash: str,
+        passed: bool,
+        seconds: float,
+    ):
+        """Record that test ``test_index`` of a tool version passed or failed after ``seconds``."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO tool_test_results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    galaxy_url,
+                    tool_id,
+                    tool_version or "",
+                    test_index,
+                    test_definition_hash,
+                    passed,
+                    seconds,
+                    dt.datetime.now().isoformat(),
+                ),
+            )
+
+    def passed_since(
+        self,
+        galaxy_url: str,
+        tool_id: str,
+        tool_version: str | None,
+        test_index: int,
+        test_definition_hash: str,
+        since: dt.datetime,
+    ) -> bool:
+        """Return whether the last run of the test with the same definition on ``galaxy_url`` since ``since`` passed."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT passed FROM tool_test_results WHERE tool_id = ? AND tool_version = ? AND test_index = ? "
+                "AND galaxy_url = ? AND definition_hash = ? AND recorded >= ? ORDER BY recorded DESC LIMIT 1",
+                (tool_id, tool_version or "", test_index, galaxy_url, test_definition_hash, since.isoformat()),
+            ).fetchone()
+        return bool(row and row[0])
+
+    def expected_duration(self, tool_id: str, tool_version: str | None, test_index: int) -> float | None:
+        """
+        Return the average duration of a test of a tool version, falling back to the average duration
+        of the test with the same index in all versions of the tool. Return None for tests never run.
+        """
+        with self._lock:
+            version_average, tool_average = self._connection.execute(
+                "SELECT AVG(CASE WHEN tool_version = ? THEN seconds END), AVG(seconds) FROM tool_test_results "
+                "WHERE tool_id = ? AND test_index = ?",
+                (tool_version or "", tool_id, test_index),
+            ).fetchone()
+        return version_average if version_average is not None else tool_average
+
+    def average_duration(self) -> float | None:
+        """Return the average duration of all recorded tests, or None if no test was recorded."""
+        with self._lock:
+            (average,) = self._connection.execute("SELECT AVG(seconds) FROM tool_test_results").fetchone()
+        return average
+
+    def expected_durations(self, tests: list[tuple[str, str | None, int]]) -> list[float]:
+        """
+        Return the expected duration of each of the (tool id, tool version, test index) ``tests``.
+        Tests without recorded duration are expected to take the average of the others.
+        """
+        durations = [self.expected_duration(*test) for test in tests]
+        known = [duration for duration in durations if duration is not None]
+        default = sum(known) / len(known) if known else 1.0
+        return [default if duration is None else duration for duration in durations]
@@ -0,0 +1,99 @@
+"""
+Load tool lists that are split over many files.
+
+``shed-tools -t`` accepts a single tools file, a directory (all ``*.yml`` and ``*.yaml`` files
+in it) or a glob pattern, e.g. ``-t 'usegalaxy.org/*.yaml'``. Multiple files are parsed in
+parallel and merged into a single tool list. The installation defaults of each file (e.g.
+``install_resolver_dependencies``) are applied to its own repositories, and repository revisions
+listed by several files for the same tool panel section are only installed once.
+"""
+
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    TYPE_CHECKING,
+)
+
+from . import load_yaml_file
+from .shed_tools_lock import INSTALL_DEFAULT_KEYS
+from .shed_tools_methods import (
+    DEFAULT_TOOL_SHED_URL,
+    flatten_repo_info,
+    tool_shed_key,
+)
+
+if TYPE_CHECKING:
+    from .shed_tools import InstallRepoDict
+
+TOOL_LIST_EXTENSIONS = (".yml", ".yaml")
+
+log = logging.getLogger(__name__)
+
+
+def tool_list_repositories(tool_list: dict[str, Any]) -> list["InstallRepoDict"]:
+    """
+    Return the repositories of a tool list, with the tool list wide installation defaults
+    (e.g. ``install_resolver_dependencies``) applied to each repository.
+    """
+    repositories: list[InstallRepoDict] = []
+    for repository in tool_list.get("tools") or []:
+        repository = repository.copy()
+        for key in INSTALL_DEFAULT_KEYS:
+            if key in tool_list:
+                repository.setdefault(key, tool_list[key])
+        repositories.append(repository)
+    return repositories
+
+
+def tool_list_paths(path: str) -> list[str]:
+    """Return the tools files ``path`` refers to, which may be a file, a directory or a glob pattern."""
+    if os.path.isdir(path):
+        return sorted(
+            entry.path for entry in os.scandir(path) if entry.is_file() and entry.name.endswith(TOOL_LIST_EXTENSIONS)
+        )
+    if any(character in path for character in "*?["):
+        return sorted(glob.glob(path, recursive=True))
+    return [path]
+
+
+def load_tool_lists(path: str, workers: int | None = None, log=log) -> dict[str, Any]:
+    """
+    Load the tools files ``path`` refers to (see ``tool_list_paths``) with up to ``workers`` processes,
+    and merge them into one tool list. A single file is returned unchanged.
+    """
+    paths = tool_list_paths(path)
+    if paths == [path]:
+        return load_yaml_file(path)
+    if not paths:
+        raise ValueError(f"No tools files found in '{path}'")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tool_lists = list(executor.map(load_yaml_file, paths, chunksize=8))
+
+    merged: dict[str, Any] = {"tools": []}
+    seen = set()
+    for tool_list in tool_lists:
+        tool_list = tool_list or {}
+        for key, value in tool_list.items():
+            if key == "tool_sheds":
+                merged.setdefault("tool_sheds", {}).update(value or {})
+            elif key != "tools" and key not in INSTALL_DEFAULT_KEYS:
+                # e.g. galaxy_instance, the first file that sets it wins
+                merged.setdefault(key, value)
+        for repository in flatten_repo_info(tool_list_repositories(tool_list)):
+            repository_key = (
+                tool_shed_key(repository.get("tool_shed_url") or DEFAULT_TOOL_SHED_URL),
+                repository["owner"],
+                repository["name"],
+                repository.get("changeset_revision"),
+                repository.get("tool_panel_section_id"),
+                repository.get("tool_panel_section_label"),
+            )
+            if repository_key not in seen:
+                seen.add(repository_key)
+                merged["tools"].append(repository)
+    if log:
+        log.info("Loaded %d repository revisions from %d tools files in '%s'", len(merged["tools"]), len(paths), path)
+    return merged
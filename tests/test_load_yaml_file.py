@@ -0,0 +1,78 @@
+import datetime as dt
+import os
+
+import pytest
+
+import ephemeris
+from ephemeris import load_yaml_file
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """The paths of the YAML files parsed during a test, starting without cached files."""
+    parsed = []
+    parse_yaml_file = ephemeris._parse_yaml_file
+    monkeypatch.setattr(ephemeris, "_parse_yaml_file", lambda path: parsed.append(path) or parse_yaml_file(path))
+    monkeypatch.setattr(ephemeris, "_yaml_files", {})
+    monkeypatch.delenv(ephemeris.YAML_CACHE_DIR_ENV, raising=False)
+    return parsed
+
+
+def test_load_yaml_file_parses_once(tmp_path, parsed):
+    path = tmp_path / "tool_list.yaml"
+    path.write_text("tools:\n- name: bwa\n  owner: devteam\n")
+
+    tool_list = load_yaml_file(str(path))
+    tool_list["tools"].append({"name": "modified"})
+    assert load_yaml_file(str(path)) == {"tools": [{"name": "bwa", "owner": "devteam"}]}
+    assert len(parsed) == 1
+
+    path.write_text("tools:\n- name: bowtie2\n  owner: devteam\n")
+    os.utime(path, ns=(1, 1))
+    assert load_yaml_file(str(path))["tools"][0]["name"] == "bowtie2"
+    assert len(parsed) == 2
+
+
+def test_load_yaml_file_disk_cache(tmp_path, parsed):
+    cache_dir = str(tmp_path / "cache")
+    path = tmp_path / "genomes.yml"
+    path.write_text("genomes:\n- id: hg38\n")
+
+    assert load_yaml_file(str(path), cache_dir=cache_dir) == {"genomes": [{"id": "hg38"}]}
+    # A new process only has the disk cache
+    ephemeris._yaml_files.clear()
+    assert load_yaml_file(str(path), cache_dir=cache_dir) == {"genomes": [{"id": "hg38"}]}
+    # Touching the file does not change its hash
+    ephemeris._yaml_files.clear()
+    os.utime(path, ns=(1, 1))
+    assert load_yaml_file(str(path), cache_dir=cache_dir) == {"genomes": [{"id": "hg38"}]}
+    assert len(parsed) == 1
+
+
+def test_load_yaml_file_disk_cache_only_json(tmp_path, parsed):
+    cache_dir = tmp_path / "cache"
+    path = tmp_path / "genomes.yml"
+    path.write_text("genomes:\n- id: hg38\n  added: 2024-05-02\n")
+
+    for _ in range(2):
+        ephemeris._yaml_files.clear()
+        assert load_yaml_file(str(path), cache_dir=str(cache_dir)) == {
+            "genomes": [{"id": "hg38", "added": dt.date(2024, 5, 2)}]
+        }
+    # Dates can not be stored as JSON, the file is parsed again
+    assert len(parsed) == 2
+    assert os.listdir(cache_dir) == []
+
+
+def test_load_yaml_file_disk_cache_writable_by_others(tmp_path, parsed):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    cache_dir.chmod(0o777)
+    path = tmp_path / "genomes.yml"
+    path.write_text("genomes:\n- id: hg38\n")
+
+    for _ in range(2):
+        ephemeris._yaml_files.clear()
+        assert load_yaml_file(str(path), cache_dir=str(cache_dir)) == {"genomes": [{"id": "hg38"}]}
+    assert len(parsed) == 2
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,96 @@
+from ephemeris import shed_tools_catalog
+from ephemeris.shed_tools_catalog import (
+    sync_catalog,
+    ToolShedCatalog,
+)
+from ephemeris.shed_tools_methods import get_changeset_revisions
+
+TOOL_SHED_URL = "https://toolshed.example.org/"
+
+
+class FakeRepositoriesClient:
+    def __init__(self):
+        self.repositories = [
+            {"id": "1", "name": "bwa", "owner": "devteam", "deleted": False},
+            {"id": "2", "name": "cdhit", "owner": "jjohnson", "deleted": False},
+        ]
+        self.revisions = {"1": ["051eba708f43", "4d82cf59895e"], "2": ["34a799d173f7"]}
+        self.fetched = []
+
+    def get_repositories(self):
+        return self.repositories
+
+    def repository_revisions(self, downloadable=None):
+        return [
+            {"repository_id": repository_id, "changeset_revision": revision}
+            for repository_id, revisions in self.revisions.items()
+            for revision in revisions
+        ]
+
+    def get_ordered_installable_revisions(self, name, owner):
+        self.fetched.append(name)
+        repository_id = next(r["id"] for r in self.repositories if r["name"] == name and r["owner"] == owner)
+        return self.revisions[repository_id]
+
+
+class FakeToolShedInstance:
+    def __init__(self):
+        self.repositories = FakeRepositoriesClient()
+
+
+def test_catalog_sync_and_lookup(tmp_path, monkeypatch):
+    ts = FakeToolShedInstance()
+    monkeypatch.setattr(shed_tools_catalog, "get_tool_shed_instance", lambda url: ts)
+    path = str(tmp_path / "catalog.sqlite")
+
+    (result,) = sync_catalog(path, ["toolshed.example.org"], log=None)
+    assert result.total_repositories == 2
+    assert result.updated_repositories == 2
+    assert sorted(ts.repositories.fetched) == ["bwa", "cdhit"]
+
+    # Only the repository with a new downloadable revision is fetched again
+    ts.repositories.fetched.clear()
+    ts.repositories.revisions["2"].append("28b7a43907f0")
+    (result,) = sync_catalog(path, [TOOL_SHED_URL], log=None)
+    assert result.updated_repositories == 1
+    assert ts.repositories.fetched == ["cdhit"]
+
+    catalog = ToolShedCatalog(path)
+    assert catalog.has_tool_shed(TOOL_SHED_URL)
+    assert catalog.get_ordered_installable_revisions(TOOL_SHED_URL, "cdhit", "jjohnson") == [
+        "34a799d173f7",
+        "28b7a43907f0",
+    ]
+    repository = get_changeset_revisions(
+        dict(name="cdhit", owner="jjohnson", tool_shed_url=TOOL_SHED_URL), catalog=catalog
+    )
+    assert repository["changeset_revision"] == "28b7a43907f0"
+
+
+def test_catalog_sync_with_failing_repository(tmp_path, monkeypatch):
+    ts = FakeToolShedInstance()
+    monkeypatch.setattr(shed_tools_catalog, "get_tool_shed_instance", lambda url: ts)
+    path = str(tmp_path / "catalog.sqlite")
+    sync_catalog(path, [TOOL_SHED_URL], log=None)
+
+    get_ordered_installable_revisions = ts.repositories.get_ordered_installable_revisions
+
+    def failing_cdhit(name, owner):
+        if name == "cdhit":
+            raise ConnectionError("500 Internal Server Error")
+        return get_ordered_installable_revisions(name, owner)
+
+    monkeypatch.setattr(ts.repositories, "get_ordered_installable_revisions", failing_cdhit)
+    ts.repositories.revisions["1"].append("2b1a2c6d7e8f")
+    ts.repositories.revisions["2"].append("28b7a43907f0")
+    (result,) = sync_catalog(path, [TOOL_SHED_URL], log=None)
+    assert (result.updated_repositories, result.failed_repositories) == (1, 1)
+    catalog = ToolShedCatalog(path)
+    assert catalog.get_ordered_installable_revisions(TOOL_SHED_URL, "bwa", "devteam")[-1] == "2b1a2c6d7e8f"
+    # The failed repository keeps its previous revisions, and is fetched again by the next sync
+    assert catalog.get_ordered_installable_revisions(TOOL_SHED_URL, "cdhit", "jjohnson") == ["34a799d173f7"]
+    monkeypatch.setattr(ts.repositories, "get_ordered_installable_revisions", get_ordered_installable_revisions)
+    ts.repositories.fetched.clear()
+    (result,) = sync_catalog(path, [TOOL_SHED_URL], log=None)
+    assert ts.repositories.fetched == ["cdhit"]
+    assert catalog.get_ordered_installable_revisions(TOOL_SHED_URL, "cdhit", "jjohnson")[-1] == "28b7a43907f0"
@@ -110,6 +110,26 @@ def test_install_from_tool_list(start_container: GalaxyContainer):
     assert "051eba708f43" in tool_list
 
 
+def test_install_from_tool_list_with_install_workers(start_container: GalaxyContainer):
+    shed_tools_cli(
+        [
+            "install",
+            "-t",
+            str(SAMPLE_TOOL_YAML_PATH),
+            "--install-workers",
+            "2",
+            "-a",
+            start_container.api_key,
+            "-g",
+            start_container.url,
+        ]
+    )
+    tool_list = get_tool_list(start_container, "--get_all_tools")
+    assert "4d82cf59895e" in tool_list
+    assert "0b4e36026794" in tool_list
+    assert "051eba708f43" in tool_list
+
+
 def test_workflows_to_tools_install(start_container: GalaxyContainer):
     with tempfile.NamedTemporaryFile() as tool_list_file:
         workflow_to_tools_cli(
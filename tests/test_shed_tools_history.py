@@ -0,0 +1,18 @@
+from ephemeris.shed_tools_history import InstallHistory
+
+
+def test_install_history(tmp_path):
+    history = InstallHistory(str(tmp_path / "history.sqlite"))
+    bwa = dict(name="bwa", owner="devteam", tool_shed_url="https://toolshed.g2.bx.psu.edu/")
+    history.record(dict(bwa, changeset_revision="051eba708f43"), 10.0)
+    history.record(dict(bwa, changeset_revision="051eba708f43"), 20.0)
+    history.record(dict(bwa, changeset_revision="4d82cf59895e"), 60.0, galaxy_url="https://usegalaxy.example.org")
+    assert history.expected_duration(dict(bwa, changeset_revision="051eba708f43")) == 15.0
+    # Unknown revisions fall back to all revisions of the repository
+    assert history.expected_duration(dict(bwa, changeset_revision="ffffffffffff")) == 30.0
+    assert history.expected_duration(dict(bwa, name="bowtie2", changeset_revision="1")) is None
+    assert history.expected_durations(
+        [dict(bwa, changeset_revision="4d82cf59895e"), dict(bwa, name="bowtie2", changeset_revision="1")]
+    ) == [60.0, 60.0]
+    # Without any history the durations are unknown
+    assert history.expected_durations([dict(bwa, name="bowtie2", changeset_revision="1")]) is None
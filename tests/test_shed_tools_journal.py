@@ -0,0 +1,140 @@
+from ephemeris import shed_tools
+from ephemeris.install_tool_deps import unresolved_requirements
+from ephemeris.shed_tools import (
+    InstalledRepositories,
+    InstallRepositoryManager,
+)
+from ephemeris.shed_tools_journal import (
+    InstallJournal,
+    journal_key,
+)
+from .test_shed_tools_state import FakeGalaxyInstance
+
+TOOL_SHED_URL = "https://toolshed.g2.bx.psu.edu/"
+
+
+def test_install_journal_resume(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    bwa = dict(name="bwa", owner="devteam", tool_panel_section_label="NGS mapping")
+    bowtie2 = dict(name="bowtie2", owner="devteam", tool_panel_section_label="NGS mapping")
+    bwa_key = journal_key(bwa, "toolshed.g2.bx.psu.edu", False)
+    bowtie2_key = journal_key(bowtie2, "https://toolshed.g2.bx.psu.edu/", False)
+    assert bwa_key != journal_key(bwa, "toolshed.g2.bx.psu.edu", True)
+
+    journal = InstallJournal(path)
+    journal.record_resolved(bwa_key, dict(bwa, changeset_revision="4d82cf59895e"))
+    journal.record_resolved(bowtie2_key, dict(bowtie2, changeset_revision="09e1b6c4dd5b"))
+    journal.record_outcome(bwa_key, dict(bwa, changeset_revision="4d82cf59895e"), "installed")
+    journal.close()
+    # Simulate a run that was killed while writing a record
+    with open(path, "a") as f:
+        f.write('{"event": "outc')
+
+    journal = InstallJournal(path)
+    assert journal.is_completed(bwa_key)
+    assert not journal.is_completed(bowtie2_key)
+    assert journal.resolved[bowtie2_key]["changeset_revision"] == "09e1b6c4dd5b"
+    journal.record_outcome(bowtie2_key, dict(bowtie2, changeset_revision="09e1b6c4dd5b"), "skipped")
+    journal.close()
+    assert InstallJournal(path).is_completed(bowtie2_key)
+
+
+def test_install_repositories_journal(tmp_path, monkeypatch):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories(
+        [dict(name="bwa", owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"])]
+    )
+    monkeypatch.setattr(manager, "install_repository_revision", lambda repository, log, **kwargs: "installed")
+    monkeypatch.setattr(manager, "install_resolver_dependencies", lambda repositories, **kwargs: [])
+    repositories = [
+        dict(name=name, owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"])
+        for name in ("bwa", "bowtie2", "samtools")
+    ]
+    path = str(tmp_path / "journal.jsonl")
+    journal = InstallJournal(path)
+    results = manager.install_repositories(
+        repositories, log=None, journal=journal, defer_resolver_dependencies=True, install_workers=2
+    )
+    journal.close()
+    assert sorted(r["name"] for r in results.installed_repositories) == ["bowtie2", "samtools"]
+    journal = InstallJournal(path)
+    # Every entry has its outcome recorded under its own key
+    assert sorted(journal.outcomes.values()) == ["installed", "installed", "skipped"]
+    results = manager.install_repositories(repositories, log=None, journal=journal)
+    assert results.installed_repositories == []
+    assert len(results.skipped_repositories) == 3
+
+
+def test_deferred_resolver_dependencies_journal(tmp_path, monkeypatch):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories([])
+    monkeypatch.setattr(manager, "install_repository_revision", lambda repository, log, **kwargs: "installed")
+    deferred = []
+
+    def install_resolver_dependencies(repositories, **kwargs):
+        deferred.append([r["name"] for r in repositories])
+        return [index for index, r in enumerate(repositories) if r["name"] == "bowtie2"]
+
+    monkeypatch.setattr(manager, "install_resolver_dependencies", install_resolver_dependencies)
+    repositories = [
+        dict(name=name, owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"]) for name in ("bwa", "bowtie2")
+    ]
+    keys = [journal_key(dict(repository, changeset_revision="1"), TOOL_SHED_URL, False) for repository in repositories]
+    path = str(tmp_path / "journal.jsonl")
+    journal = InstallJournal(path)
+    results = manager.install_repositories(repositories, log=None, journal=journal, defer_resolver_dependencies=True)
+    journal.close()
+    assert [r["name"] for r in results.installed_repositories] == ["bwa"]
+    assert [r["name"] for r in results.errored_repositories] == ["bowtie2"]
+    assert InstallJournal(path).outcomes == {keys[0]: "installed", keys[1]: "error"}
+
+    # A run killed before installing the deferred resolver dependencies installs them on resume
+    path = str(tmp_path / "pending.jsonl")
+    journal = InstallJournal(path)
+    journal.record_resolved(keys[0], dict(repositories[0], changeset_revision="1"))
+    journal.record_outcome(keys[0], repositories[0], "resolver_dependencies_pending")
+    assert not journal.is_completed(keys[0])
+    deferred.clear()
+    results = manager.install_repositories(repositories[:1], log=None, journal=journal)
+    journal.close()
+    assert deferred == [["bwa"]]
+    assert [r["name"] for r in results.skipped_repositories] == ["bwa"]
+    assert InstallJournal(path).is_completed(keys[0])
+
+
+def test_unresolved_resolver_dependencies(tmp_path, monkeypatch):
+    conda = dict(model_class="MergedCondaDependency", dependency_type="conda", name="bwa", version="0.7.17")
+    unresolved = dict(model_class="NullDependency", dependency_type=None, name="samtools", version="1.9")
+    assert unresolved_requirements([conda, unresolved]) == ["samtools/1.9"]
+    assert unresolved_requirements(None) == []
+
+    class FakeToolIndex:
+        def __init__(self, gi):
+            pass
+
+        def tools_for_repository(self, repository, all_tools=False):
+            return [{"id": repository["name"] + "_tool"}]
+
+    class FakeToolClient:
+        def __init__(self, gi):
+            pass
+
+        def install_dependencies(self, tool_id):
+            # Galaxy responds with 200 and the requirement statuses also if a conda install failed
+            return [dict(conda, name=tool_id)] if tool_id == "bwa_tool" else [dict(unresolved, name=tool_id)]
+
+    monkeypatch.setattr(shed_tools, "ToolIndex", FakeToolIndex)
+    monkeypatch.setattr(shed_tools, "ToolClient", FakeToolClient)
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories([])
+    monkeypatch.setattr(manager, "install_repository_revision", lambda repository, log, **kwargs: "installed")
+    repositories = [
+        dict(name=name, owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"]) for name in ("bwa", "samtools")
+    ]
+    path = str(tmp_path / "journal.jsonl")
+    journal = InstallJournal(path)
+    results = manager.install_repositories(repositories, log=None, journal=journal, defer_resolver_dependencies=True)
+    journal.close()
+    assert [r["name"] for r in results.installed_repositories] == ["bwa"]
+    assert [r["name"] for r in results.errored_repositories] == ["samtools"]
+    assert sorted(InstallJournal(path).outcomes.values()) == ["error", "installed"]
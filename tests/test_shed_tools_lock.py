@@ -0,0 +1,48 @@
+from ephemeris import shed_tools_methods
+from ephemeris.shed_tools_lock import lock_repositories
+
+
+class FakeToolShedInstance:
+    def __init__(self):
+        self.repositories = self
+        self.requests = []
+
+    def get_ordered_installable_revisions(self, name, owner):
+        self.requests.append(name)
+        return {"bwa": ["051eba708f43", "4d82cf59895e"], "cdhit": ["28b7a43907f0"]}.get(name, [])
+
+
+def test_lock_repositories(monkeypatch):
+    ts = FakeToolShedInstance()
+    monkeypatch.setattr(shed_tools_methods, "get_tool_shed_instance", lambda url: ts)
+    tools = [
+        dict(name="bwa", owner="devteam", tool_panel_section_label="NGS mapping"),
+        dict(name="cdhit", owner="jjohnson", revisions=["34a799d173f7"], tool_shed_url="toolshed.g2.bx.psu.edu"),
+    ]
+    results = lock_repositories(tools, log=None)
+    assert ts.requests == ["bwa"]
+    assert results.lock["tools"] == [
+        dict(
+            name="bwa",
+            owner="devteam",
+            tool_panel_section_label="NGS mapping",
+            tool_shed_url="https://toolshed.g2.bx.psu.edu/",
+            revisions=["4d82cf59895e"],
+        ),
+        dict(
+            name="cdhit",
+            owner="jjohnson",
+            revisions=["34a799d173f7"],
+            tool_shed_url="https://toolshed.g2.bx.psu.edu/",
+        ),
+    ]
+
+    # Re-locking only resolves entries that changed
+    ts.requests.clear()
+    existing_lock = dict(zip(results.lock["input_hashes"], results.lock["tools"]))
+    tools.append(dict(name="unknown", owner="devteam"))
+    tools[1] = dict(tools[1], revisions=[])
+    results = lock_repositories(tools, existing_lock=existing_lock, log=None)
+    assert sorted(ts.requests) == ["cdhit", "unknown"]
+    assert [t["revisions"] for t in results.lock["tools"]] == [["4d82cf59895e"], ["28b7a43907f0"]]
+    assert results.errored_repositories == [dict(name="unknown", owner="devteam")]
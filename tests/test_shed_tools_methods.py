@@ -1,6 +1,21 @@
 #!/usr/bin/env python
+import threading
+import time
 
-from ephemeris.shed_tools_methods import flatten_repo_info
+from ephemeris import shed_tools_methods
+from ephemeris.shed_tools_methods import (
+    added_repositories,
+    complete_repo_information,
+    configure_tool_shed_limits,
+    flatten_repo_info,
+    flatten_repository_revisions,
+    get_repository_dependencies,
+    get_tool_shed_instance,
+    get_tool_shed_limiter,
+    PooledToolShedInstance,
+    RepositoryRevision,
+    ToolShedLimiter,
+)
 
 
 def test_flatten_repo_info():
@@ -29,3 +44,151 @@ def test_flatten_repo_info():
         ),
         dict(name="bowtie2", owner="devteam", tool_panel_section_label="NGS: Alignment"),
     ]
+
+
+def test_get_tool_shed_instance_is_shared_per_tool_shed():
+    ts = get_tool_shed_instance("toolshed.g2.bx.psu.edu")
+    assert ts is get_tool_shed_instance("https://toolshed.g2.bx.psu.edu/")
+    assert ts is not get_tool_shed_instance("https://testtoolshed.g2.bx.psu.edu/")
+    assert ts.base_url == "https://toolshed.g2.bx.psu.edu"
+
+
+def test_get_repository_dependencies(monkeypatch):
+    class FakeToolShedInstance:
+        def __init__(self):
+            self.repositories = self
+
+        def get_repository_revision_install_info(self, name, owner, changeset_revision):
+            repository_dependencies = {
+                "root_key": "toolshed.g2.bx.psu.edu,suite_x,iuc,1,False,False",
+                "description": "Suite",
+                "toolshed.g2.bx.psu.edu,suite_x,iuc,1,False,False": [
+                    ["toolshed.g2.bx.psu.edu", "package_a", "iuc", "2", "False", "False"],
+                    ["toolshed.g2.bx.psu.edu", "package_b", "iuc", "3", "False", "True"],
+                ],
+                "toolshed.g2.bx.psu.edu,package_a,iuc,2,False,False": [
+                    ["toolshed.g2.bx.psu.edu", "package_c", "iuc", "4", "False", "False"],
+                ],
+            }
+            return [{}, {}, {"suite_x": ["", "", "1", "1", "iuc", repository_dependencies, {}]}]
+
+    monkeypatch.setattr(shed_tools_methods, "get_tool_shed_instance", lambda url: FakeToolShedInstance())
+    edges = get_repository_dependencies(
+        dict(name="suite_x", owner="iuc", tool_shed_url="https://toolshed.g2.bx.psu.edu/", changeset_revision="1")
+    )
+    assert [(dependent["name"], dependency["name"]) for dependent, dependency in edges] == [
+        ("suite_x", "package_a"),
+        ("package_a", "package_c"),
+    ]
+    assert edges[0][1] == dict(
+        name="package_a", owner="iuc", tool_shed_url="https://toolshed.g2.bx.psu.edu/", changeset_revision="2"
+    )
+
+
+def test_flatten_repository_revisions():
+    repositories = [
+        dict(name="bwa", owner="devteam", tool_panel_section_label="NGS: Alignment", revisions=["1", "2"]),
+        dict(name="bowtie2", owner="devteam", install_resolver_dependencies=True),
+    ]
+    records = flatten_repository_revisions(repositories)
+    assert [record.to_dict() for record in records] == flatten_repo_info(repositories)
+    assert records[0].owner is records[2].owner
+    assert RepositoryRevision.from_dict(records[2].to_dict()) == records[2]
+
+
+def test_complete_repo_information():
+    defaults = dict(
+        default_toolshed_url="toolshed.g2.bx.psu.edu",
+        default_install_tool_dependencies=False,
+        default_install_repository_dependencies=True,
+        default_install_resolver_dependencies=True,
+        force_latest_revision=False,
+    )
+    assert complete_repo_information(dict(name="bwa", owner="devteam", changeset_revision="1"), **defaults) == dict(
+        name="bwa",
+        owner="devteam",
+        tool_shed_url="https://toolshed.g2.bx.psu.edu/",
+        changeset_revision="1",
+        install_repository_dependencies=True,
+        install_resolver_dependencies=True,
+        install_tool_dependencies=False,
+        tool_panel_section_id=None,
+    )
+    repository = complete_repo_information(
+        dict(name="bwa", owner="devteam", changeset_revision="1", tool_panel_section_label="NGS: Alignment"),
+        **defaults,
+    )
+    assert repository["tool_panel_section_label"] == "NGS: Alignment"
+    assert "tool_panel_section_id" not in repository
+
+
+def test_added_repositories():
+    previous = [
+        dict(name="bwa", owner="devteam", revisions=["051eba708f43"]),
+        dict(name="fastqc", owner="devteam"),
+    ]
+    current = [
+        dict(name="bwa", owner="devteam", revisions=["051eba708f43", "4d82cf59895e"]),
+        dict(name="fastqc", owner="devteam", tool_shed_url="https://toolshed.g2.bx.psu.edu"),
+        dict(name="bwa", owner="devteam", tool_shed_url="testtoolshed.g2.bx.psu.edu", revisions=["051eba708f43"]),
+        dict(name="multiqc", owner="iuc"),
+    ]
+    added = added_repositories(current, previous)
+    assert [(r["name"], r.get("tool_shed_url"), r.get("changeset_revision")) for r in added] == [
+        ("bwa", None, "4d82cf59895e"),
+        ("bwa", "testtoolshed.g2.bx.psu.edu", "051eba708f43"),
+        ("multiqc", None, None),
+    ]
+
+
+def test_tool_shed_limiter_rate():
+    limiter = ToolShedLimiter(requests_per_second=50, burst=2)
+    start = time.monotonic()
+    for _ in range(7):
+        with limiter.request():
+            pass
+    # Two requests are sent right away, the other five at the configured rate
+    assert time.monotonic() - start >= 0.09
+
+
+def test_tool_shed_limiter_concurrency():
+    limiter = ToolShedLimiter(max_concurrency=2)
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def request():
+        with limiter.request():
+            with lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(max_running) == 2
+
+
+def test_configure_tool_shed_limits():
+    configure_tool_shed_limits({"https://limited.example.org": {"requests_per_second": 5, "max_concurrency": 3}})
+    limiter = get_tool_shed_limiter("limited.example.org/")
+    assert (limiter.requests_per_second, limiter.burst, limiter.max_concurrency) == (5, 5, 3)
+    assert get_tool_shed_limiter("https://unlimited.example.org").requests_per_second is None
+
+
+def test_tool_shed_requests_are_retried():
+    class FakeResponse:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.headers = {"Retry-After": "0"}
+
+    responses = [FakeResponse(429), FakeResponse(503), FakeResponse(200)]
+    ts = PooledToolShedInstance(url="https://retry.example.org")
+    ts.session.get = lambda url, **kwargs: responses.pop(0)
+    assert ts.make_get_request("https://retry.example.org/api/repositories").status_code == 200
+    assert not responses
@@ -0,0 +1,65 @@
+from ephemeris.shed_tools import (
+    InstalledRepositories,
+    InstallRepositoryManager,
+)
+from ephemeris.shed_tools_history import InstallHistory
+from ephemeris.shed_tools_plan import (
+    estimate_duration,
+    read_plan,
+    write_plan,
+)
+from .test_shed_tools_state import FakeGalaxyInstance
+
+TOOL_SHED_URL = "https://toolshed.g2.bx.psu.edu/"
+
+
+def test_estimate_duration():
+    assert estimate_duration([], 4) == 0
+    assert estimate_duration([10, 20, 30], 1) == 60
+    # Longest first: 30 | 20 + 10
+    assert estimate_duration([10, 20, 30], 2) == 30
+    assert estimate_duration([5, 5, 5, 5], 8) == 5
+
+
+def test_plan_repositories(tmp_path):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories(
+        [dict(name="bwa", owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"])]
+    )
+    history = InstallHistory(str(tmp_path / "history.sqlite"))
+    history.record(dict(name="bowtie2", owner="devteam", tool_shed_url=TOOL_SHED_URL, changeset_revision="1"), 60)
+    history.record(dict(name="samtools", owner="devteam", tool_shed_url=TOOL_SHED_URL, changeset_revision="1"), 20)
+
+    plan = manager.plan_repositories(
+        [
+            dict(name=name, owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"])
+            for name in ("bwa", "bowtie2", "samtools", "fastqc")
+        ],
+        log=None,
+        install_workers=2,
+        install_history=history,
+        journal=None,
+    )
+    assert [r["name"] for r in plan.repositories] == ["bowtie2", "samtools", "fastqc"]
+    assert [r["name"] for r in plan.skipped_repositories] == ["bwa"]
+    assert plan.galaxy_url == "http://localhost:8080"
+    assert plan.api_calls == {"galaxy": 3, "tool_shed": 0, "total": 3}
+    # fastqc has no history and is expected to take the average of 40 seconds: 60 | 40 + 20
+    assert plan.estimated_seconds == 60
+
+    plan_json = str(tmp_path / "plan.json")
+    write_plan(plan, plan_json)
+    assert read_plan(plan_json) == plan
+
+
+def test_plan_without_install_history(tmp_path):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories([])
+    plan = manager.plan_repositories(
+        [dict(name="bowtie2", owner="devteam", tool_shed_url=TOOL_SHED_URL, revisions=["1"])],
+        log=None,
+        install_history=InstallHistory(str(tmp_path / "history.sqlite")),
+    )
+    assert [r["name"] for r in plan.repositories] == ["bowtie2"]
+    # The duration is unknown, not zero
+    assert plan.estimated_seconds is None
@@ -0,0 +1,57 @@
+import os
+
+from ephemeris.shed_tools import InstallResults
+from ephemeris.shed_tools_reconcile import ToolListReconciler
+
+
+class FakeInstallRepositoryManager:
+    def __init__(self):
+        self.refreshes = 0
+        self.installs = []
+        self.errored = []
+
+    def installed_snapshot(self, refresh=False):
+        self.refreshes += refresh
+
+    def install_repositories(self, repositories, log=None, **kwargs):
+        self.installs.append([(r["name"], r.get("install_resolver_dependencies")) for r in repositories])
+        errored = [r for r in repositories if r["name"] in self.errored]
+        return InstallResults(installed_repositories=[], skipped_repositories=[], errored_repositories=errored)
+
+
+def write_tool_list(path, names, mtime):
+    with open(path, "w") as f:
+        f.write("install_resolver_dependencies: true\ntools:\n")
+        for name in names:
+            f.write(f"- name: {name}\n  owner: devteam\n")
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_reconcile_changed_tool_lists(tmp_path):
+    write_tool_list(tmp_path / "a.yml", ["bwa"], 1)
+    write_tool_list(tmp_path / "b.yaml", ["fastqc"], 1)
+    (tmp_path / "README").write_text("not a tool list")
+    manager = FakeInstallRepositoryManager()
+    reconciler = ToolListReconciler(manager, str(tmp_path), log=None)
+
+    # The first tick fetches the installed repositories and reconciles all tool lists
+    reconciler.tick()
+    assert manager.refreshes == 1
+    assert manager.installs == [[("bwa", True), ("fastqc", True)]]
+
+    assert reconciler.tick() is None
+
+    # Only the changed tool list is reconciled, errored repositories are retried on the next tick
+    write_tool_list(tmp_path / "b.yaml", ["fastqc", "multiqc"], 2)
+    manager.errored = ["multiqc"]
+    reconciler.tick()
+    manager.errored = []
+    reconciler.tick()
+    assert manager.installs[1:] == [[("fastqc", True), ("multiqc", True)], [("multiqc", True)]]
+    assert manager.refreshes == 1
+
+    # After the refresh interval all tool lists are reconciled again
+    reconciler.refresh_interval = 0
+    reconciler.tick()
+    assert manager.refreshes == 2
+    assert manager.installs[-1] == [("bwa", True), ("fastqc", True), ("multiqc", True)]
@@ -0,0 +1,350 @@
+import datetime as dt
+import random
+import threading
+
+import requests
+
+from ephemeris import shed_tools
+from ephemeris.shed_tools import (
+    AdaptiveConcurrency,
+    InstalledRepositories,
+    InstallRepositoryManager,
+    RepositoryStatusPoller,
+)
+from ephemeris.shed_tools_methods import (
+    configure_tool_shed_limits,
+    get_tool_shed_instance,
+)
+
+
+def test_install_scheduled_respects_dependencies():
+    started = []
+
+    def install_repository(repository, counter, eta):
+        started.append(repository["name"])
+        return "installed"
+
+    repositories = [dict(name=name) for name in ["a", "b", "c", "d", "e"]]
+    # a needs c, c needs d, d and e depend on each other
+    dependencies = {0: {2}, 2: {3}, 3: {4}, 4: {3}}
+    results = InstallRepositoryManager._install_scheduled(
+        repositories, install_repository, dependencies=dependencies, install_workers=1
+    )
+    assert results == ["installed"] * 5
+    assert started == ["b", "d", "c", "a", "e"]
+
+
+def test_install_scheduled_longest_first():
+    started = []
+
+    def install_repository(repository, counter, eta):
+        started.append((repository["name"], eta))
+        return "installed"
+
+    repositories = [dict(name=name) for name in ["a", "b", "c"]]
+    InstallRepositoryManager._install_scheduled(
+        repositories,
+        install_repository,
+        dependencies={},
+        install_workers=1,
+        expected_durations=[10.0, 30.0, 20.0],
+    )
+    assert started == [
+        ("b", dt.timedelta(seconds=60)),
+        ("c", dt.timedelta(seconds=30)),
+        ("a", dt.timedelta(seconds=10)),
+    ]
+
+
+def test_adaptive_concurrency():
+    concurrency = AdaptiveConcurrency(maximum=4, log=None)
+    assert concurrency.limit == 1
+    for _ in range(10):
+        concurrency.record_success(1.0)
+    assert concurrency.limit == 4
+    concurrency.record_overload("504 Gateway Time-out")
+    assert concurrency.limit == 2
+    # Further errors of installs that were already running do not decrease the limit again
+    concurrency.record_overload("Connection aborted")
+    assert concurrency.limit == 2
+    concurrency.record_overload("Connection aborted")
+    concurrency.record_overload("Connection aborted")
+    assert concurrency.limit == 1
+    # Installs taking three times longer than expected are a sign of overload as well
+    concurrency = AdaptiveConcurrency(maximum=4, smoothing=1, log=None)
+    for _ in range(10):
+        concurrency.record_success(1.0, expected_seconds=1.0)
+    concurrency.record_success(4.0, expected_seconds=1.0)
+    assert concurrency.limit == 2
+    # Unless they were expected to take longer
+    concurrency = AdaptiveConcurrency(maximum=4, smoothing=1, log=None)
+    for _ in range(10):
+        concurrency.record_success(1.0, expected_seconds=1.0)
+    concurrency.record_success(40.0, expected_seconds=40.0)
+    assert concurrency.limit == 4
+
+
+def test_adaptive_concurrency_varied_install_durations():
+    rng = random.Random(42)
+    # Without expected durations, the install times of differently sized repositories are no sign of overload
+    concurrency = AdaptiveConcurrency(maximum=8, log=None)
+    limits = []
+    for _ in range(500):
+        concurrency.record_success(rng.lognormvariate(3, 1.5))
+        limits.append(concurrency.limit)
+    assert min(limits[100:]) == 8
+    # With expected durations, healthy variation around them keeps the limit near its maximum
+    concurrency = AdaptiveConcurrency(maximum=8, log=None)
+    limits = []
+    for _ in range(500):
+        expected = rng.lognormvariate(3, 1.5)
+        concurrency.record_success(expected * rng.lognormvariate(0, 0.4), expected_seconds=expected)
+        limits.append(concurrency.limit)
+    assert sum(limits[100:]) / len(limits[100:]) > 7
+    # A fast outlier does not pin the baseline
+    concurrency = AdaptiveConcurrency(maximum=8, smoothing=1, log=None)
+    concurrency.record_success(0.1, expected_seconds=1.0)
+    for _ in range(100):
+        concurrency.record_success(1.0, expected_seconds=1.0)
+    assert concurrency.limit == 8
+
+
+def test_install_scheduled_adaptive_concurrency():
+    concurrency = AdaptiveConcurrency(maximum=4, log=None)
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def install_repository(repository, counter, eta):
+        with lock:
+            running.append(repository)
+            max_running.append((len(running), concurrency.limit))
+        concurrency.record_success(0.01)
+        with lock:
+            running.remove(repository)
+        return "installed"
+
+    repositories = [dict(name=str(i)) for i in range(20)]
+    results = InstallRepositoryManager._install_scheduled(
+        repositories, install_repository, dependencies={}, install_workers=4, concurrency=concurrency
+    )
+    assert results == ["installed"] * 20
+    assert max_running[0][0] == 1
+    assert concurrency.limit == 4
+
+
+def test_installed_repositories_snapshot():
+    installed = InstalledRepositories(
+        [
+            dict(
+                name="bwa",
+                owner="devteam",
+                tool_shed_url="toolshed.g2.bx.psu.edu",
+                revisions=["051eba708f43"],
+                tool_panel_section_label="NGS mapping",
+            )
+        ]
+    )
+    bwa = dict(name="bwa", owner="devteam", tool_shed_url="https://toolshed.g2.bx.psu.edu/")
+    assert installed.is_installed(dict(bwa, changeset_revision="051eba708f43"))
+    assert not installed.is_installed(dict(bwa, changeset_revision="4d82cf59895e"))
+    assert installed.is_installed(dict(bwa, changeset_revision="4d82cf59895e"), check_revision=False)
+    assert installed.is_installed(dict(name="bwa", owner="devteam"), check_revision=False)
+    assert not installed.is_installed(dict(bwa, tool_shed_url="https://testtoolshed.g2.bx.psu.edu/"))
+
+    installed.add(dict(bwa, changeset_revision="4d82cf59895e"))
+    assert installed.is_installed(dict(bwa, changeset_revision="4d82cf59895e"))
+    assert installed.repositories[-1]["revisions"] == ["4d82cf59895e"]
+
+
+def test_installed_snapshot_updated_as_installs_finish(monkeypatch):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager._installed_snapshot = InstalledRepositories([])
+    bwa = dict(name="bwa", owner="devteam", tool_shed_url="https://toolshed.g2.bx.psu.edu/", changeset_revision="1")
+    results = {"bwa": "installed", "bowtie2": "error"}
+    monkeypatch.setattr(
+        manager, "install_repository_revision", lambda repository, log, **kwargs: results[repository["name"]]
+    )
+    for repository in (bwa, dict(bwa, name="bowtie2")):
+        manager._install_repository(
+            repository, counter=1, total_num_repositories=2, installation_start=dt.datetime.now(), log=None
+        )
+    assert manager.installed_snapshot().is_installed(bwa)
+    assert not manager.installed_snapshot().is_installed(dict(bwa, name="bowtie2"))
+
+
+def test_dependency_graph_without_filtering_installed(monkeypatch):
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    suite = dict(
+        name="suite_x",
+        owner="iuc",
+        tool_shed_url="https://toolshed.g2.bx.psu.edu/",
+        changeset_revision="1",
+        install_repository_dependencies=True,
+    )
+    package = dict(name="package_a", owner="iuc", tool_shed_url=suite["tool_shed_url"], changeset_revision="2")
+    monkeypatch.setattr(shed_tools, "get_repository_dependencies", lambda repository: [(repository, package)])
+
+    def installed_snapshot(refresh=False):
+        raise AssertionError("The installed repositories should not be fetched")
+
+    monkeypatch.setattr(manager, "installed_snapshot", installed_snapshot)
+    nodes, dependencies = manager.repository_dependency_graph([suite], log=None, filter_installed=False)
+    assert [node["name"] for node in nodes] == ["suite_x", "package_a"]
+    assert dependencies == {0: {1}}
+
+    # A snapshot that was fetched anyway is used
+    manager._installed_snapshot = InstalledRepositories([dict(package, revisions=["2"])])
+    nodes, dependencies = manager.repository_dependency_graph([suite], log=None, filter_installed=False)
+    assert [node["name"] for node in nodes] == ["suite_x"]
+    assert dependencies == {}
+
+
+class FakeToolShedClient:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = 0
+
+    def get_repositories(self):
+        self.calls += 1
+        # Every repository advances one state per poll, and then stays in its last state
+        return [
+            {"id": repository_id, "status": states.pop(0) if len(states) > 1 else states[0]}
+            for repository_id, states in self.statuses.items()
+        ]
+
+
+def test_poller_tracks_all_installs_with_one_request_per_tick():
+    client = FakeToolShedClient(
+        {
+            "a": ["Cloning", "Installed"],
+            "b": ["Installing tool dependencies", "Installing tool dependencies", "Error"],
+        }
+    )
+    poller = RepositoryStatusPoller(client, min_interval=0.01, max_interval=0.02, log=None)
+    results = {}
+
+    def wait(repository_id):
+        results[repository_id] = poller.wait(repository_id, timeout=5)
+
+    threads = [threading.Thread(target=wait, args=(repository_id,)) for repository_id in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {"a": "Installed", "b": "Error"}
+    assert client.calls <= 4
+
+
+class FlakyToolShedClient(FakeToolShedClient):
+    def get_repositories(self):
+        if self.calls == 0:
+            self.calls += 1
+            raise requests.exceptions.ConnectionError("Connection aborted")
+        return super().get_repositories()
+
+
+def test_poller_survives_failed_requests():
+    client = FlakyToolShedClient({"a": ["Cloning", "Installed"], "b": ["Cloning", "Installed"]})
+    poller = RepositoryStatusPoller(client, min_interval=0.01, max_interval=0.02, log=None)
+    assert poller.wait("a", timeout=5) == "Installed"
+    assert poller.wait("b", timeout=5) == "Installed"
+    assert client.calls >= 2
+
+
+def test_poller_timeout():
+    client = FakeToolShedClient({"a": ["Cloning"] * 1000})
+    poller = RepositoryStatusPoller(client, min_interval=0.01, max_interval=0.02, log=None)
+    assert poller.wait("a", timeout=0.1) is None
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+class FakeGalaxyInstance:
+    base_url = "http://localhost:8080"
+    url = "http://localhost:8080/api"
+
+    def __init__(self):
+        self.requests = []
+
+    def make_get_request(self, url):
+        self.requests.append(url)
+        return FakeResponse()
+
+
+class FakeInstalledToolShedClient:
+    def get_repositories(self):
+        def repository(name, revision, latest, upgrade="False", status="Installed", deleted=False):
+            return dict(
+                name=name,
+                owner="devteam",
+                tool_shed="toolshed.g2.bx.psu.edu",
+                changeset_revision=revision,
+                status=status,
+                deleted=deleted,
+                tool_shed_status={"latest_installable_revision": latest, "revision_upgrade": upgrade},
+            )
+
+        return [
+            repository("bwa", "1", "True"),
+            repository("bowtie2", "1", "False", "True"),
+            # Older revision next to the latest one
+            repository("samtools", "1", "False", "True"),
+            repository("samtools", "2", "True"),
+            repository("fastqc", "1", "False", "True", deleted=True),
+            repository("cutadapt", "1", "False", "True", status="Error"),
+        ]
+
+
+def test_repositories_with_updates():
+    gi = FakeGalaxyInstance()
+    manager = InstallRepositoryManager(gi)
+    manager.tool_shed_client = FakeInstalledToolShedClient()
+    assert manager.repositories_with_updates() == {("toolshed.g2.bx.psu.edu", "devteam", "bowtie2")}
+    assert gi.requests == ["http://localhost:8080/api/tool_shed_repositories/check_for_updates"]
+
+
+def test_install_does_not_hold_tool_shed_concurrency_slot():
+    tool_shed_url = "https://busy.example.org"
+    configure_tool_shed_limits({tool_shed_url: {"max_concurrency": 1}})
+    installing = threading.Event()
+    resolved = threading.Event()
+
+    class SlowToolShedClient:
+        def install_repository_revision(self, **kwargs):
+            installing.set()
+            # Galaxy keeps installing until the revisions of another repository were resolved
+            assert resolved.wait(5)
+            return []
+
+    class FakeRevisionsResponse:
+        status_code = 200
+        content = b'["4d82cf59895e"]'
+
+        def json(self):
+            return ["4d82cf59895e"]
+
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    manager.tool_shed_client = SlowToolShedClient()
+    repository = dict(
+        name="bwa",
+        owner="devteam",
+        tool_shed_url=tool_shed_url,
+        changeset_revision="1",
+        install_tool_dependencies=False,
+        install_repository_dependencies=False,
+        install_resolver_dependencies=False,
+    )
+    results = []
+    install = threading.Thread(target=lambda: results.append(manager.install_repository_revision(repository, log=None)))
+    install.start()
+    assert installing.wait(5)
+    ts = get_tool_shed_instance(tool_shed_url)
+    ts.session.get = lambda url, **kwargs: FakeRevisionsResponse()
+    assert ts.repositories.get_ordered_installable_revisions("bowtie2", "devteam") == ["4d82cf59895e"]
+    resolved.set()
+    install.join()
+    assert results == ["installed"]
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ephemeris import (
+    shed_tools,
+    shed_tools_targets,
+)
+from ephemeris.shed_tools import (
+    install_on_targets,
+    InstallResults,
+    main,
+    ToolInstallationException,
+)
+from ephemeris.shed_tools_methods import get_changeset_revisions
+from ephemeris.shed_tools_targets import (
+    InstallTarget,
+    read_targets,
+    RevisionCache,
+)
+
+
+def test_read_targets(tmp_path, monkeypatch):
+    monkeypatch.setenv("EPHEMERIS_API_KEY", "default_key")
+    targets_file = tmp_path / "targets.yml"
+    targets_file.write_text(
+        "targets:\n"
+        "- galaxy_instance: https://eu.example.org\n"
+        "  api_key: eu_key\n"
+        "  install_workers: 4\n"
+        "- galaxy_instance: https://staging.example.org\n"
+    )
+    targets = read_targets(str(targets_file))
+    assert [tuple(target) for target in targets] == [
+        ("https://eu.example.org", "eu_key", 4),
+        ("https://staging.example.org", "default_key", None),
+    ]
+
+
+def test_revision_cache_resolves_each_repository_once(monkeypatch):
+    calls = []
+    calls_lock = threading.Lock()
+
+    class FakeToolShedInstance:
+        def __init__(self):
+            self.repositories = self
+
+        def get_ordered_installable_revisions(self, name, owner):
+            with calls_lock:
+                calls.append(name)
+            return ["1", "2"]
+
+    monkeypatch.setattr(shed_tools_targets, "get_tool_shed_instance", lambda url: FakeToolShedInstance())
+    cache = RevisionCache()
+
+    def resolve(name):
+        repository = dict(name=name, owner="devteam", tool_shed_url="https://toolshed.g2.bx.psu.edu/")
+        return get_changeset_revisions(repository, force_latest_revision=True, catalog=cache)["changeset_revision"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        revisions = list(executor.map(resolve, ["bwa", "fastqc"] * 8))
+    assert revisions == ["2"] * 16
+    assert sorted(calls) == ["bwa", "fastqc"]
+
+
+@pytest.mark.parametrize("option", [["--journal", "journal.jsonl"], ["--plan-only"], ["--test"], ["--test-existing"]])
+def test_targets_reject_single_galaxy_options(tmp_path, monkeypatch, option):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "targets.yml").write_text("targets:\n  - galaxy_instance: https://galaxy.example.org\n")
+    with pytest.raises(ToolInstallationException):
+        main(["install", "--targets", "targets.yml", "--name", "bwa", "--owner", "devteam", *option])
+    assert not (tmp_path / "journal.jsonl").exists()
+
+
+def test_install_on_targets_connection(monkeypatch):
+    class FakeManager:
+        def __init__(self, gi):
+            self.gi = gi
+
+        def install_repositories(self, repositories, log, **kwargs):
+            return InstallResults(
+                installed_repositories=[self.gi.base_url], skipped_repositories=[], errored_repositories=[]
+            )
+
+    monkeypatch.setattr(shed_tools, "InstallRepositoryManager", FakeManager)
+    targets = [
+        InstallTarget(galaxy_url="galaxy.example.org", api_key="key", install_workers=None),
+        InstallTarget(galaxy_url="https://galaxy.example.com", api_key=None, install_workers=None),
+    ]
+    results = install_on_targets(targets, [], log=None)
+    # The URL is completed like for a single Galaxy, and connecting without API key fails
+    assert results["galaxy.example.org"].installed_repositories == ["https://galaxy.example.org"]
+    assert results["https://galaxy.example.com"].installed_repositories == []
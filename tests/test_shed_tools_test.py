@@ -0,0 +1,176 @@
+import datetime as dt
+import json
+import threading
+import time
+
+from ephemeris import (
+    get_tool_list_from_galaxy,
+    shed_tools,
+)
+from ephemeris.shed_tools import InstallRepositoryManager
+from ephemeris.shed_tools_test_shards import ReportedTestDurations
+from ephemeris.shed_tools_test_store import ToolTestStore
+from .test_shed_tools_state import FakeGalaxyInstance
+
+
+class FakeInteractor:
+    def __init__(self, num_tests, delays=None, test_delay=0):
+        self.num_tests = num_tests
+        self.delays = delays or {}
+        self.test_delay = test_delay
+        self.fetched = []
+        self.definition = {}
+        self.lock = threading.Lock()
+        self.fetching = 0
+        self.max_fetching = 0
+
+    def new_history(self, history_name=None):
+        return "history"
+
+    def get_tool_tests(self, tool_id, tool_version=None):
+        with self.lock:
+            self.fetched.append(tool_id)
+            self.fetching += 1
+            self.max_fetching = max(self.max_fetching, self.fetching)
+        time.sleep(self.delays.get(tool_id, 0.01))
+        with self.lock:
+            self.fetching -= 1
+        if tool_id == "broken":
+            raise Exception("No test definitions")
+        return [dict(self.definition, tool_version=tool_version)] * self.num_tests[tool_id]
+
+
+def run_tool_tests(monkeypatch, tmp_path, tools, interactor, **kwargs):
+    """Run ``test_tools`` for ``tools`` without a Galaxy, return the test report and the ids of the tests in run order."""
+    started = []
+
+    def verify_tool(tool_id, galaxy_interactor, test_index, tool_version, register_job_data, **kwds):
+        started.append(f"{tool_id}/{tool_version}-{test_index}")
+        assert kwds.get("_tool_test_dicts") or galaxy_interactor.get_tool_tests(tool_id, tool_version=tool_version)
+        time.sleep(galaxy_interactor.test_delay)
+        if tool_id == "failing":
+            register_job_data({"status": "failure"})
+            raise Exception("Test failed")
+        register_job_data({"status": "success"})
+
+    tools = [
+        dict(
+            tool,
+            model_class="Tool",
+            tool_shed_repository=dict(
+                tool_shed="toolshed.g2.bx.psu.edu", owner="devteam", name="bwa", changeset_revision="1"
+            ),
+        )
+        for tool in tools
+    ]
+    monkeypatch.setattr(get_tool_list_from_galaxy, "get_tools", lambda gi: tools)
+    monkeypatch.setattr(shed_tools, "verify_tool", verify_tool)
+    manager = InstallRepositoryManager(FakeGalaxyInstance())
+    monkeypatch.setattr(manager, "_get_interactor", lambda test_user, test_user_api_key: interactor)
+    test_json = str(tmp_path / "tool_test_output.json")
+    manager.test_tools(
+        test_json,
+        repositories=[dict(name="bwa", owner="devteam", changeset_revision="1")],
+        log=None,
+        **kwargs,
+    )
+    with open(test_json) as f:
+        return json.load(f), started
+
+
+def test_tool_test_definitions_fetched_concurrently(monkeypatch, tmp_path):
+    tools = [{"id": tool_id, "version": "1.0"} for tool_id in ("slow", "fast", "broken")]
+    interactor = FakeInteractor({"slow": 2, "fast": 1}, delays={"slow": 0.2})
+    report, started = run_tool_tests(monkeypatch, tmp_path, tools, interactor, parallel_tests=1)
+    assert interactor.max_fetching == 3
+    # The tests reuse the fetched definitions
+    assert sorted(interactor.fetched) == ["broken", "fast", "slow"]
+    # The tests of the fast tool do not wait for the definitions of the slow tool
+    assert started == ["fast/1.0-0", "slow/1.0-0", "slow/1.0-1"]
+    assert report["results"] == {"total": 4, "errors": 1, "failures": 0, "skips": 0}
+
+
+def test_skip_passed_tests(monkeypatch, tmp_path):
+    tools = [{"id": tool_id, "version": "1.0"} for tool_id in ("bwa_mem", "failing")]
+    test_store = ToolTestStore(str(tmp_path / "tests.sqlite"))
+    interactor = FakeInteractor({"bwa_mem": 2, "failing": 1})
+    kwargs = dict(test_store=test_store, skip_passed_window=dt.timedelta(days=1))
+    report, started = run_tool_tests(monkeypatch, tmp_path, tools, interactor, **kwargs)
+    assert sorted(started) == ["bwa_mem/1.0-0", "bwa_mem/1.0-1", "failing/1.0-0"]
+    assert report["results"] == {"total": 3, "errors": 1, "failures": 0, "skips": 0}
+
+    # Only the failed test runs again
+    report, started = run_tool_tests(monkeypatch, tmp_path, tools, interactor, **kwargs)
+    assert started == ["failing/1.0-0"]
+    assert report["results"] == {"total": 3, "errors": 1, "failures": 0, "skips": 2}
+    assert [(test["id"], test["data"]["status"]) for test in report["tests"]] == [
+        ("bwa_mem/1.0-0", "skip"),
+        ("bwa_mem/1.0-1", "skip"),
+        ("failing/1.0-0", "failure"),
+    ]
+
+    # Tests that passed outside of the window or whose definition changed run again
+    report, started = run_tool_tests(
+        monkeypatch, tmp_path, tools, interactor, test_store=test_store, skip_passed_window=dt.timedelta(0)
+    )
+    assert len(started) == 3
+    interactor.num_tests["bwa_mem"] = 3
+    interactor.definition = {"inputs": {"input": "changed.fastq"}}
+    report, started = run_tool_tests(monkeypatch, tmp_path, tools, interactor, **kwargs)
+    assert len(started) == 4
+
+
+def test_sharded_tests(monkeypatch, tmp_path):
+    tools = [{"id": tool_id, "version": "1.0"} for tool_id in ("bwa_mem", "bowtie2", "broken")]
+    interactor = FakeInteractor({"bwa_mem": 3, "bowtie2": 2})
+    previous_report = tmp_path / "previous.json"
+    previous_report.write_text(
+        json.dumps(
+            {
+                "tests": [
+                    {
+                        "id": f"{tool_id}/1.0-{index}",
+                        "data": {
+                            "tool_id": tool_id,
+                            "tool_version": "1.0",
+                            "test_index": index,
+                            "time_seconds": seconds,
+                        },
+                    }
+                    for tool_id, index, seconds in [
+                        ("bowtie2", 0, 100),
+                        ("bwa_mem", 0, 10),
+                        ("bwa_mem", 1, 10),
+                        ("bwa_mem", 2, 10),
+                    ]
+                ]
+            }
+        )
+    )
+    test_durations = ReportedTestDurations([str(previous_report)])
+    shard_started = []
+    errors = 0
+    for shard in (1, 2):
+        report, started = run_tool_tests(
+            monkeypatch, tmp_path, tools, interactor, test_durations=test_durations, shard=(shard, 2)
+        )
+        shard_started.append(sorted(started))
+        errors += report["results"]["errors"]
+    # The long bowtie2 test runs alone, the broken tool is reported by one shard
+    assert shard_started == [["bowtie2/1.0-0"], ["bowtie2/1.0-1", "bwa_mem/1.0-0", "bwa_mem/1.0-1", "bwa_mem/1.0-2"]]
+    assert errors == 1
+
+
+def test_longest_tests_first(monkeypatch, tmp_path):
+    tools = [{"id": tool_id, "version": "1.0"} for tool_id in ("bwa_mem", "bowtie2", "slow")]
+    # bowtie2 definitions arrive while the first bwa_mem test runs, the slow definitions after all others ran
+    interactor = FakeInteractor(
+        {"bwa_mem": 2, "bowtie2": 2, "slow": 1}, delays={"bowtie2": 0.05, "slow": 0.8}, test_delay=0.1
+    )
+    test_store = ToolTestStore(str(tmp_path / "tests.sqlite"))
+    for tool_id, index, seconds in [("bwa_mem", 0, 5), ("bwa_mem", 1, 50), ("bowtie2", 0, 20), ("slow", 0, 100)]:
+        test_store.record("http://localhost:8080", tool_id, "1.0", index, "", True, seconds)
+    report, started = run_tool_tests(monkeypatch, tmp_path, tools, interactor, parallel_tests=1, test_store=test_store)
+    # Tests start before all definitions arrived, the longest test queued so far first.
+    # bowtie2-1 has no recorded duration and is expected to take the average of 43.75 seconds
+    assert started == ["bwa_mem/1.0-1", "bowtie2/1.0-1", "bowtie2/1.0-0", "bwa_mem/1.0-0", "slow/1.0-0"]
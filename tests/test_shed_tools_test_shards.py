@@ -0,0 +1,49 @@
+import argparse
+import json
+
+import pytest
+
+from ephemeris.shed_tools_test_shards import (
+    assign_shards,
+    merge_test_reports,
+    parse_shard,
+)
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for shard in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(shard)
+
+
+def test_assign_shards():
+    test_ids = ["a-0", "b-0", "c-0", "d-0", "e-0"]
+    durations = [40.0, 10.0, 20.0, 10.0, 20.0]
+    assignment = assign_shards(test_ids, durations, 2)
+    assert assignment == [1, 1, 2, 2, 2]
+    # The order of the tests does not change the assignment
+    assert assign_shards(test_ids[::-1], durations[::-1], 2) == assignment[::-1]
+    assert assign_shards(test_ids, [1.0] * 5, 5) == [1, 2, 3, 4, 5]
+
+
+def test_merge_test_reports(tmp_path):
+    paths = []
+    for shard, test_ids in enumerate((["b-0", "a-0"], ["c-0"])):
+        path = tmp_path / f"shard{shard}.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "version": "0.1",
+                    "suitename": "Ephemeris tool tests",
+                    "results": {"total": len(test_ids), "errors": shard, "failures": 0, "skips": 1},
+                    "tests": [{"id": test_id, "has_data": True, "data": {}} for test_id in test_ids],
+                }
+            )
+        )
+        paths.append(str(path))
+    merge_test_reports(paths, str(tmp_path / "merged.json"))
+    merged = json.loads((tmp_path / "merged.json").read_text())
+    assert merged["results"] == {"total": 3, "errors": 1, "failures": 0, "skips": 2}
+    assert [test["id"] for test in merged["tests"]] == ["a-0", "b-0", "c-0"]
+    assert merged["suitename"] == "Ephemeris tool tests"
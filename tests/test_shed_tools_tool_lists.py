@@ -0,0 +1,56 @@
+from ephemeris.shed_tools_tool_lists import (
+    load_tool_lists,
+    tool_list_paths,
+)
+
+
+def test_load_tool_lists_merges_and_deduplicates(tmp_path):
+    (tmp_path / "mapping.yaml").write_text(
+        "galaxy_instance: https://galaxy.example.org\n"
+        "install_resolver_dependencies: true\n"
+        "tool_sheds:\n"
+        "  https://toolshed.g2.bx.psu.edu:\n"
+        "    max_concurrency: 2\n"
+        "tools:\n"
+        "- name: bwa\n"
+        "  owner: devteam\n"
+        "  tool_panel_section_label: Mapping\n"
+        "  revisions: [051eba708f43, 4d82cf59895e]\n"
+    )
+    (tmp_path / "qc.yml").write_text(
+        "tools:\n"
+        "- name: bwa\n"
+        "  owner: devteam\n"
+        "  tool_shed_url: toolshed.g2.bx.psu.edu\n"
+        "  tool_panel_section_label: Mapping\n"
+        "  revisions: [4d82cf59895e]\n"
+        "- name: fastqc\n"
+        "  owner: devteam\n"
+        "  tool_panel_section_label: QC\n"
+    )
+    (tmp_path / "notes.txt").write_text("not a tools file")
+    for path in (str(tmp_path), str(tmp_path / "*.y*ml")):
+        assert tool_list_paths(path) == [str(tmp_path / "mapping.yaml"), str(tmp_path / "qc.yml")]
+        tool_list = load_tool_lists(path, workers=2, log=None)
+        assert tool_list["galaxy_instance"] == "https://galaxy.example.org"
+        assert tool_list["tool_sheds"] == {"https://toolshed.g2.bx.psu.edu": {"max_concurrency": 2}}
+        assert [
+            (
+                r["name"],
+                r["changeset_revision"] if "changeset_revision" in r else None,
+                r.get("install_resolver_dependencies"),
+            )
+            for r in tool_list["tools"]
+        ] == [
+            ("bwa", "051eba708f43", True),
+            ("bwa", "4d82cf59895e", True),
+            ("fastqc", None, None),
+        ]
+
+
+def test_load_single_tool_list(tmp_path):
+    tool_list_file = tmp_path / "tool_list.yaml"
+    tool_list_file.write_text("tools:\n- name: bwa\n  owner: devteam\n  revisions: [051eba708f43]\n")
+    assert load_tool_lists(str(tool_list_file)) == {
+        "tools": [{"name": "bwa", "owner": "devteam", "revisions": ["051eba708f43"]}]
+    }
@@ -0,0 +1,56 @@
+from ephemeris import get_tool_list_from_galaxy
+from ephemeris.get_tool_list_from_galaxy import ToolIndex
+
+
+def tool(tool_id, name, revision, tool_shed="toolshed.g2.bx.psu.edu"):
+    return {
+        "model_class": "Tool",
+        "id": tool_id,
+        "tool_shed_repository": {
+            "tool_shed": tool_shed,
+            "owner": "devteam",
+            "name": name,
+            "changeset_revision": revision,
+        },
+    }
+
+
+TOOLS = [
+    tool("bwa_mem/1", "bwa", "1"),
+    tool("bwa_mem/2", "bwa", "2"),
+    tool("bwa_mem_test/1", "bwa", "1", tool_shed="testtoolshed.g2.bx.psu.edu"),
+    {"model_class": "Tool", "id": "cat1"},
+]
+PANEL = [
+    {"model_class": "ToolSection", "elems": [TOOLS[1]]},
+    TOOLS[3],
+]
+
+
+def test_tool_index(monkeypatch):
+    requests = []
+
+    def get_tools(gi):
+        requests.append("tools")
+        return TOOLS
+
+    def get_tool_panel(gi):
+        requests.append("panel")
+        return PANEL
+
+    monkeypatch.setattr(get_tool_list_from_galaxy, "get_tools", get_tools)
+    monkeypatch.setattr(get_tool_list_from_galaxy, "get_tool_panel", get_tool_panel)
+    index = ToolIndex(gi=None)
+    bwa = {"name": "bwa", "owner": "devteam", "tool_shed_url": "https://toolshed.g2.bx.psu.edu/"}
+
+    def ids(repository, **kwargs):
+        return [t["id"] for t in index.tools_for_repository(repository, **kwargs)]
+
+    assert ids(dict(bwa, changeset_revision="1")) == ["bwa_mem/1"]
+    assert ids(dict(bwa, changeset_revision="3")) == []
+    assert ids(bwa, all_tools=True) == ["bwa_mem/1", "bwa_mem/2"]
+    assert ids({"name": "bwa", "owner": "devteam"}, all_tools=True) == ["bwa_mem/1", "bwa_mem/2", "bwa_mem_test/1"]
+    assert ids({"name": "bwa", "owner": "devteam", "changeset_revision": "1"}) == ["bwa_mem/1", "bwa_mem_test/1"]
+    # Without a revision only the tools in the tool panel are returned
+    assert ids(bwa) == ["bwa_mem/2"]
+    assert requests == ["tools", "panel"]